@@ -1,11 +1,17 @@
+import os
+
 import numpy as np
 import tensorflow as tf
 import tflearn
+from tensorflow.python.tools import optimize_for_inference_lib
 
 DEFAULT_PADDING = "valid"
 DEFAULT_ACTIVATION = "relu"
 DEFAULT_STRIDES = [1, 1]
 DEFAULT_WEIGHT_DECAY = 0.0
+INPUT_PRICES_NAME = "input_prices"
+INPUT_PREV_OMEGA_NAME = "input_prev_omega"
+OUTPUT_PORTFOLIO_NAME = "portfolio"
 
 
 class CNNEnsemble:
@@ -15,10 +21,12 @@ class CNNEnsemble:
         self.config = config
 
         self.global_step = tf.Variable(0, trainable=False)
-        self.input_prices = tf.placeholder(tf.float32, shape=[None, 3, assets, window_size])
-        self.input_prev_omega = tf.placeholder(tf.float32, shape=[None, assets])
+        self.input_prices = tf.placeholder(tf.float32, shape=[None, 3, assets, window_size], name=INPUT_PRICES_NAME)
+        self.input_prev_omega = tf.placeholder(tf.float32, shape=[None, assets], name=INPUT_PREV_OMEGA_NAME)
         self.input_future_prices = tf.placeholder(tf.float32, shape=[None, assets])
-        self.out_nn = self._build_output_network()
+        self.input_num_batches = tf.placeholder_with_default(1, shape=[])
+        self.input_num_predictions = tf.placeholder_with_default(0, shape=[])
+        self.out_nn = tf.identity(self._build_output_network(), name=OUTPUT_PORTFOLIO_NAME)
         self.train_op = self._build_train_operation()
 
         self._saver = tf.train.Saver(tf.trainable_variables())
@@ -65,10 +73,11 @@ class CNNEnsemble:
         return nn
 
     def _build_train_operation(self):
-        future_prices = self._add_cash(self.input_future_prices)
-        mu = self._calc_commission(future_prices, self.out_nn)
-        portfolio_values = tf.reduce_sum(future_prices * self.out_nn, reduction_indices=[1]) * \
-                           tf.concat([tf.ones(1), mu], axis=0)
+        future_prices = self._split_batches(self._add_cash(self.input_future_prices))
+        omega = self._split_batches(self.out_nn[:tf.shape(self.out_nn)[0] - self.input_num_predictions])
+        mu = self._calc_commission(future_prices, omega)
+        portfolio_values = tf.reduce_sum(future_prices * omega, reduction_indices=[2]) * \
+                           tf.concat([tf.ones([self.input_num_batches, 1]), mu], axis=1)
         loss = -tf.reduce_mean(tf.log(portfolio_values))
         train_cnf = self.config["training"]
         lr = tf.train.exponential_decay(train_cnf["learning_rate"], self.global_step, train_cnf["decay_steps"],
@@ -76,20 +85,24 @@ class CNNEnsemble:
                                         staircase=True)
         return tf.train.AdadeltaOptimizer(lr).minimize(loss, global_step=self.global_step)
 
+    def _split_batches(self, tensor):
+        return tf.reshape(tensor, [self.input_num_batches, -1, tf.shape(tensor)[-1]])
+
     @staticmethod
     def _add_cash(relative_prices):
         return tf.concat([tf.ones([tf.shape(relative_prices)[0], 1]), relative_prices], axis=1)
 
     def _calc_commission(self, future_prices, omega):
         future_omega = self._calc_future_omega(future_prices, omega)
-        w_prime = future_omega[:-1]
-        w = omega[1:]
-        return 1 - tf.reduce_sum(tf.abs(w_prime[:, 1:] - w[:, 1:]), axis=1) * self.config["trading"]["commission"]
+        w_prime = future_omega[:, :-1]
+        w = omega[:, 1:]
+        commission = self.config["trading"]["commission"]
+        return 1 - tf.reduce_sum(tf.abs(w_prime[:, :, 1:] - w[:, :, 1:]), axis=2) * commission
 
     @staticmethod
     def _calc_future_omega(future_prices, omega):
         # w' = y * w / |y . w|
-        return (future_prices * omega) / (tf.reduce_sum(future_prices * omega, axis=1)[:, None])
+        return (future_prices * omega) / (tf.reduce_sum(future_prices * omega, axis=2)[:, :, None])
 
     def predict(self, prices, previous_omega):
         res = self.session.run(self.out_nn, feed_dict={self.input_prices: np.expand_dims(prices, axis=0),
@@ -103,8 +116,74 @@ class CNNEnsemble:
                                                                            self.input_future_prices: future_prices})
         return result[-1]
 
+    def train_and_predict(self, states, future_prices, latest):
+        prices, omegas = states
+        latest_prices, latest_omega = latest
+        result = self.session.run([self.train_op, self.out_nn],
+                                  feed_dict={self.input_prices: np.concatenate([prices, [latest_prices]]),
+                                             self.input_prev_omega: np.concatenate([omegas, [latest_omega]]),
+                                             self.input_future_prices: future_prices,
+                                             self.input_num_predictions: 1})
+        return result[-1][:-1], result[-1][-1]
+
+    def train_batches(self, states, future_prices):
+        prices, omegas = states
+        num_batches, size = np.shape(prices)[:2]
+        result = self.session.run([self.train_op, self.out_nn],
+                                  feed_dict={self.input_prices: np.reshape(prices, (-1,) + np.shape(prices)[2:]),
+                                             self.input_prev_omega: np.reshape(omegas, (num_batches * size, -1)),
+                                             self.input_future_prices: np.reshape(future_prices,
+                                                                                  (num_batches * size, -1)),
+                                             self.input_num_batches: num_batches})
+        return np.reshape(result[-1], (num_batches, size, -1))
+
     def save(self, path):
         self._saver.save(self.session, path)
 
     def restore(self, path):
         self._saver.restore(self.session, path)
+
+    def export_inference(self, path):
+        graph_def = tf.graph_util.convert_variables_to_constants(self.session, self.session.graph.as_graph_def(),
+                                                                 [OUTPUT_PORTFOLIO_NAME])
+        graph_def = optimize_for_inference_lib.optimize_for_inference(graph_def,
+                                                                      [INPUT_PRICES_NAME, INPUT_PREV_OMEGA_NAME],
+                                                                      [OUTPUT_PORTFOLIO_NAME],
+                                                                      [tf.float32.as_datatype_enum] * 2)
+        _write_graph_def(graph_def, path)
+
+
+class FrozenEnsemble:
+    """
+    Inference only counterpart of the CNNEnsemble. It serves predictions from a frozen graph exported by
+    CNNEnsemble.export_inference, without any optimizer, learning rate schedule or loss in the graph.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.graph_def = None
+        self.input_prices = None
+        self.input_prev_omega = None
+        self.out_nn = None
+
+    def predict(self, prices, previous_omega):
+        res = self.session.run(self.out_nn, feed_dict={self.input_prices: np.expand_dims(prices, axis=0),
+                                                       self.input_prev_omega: np.expand_dims(previous_omega, axis=0)})
+        return res[0]
+
+    def save(self, path):
+        _write_graph_def(self.graph_def, path)
+
+    def restore(self, path):
+        self.graph_def = tf.GraphDef()
+        with tf.gfile.GFile(path, "rb") as f:
+            self.graph_def.ParseFromString(f.read())
+        with self.session.graph.as_default():
+            self.input_prices, self.input_prev_omega, self.out_nn = tf.import_graph_def(
+                self.graph_def, return_elements=[INPUT_PRICES_NAME + ":0", INPUT_PREV_OMEGA_NAME + ":0",
+                                                 OUTPUT_PORTFOLIO_NAME + ":0"], name="frozen")
+
+
+def _write_graph_def(graph_def, path):
+    directory, name = os.path.split(path)
+    tf.train.write_graph(graph_def, directory, name, as_text=False)
@@ -3,29 +3,63 @@ import os
 
 class FpmAgent:
     model_file_name = "model.ckpt"
+    inference_file_name = "inference.pb"
     memory_file_name = "memory.npz"
+    memory_directory_name = "memory"
 
-    def __init__(self, ann, memory, random_gen, config, logger):
+    def __init__(self, ann, memory, random_gen, config, logger, learning=True):
         self._ann = ann
+        self._learning = learning
+        self._model_file = self.model_file_name if learning else self.inference_file_name
         self._memory = memory
         self._random_generator = random_gen
         self._previous_portfolio = config["setup"]["initial_portfolio"]
         self._batch_size = config["training"]["batch_size"]
+        self._batches_per_step = config["training"].get("batches_per_step", 1)
+        self._fused_step = config["training"].get("fused_step", False) and self._batches_per_step == 1
+        mapped = config["training"].get("persistence", "npz") == "mmap"
+        self._memory_file = self.memory_directory_name if mapped else self.memory_file_name
         self._logger = logger
 
     def step(self, prices):
         self._memory.record(prices, self._previous_portfolio)
+        if not self._learning:
+            return self._act()
+        if self._fused_step and self._memory.ready():
+            return self._train_and_act()
         self._train()
         return self._act()
 
+    def preload(self, prices_block):
+        self._memory.record_many(prices_block, [self._previous_portfolio] * len(prices_block))
+
+    def pretrain(self, steps):
+        for _ in range(steps):
+            self._train()
+
     def _train(self):
-        b = self._memory.get_random_batch(self._batch_size)
+        if self._batches_per_step > 1:
+            b = self._memory.get_random_batches(self._batches_per_step, self._batch_size)
+            train = self._ann.train_batches
+        else:
+            b = self._memory.get_random_batch(self._batch_size)
+            train = self._ann.train
         if b.empty:
             return
 
-        p = self._ann.train((b.prices, b.weights), b.future)
+        p = train((b.prices, b.weights), b.future)
+        b.predictions = p
+        self._memory.update(b)
+
+    def _train_and_act(self):
+        b = self._memory.get_random_batch(self._batch_size)
+        if b.empty:
+            return self._act()
+
+        p, action = self._ann.train_and_predict((b.prices, b.weights), b.future, self._memory.get_latest())
         b.predictions = p
         self._memory.update(b)
+        return self._next_action_from(action)
 
     def _act(self):
         if self._memory.ready():
@@ -37,17 +71,27 @@ class FpmAgent:
         self._previous_portfolio = action
         return self._previous_portfolio
 
+    def export(self, path):
+        if not self._learning:
+            return
+        model = os.path.join(path, self.inference_file_name)
+        self._logger.info("Exporting agent inference model to: {}".format(model))
+        self._ann.export_inference(model)
+
     def save(self, path):
-        model = os.path.join(path, self.model_file_name)
-        memory = os.path.join(path, self.memory_file_name)
+        model = os.path.join(path, self._model_file)
+        memory = os.path.join(path, self._memory_file)
         self._logger.info("Saving agent model to: {}".format(model))
         self._logger.info("Saving agent memory to: {}".format(memory))
         self._ann.save(model)
         self._memory.save(memory)
 
     def restore(self, path):
-        model = os.path.join(path, self.model_file_name)
-        memory = os.path.join(path, self.memory_file_name)
+        model = os.path.join(path, self._model_file)
+        memory = os.path.join(path, self._memory_file)
+        legacy = os.path.join(path, self.memory_file_name)
+        if not os.path.isdir(memory) and os.path.isfile(legacy):
+            memory = legacy
         self._logger.info("Restoring agent model from: {}".format(model))
         self._logger.info("Restoring agent memory from: {}".format(memory))
         self._ann.restore(model)
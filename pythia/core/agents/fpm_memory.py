@@ -1,6 +1,13 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+
+def _sliding_windows(a, window):
+    shape = (a.shape[0] - window + 1,) + a.shape[1:] + (window,)
+    return as_strided(a, shape, a.strides + (a.strides[0],), writeable=False)
 
 
 def _offset_index(index, offset):
@@ -18,6 +25,45 @@ def _modulo_index(index, modulo):
     return index % modulo
 
 
+class DirtyRows:
+    COMPACT_LIMIT = 1024
+
+    def __init__(self):
+        self._ranges = list()
+
+    def mark(self, start, stop):
+        if start >= stop:
+            return
+        if self._ranges and start <= self._ranges[-1][1] and self._ranges[-1][0] <= stop:
+            last_start, last_stop = self._ranges[-1]
+            self._ranges[-1] = (min(last_start, start), max(last_stop, stop))
+        else:
+            self._ranges.append((start, stop))
+        if len(self._ranges) > self.COMPACT_LIMIT:
+            self._ranges = self.ranges()
+
+    def mark_index(self, index):
+        if isinstance(index, slice):
+            self.mark(index.start, index.stop)
+        elif isinstance(index, list):
+            for i in index:
+                self.mark(i, i + 1)
+        else:
+            self.mark(index, index + 1)
+
+    def ranges(self):
+        merged = list()
+        for start, stop in sorted(self._ranges):
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+            else:
+                merged.append((start, stop))
+        return merged
+
+    def clear(self):
+        self._ranges = list()
+
+
 class Storage:
     class Proxy:
         def __init__(self, storage, index):
@@ -33,7 +79,7 @@ class Storage:
 
         @property
         def state(self):
-            return self._storage.state_matrix[self._state_index]
+            return self._storage.states(self._state_index)
 
         @property
         def portfolio(self):
@@ -42,6 +88,7 @@ class Storage:
         @portfolio.setter
         def portfolio(self, value):
             self._storage.symbs_matrix[self._symbs_index, :, 1] = value
+            self._storage.dirty['symbs'].mark_index(self._symbs_index)
 
         @property
         def future(self):
@@ -52,13 +99,21 @@ class Storage:
             yield self.portfolio
             yield self.future
 
-    def __init__(self, size, n_indicators, n_symbols, window_size):
+    ARCHIVE_EXTENSION = ".npz"
+
+    def __init__(self, size, n_indicators, n_symbols, window_size, dtype=np.float32):
         self.window = window_size
         self.capacity = size
+        self.dtype = np.dtype(dtype)
         self._num_assets = n_symbols
-        self._numpy_data = {"state": np.empty((self.capacity, n_indicators, self._num_assets, self.window)),
-                            "symbs": np.empty((self.capacity, self._num_assets, 2)),
-                            "progress": np.zeros((2,), dtype=int)}
+        self._numpy_data = self._make_numpy_data(n_indicators)
+        self.dirty = {key: DirtyRows() for key in self._numpy_data}
+        self._synced_directory = None
+
+    def _make_numpy_data(self, n_indicators):
+        return {"state": np.empty((self.capacity, n_indicators, self._num_assets, self.window), self.dtype),
+                "symbs": np.empty((self.capacity, self._num_assets, 2), self.dtype),
+                "progress": np.zeros((2,), dtype=int)}
 
     @property
     def state_matrix(self):
@@ -88,19 +143,94 @@ class Storage:
         index = self._size % self.capacity
         self._size += 1
         self.offset = self._size // self.capacity
-        p = np.array(prices).T
-        cur_w = min(self._size, self.window)
-        for w_idx in range(0, cur_w):
-            self.state_matrix[index - w_idx, :, :, w_idx] = p
+        p = np.array(prices, dtype=self.dtype).T
+        self._write_price(index, p)
+        self._mark_written(self._size - 1, self._size)
 
         self.symbs_matrix[index, :, 0] = p[0, :]
         self.symbs_matrix[index, :, 1] = portfolio
 
+        if self._size > 1:
+            self._calc_future_quotient(index)
+
+    def _write_price(self, index, p):
+        cur_w = min(self._size, self.window)
+        for w_idx in range(0, cur_w):
+            self.state_matrix[index - w_idx, :, :, w_idx] = p
+
         if self._size >= self.window:
             self._calc_window_quotient(index)
 
-        if self._size > 1:
-            self._calc_future_quotient(index)
+    def extend(self, prices_block, portfolios_block):
+        prices = np.transpose(np.asarray(prices_block, dtype=self.dtype), (0, 2, 1))
+        portfolios = np.asarray(portfolios_block, dtype=self.dtype)
+        chunk = min(self.capacity - self.window + 1, self.capacity - 1)
+        if chunk < 1:
+            for p, w in zip(prices_block, portfolios_block):
+                self.append(p, w)
+            return
+
+        for start in range(0, len(prices), chunk):
+            self._extend_chunk(prices[start:start + chunk], portfolios[start:start + chunk])
+
+    def _extend_chunk(self, prices, portfolios):
+        first = self._size
+        end = first + len(prices)
+        previous_close = self.symbs_matrix[(first - 1) % self.capacity, :, 0].copy() if first > 0 else None
+        self._size = end
+        self.offset = self._size // self.capacity
+
+        self._write_price_block(prices, first, end)
+        self._write_symbols(prices, portfolios, previous_close, first, end)
+        self._mark_written(first, end)
+
+    def _mark_written(self, first, end):
+        self._mark_prices_written(first, end)
+        for slots, _, _ in self._slot_ranges(max(first - 1, 0), end):
+            self.dirty['symbs'].mark(slots.start, slots.stop)
+
+    def _mark_prices_written(self, first, end):
+        for slots, _, _ in self._slot_ranges(max(first - self.window + 1, 0), end):
+            self.dirty['state'].mark(slots.start, slots.stop)
+
+    def _write_price_block(self, prices, first, end):
+        self._write_windows(prices, first, end)
+        self._normalize_windows(max(first - self.window + 1, 0), end - self.window + 1)
+
+    def _write_windows(self, prices, first, end):
+        full_end = max(end - self.window + 1, first)
+        if full_end > first:
+            windows = _sliding_windows(prices, self.window)
+            for slots, t0, t1 in self._slot_ranges(first, full_end):
+                self.state_matrix[slots] = windows[t0 - first:t1 - first]
+
+        for t in list(range(max(first - self.window + 1, 0), first)) + list(range(full_end, end)):
+            w0, w1 = max(first - t, 0), min(end - t, self.window)
+            self.state_matrix[t % self.capacity, :, :, w0:w1] = \
+                np.transpose(prices[t + w0 - first:t + w1 - first], (1, 2, 0))
+
+    def _normalize_windows(self, first, end):
+        for slots, _, _ in self._slot_ranges(first, end):
+            states = self.state_matrix[slots]
+            states /= states[:, 0:1, :, -1:].copy()
+
+    def _write_symbols(self, prices, portfolios, previous_close, first, end):
+        for slots, t0, t1 in self._slot_ranges(first, end):
+            self.symbs_matrix[slots, :, 0] = prices[t0 - first:t1 - first, 0, :]
+            self.symbs_matrix[slots, :, 1] = portfolios[t0 - first:t1 - first]
+
+        closes = prices[:, 0, :] if previous_close is None else np.concatenate([previous_close[None], prices[:, 0, :]])
+        futures = closes[1:] / closes[:-1]
+        future_first = max(first - 1, 0)
+        for slots, t0, t1 in self._slot_ranges(future_first, end - 1):
+            self.symbs_matrix[slots, :, 0] = futures[t0 - future_first:t1 - future_first]
+
+    def _slot_ranges(self, first, end):
+        while first < end:
+            slot = first % self.capacity
+            stop = min(end, first + self.capacity - slot)
+            yield slice(slot, slot + stop - first), first, stop
+            first = stop
 
     def _calc_window_quotient(self, index):
         last_w_idx = index - self.window + 1
@@ -113,6 +243,24 @@ class Storage:
     def _calc_future_quotient(self, index):
         self.symbs_matrix[index - 1, :, 0] = self.symbs_matrix[index, :, 0] / self.symbs_matrix[index - 1, :, 0]
 
+    def gather(self, indices):
+        indices = np.asarray(indices) + self.offset
+        symbs = self.symbs_matrix[(indices + self.window - 1) % self.capacity]
+        return self.states(indices % self.capacity), symbs[..., 1], symbs[..., 0]
+
+    def gather_portfolios(self, indices):
+        indices = np.asarray(indices) + self.offset + self.window - 1
+        return self.symbs_matrix[indices % self.capacity, :, 1]
+
+    def update_portfolios(self, first, portfolios):
+        first += self.offset + self.window - 1
+        for slots, t0, t1 in self._slot_ranges(first, first + len(portfolios)):
+            self.symbs_matrix[slots, :, 1] = portfolios[t0 - first:t1 - first]
+            self.dirty['symbs'].mark(slots.start, slots.stop)
+
+    def states(self, index):
+        return self.state_matrix[index]
+
     def __getitem__(self, key):
         return self.Proxy(self, key)
 
@@ -124,13 +272,67 @@ class Storage:
         return len(self) == 0
 
     def save(self, file):
-        np.savez_compressed(file, **self._numpy_data)
+        if file.endswith(self.ARCHIVE_EXTENSION):
+            np.savez_compressed(file, **self._numpy_data)
+        else:
+            self._save_mapped(file)
+
+    def _save_mapped(self, directory):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        incremental = self._synced_directory == directory
+        for key, data in self._numpy_data.items():
+            file = self._mapped_file(directory, key)
+            if incremental and key != 'progress' and os.path.exists(file):
+                self._write_dirty_rows(file, data, self.dirty[key])
+            else:
+                self._write_whole(file, data)
+            self.dirty[key].clear()
+        self._synced_directory = directory
+
+    @staticmethod
+    def _mapped_file(directory, key):
+        return os.path.join(directory, "{}.npy".format(key))
+
+    @staticmethod
+    def _write_dirty_rows(file, data, dirty):
+        target = np.load(file, mmap_mode='r+')
+        for start, stop in dirty.ranges():
+            target[start:stop] = data[start:stop]
+        target.flush()
+        del target
+
+    @staticmethod
+    def _write_whole(file, data):
+        tmp_file = file + ".tmp"
+        with open(tmp_file, 'wb') as f:
+            np.save(f, data)
+        os.replace(tmp_file, file)
 
     def restore(self, file):
-        loaded = np.load(file)
-        for key in self._numpy_data:
-            self._numpy_data[key] = loaded[key]
+        if file.endswith(self.ARCHIVE_EXTENSION):
+            loaded = np.load(file)
+            for key in self._numpy_data:
+                self._numpy_data[key] = loaded[key]
+            self._synced_directory = None
+        else:
+            self._restore_mapped(file)
         self._validate_restoration()
+        self._convert_restoration()
+        for dirty in self.dirty.values():
+            dirty.clear()
+
+    def _restore_mapped(self, directory):
+        for key in self._numpy_data:
+            mode = None if key == 'progress' else 'c'
+            self._numpy_data[key] = np.load(self._mapped_file(directory, key), mmap_mode=mode)
+        self._synced_directory = directory
+
+    def _convert_restoration(self):
+        for key in self._numpy_data:
+            if key != 'progress' and self._numpy_data[key].dtype != self.dtype:
+                self._numpy_data[key] = self._numpy_data[key].astype(self.dtype)
+                self._synced_directory = None
 
     def _validate_restoration(self):
         if self.state_matrix.shape[0] != self.capacity:
@@ -145,6 +347,62 @@ class Storage:
                     self.window, self.state_matrix.shape[-1]))
 
 
+class RingStorage(Storage):
+    """
+    Keeps only the raw price of every period in a ring instead of one materialized window per period. The last
+    window - 1 ring slots are mirrored behind the ring, so every window is a contiguous slice of the ring and states
+    are produced on demand from a sliding window view normalized by its last closing price.
+    """
+
+    def _make_numpy_data(self, n_indicators):
+        return {"prices": np.empty((self.capacity + self.window - 1, n_indicators, self._num_assets), self.dtype),
+                "symbs": np.empty((self.capacity, self._num_assets, 2), self.dtype),
+                "progress": np.zeros((2,), dtype=int)}
+
+    @property
+    def price_ring(self):
+        return self._numpy_data['prices']
+
+    @property
+    def state_matrix(self):
+        return _sliding_windows(self.price_ring, self.window)
+
+    def _write_price(self, index, p):
+        self.price_ring[index] = p
+        if index < self.window - 1:
+            self.price_ring[self.capacity + index] = p
+
+    def _write_price_block(self, prices, first, end):
+        for slots, t0, t1 in self._slot_ranges(first, end):
+            self.price_ring[slots] = prices[t0 - first:t1 - first]
+        self.price_ring[self.capacity:] = self.price_ring[:self.window - 1]
+
+    def _mark_prices_written(self, first, end):
+        for slots, _, _ in self._slot_ranges(first, end):
+            self.dirty['prices'].mark(slots.start, slots.stop)
+        self.dirty['prices'].mark(self.capacity, self.capacity + self.window - 1)
+
+    def states(self, index):
+        windows = self.state_matrix[index]
+        return windows / windows[..., 0:1, :, -1:]
+
+    def _validate_restoration(self):
+        if self.symbs_matrix.shape[0] != self.capacity:
+            raise FPMMemory.RestorationError("The capacity configured ({}) doesn't match the capacity loaded ({})."
+                                             .format(self.capacity, self.symbs_matrix.shape[0]))
+        window = self.price_ring.shape[0] - self.symbs_matrix.shape[0] + 1
+        if window != self.window:
+            raise FPMMemory.RestorationError("The window configured ({}) doesn't match the window loaded ({})."
+                                             .format(self.window, window))
+        if self.price_ring.shape[2] != self._num_assets:
+            raise FPMMemory.RestorationError(
+                "The number of symbols configured ({}) doesn't match the number of symbols loaded ({}).".format(
+                    self._num_assets, self.price_ring.shape[2]))
+
+
+STORAGE_TYPES = {"window": Storage, "ring": RingStorage}
+
+
 class FPMMemory:
     class Batch:
         def __init__(self, prices, weights, future, index, size):
@@ -180,12 +438,26 @@ class FPMMemory:
         self.beta = config["training"]["beta"]
         self._num_assets = len(config["trading"]["coins"])
         size = int(config["training"]["size"])
-        self._storage = Storage(size, 3, self._num_assets, self._window)
+        storage_type = config["training"].get("storage", "window")
+        if storage_type not in STORAGE_TYPES:
+            raise self.UnknownStorageError("The requested storage '{}' is unknown.".format(storage_type))
+        dtype = config["training"].get("dtype", "float32")
+        self._storage = STORAGE_TYPES[storage_type](size, 3, self._num_assets, self._window, dtype)
 
     def record(self, prices, portfolio):
         self._validate_input(len(prices), portfolio)
         self._storage.append(prices, portfolio[1:])
 
+    def record_many(self, prices_block, portfolios_block):
+        portfolios_block = np.asarray(portfolios_block)
+        if len(prices_block) != len(portfolios_block):
+            raise self.DataMismatchError("Amount of price records and portfolio records does not match: "
+                                         "prices={} portfolios={}".format(len(prices_block), len(portfolios_block)))
+        if len(prices_block) == 0:
+            return
+        self._validate_input(len(prices_block[0]), portfolios_block[0])
+        self._storage.extend(prices_block, portfolios_block[:, 1:])
+
     def _validate_input(self, m, portfolio):
         if m + 1 != len(portfolio):
             raise self.DataMismatchError("Amount of asset symbols and length of portfolio vector does not match: "
@@ -203,25 +475,44 @@ class FPMMemory:
         return not self._storage.empty
 
     def get_random_batch(self, size):
+        selection = self.select_random(size)
+        return self.EMPTY_BATCH if selection is None else self.make_batch(selection, size)
+
+    def get_random_batches(self, count, size):
+        selections = self.select_random(size, count)
+        return self.EMPTY_BATCH if selections is None else self.make_batch(selections, size)
+
+    def select_random(self, size, count=None):
         num_prices = len(self._storage)
         if num_prices < 2:
-            return self.EMPTY_BATCH
+            return None
 
         first_possible = num_prices - size - 1
-        roll = np.random.geometric(self.beta) - 1
-        selection = max(first_possible - roll, 0)
-        return self._make_batch(selection, size)
+        rolls = np.random.geometric(self.beta, count) - 1
+        return np.maximum(first_possible - rolls, 0)
+
+    def make_batch(self, selection, size):
+        if np.ndim(selection) == 0:
+            return self._make_batch(selection, size)
+        size = min(size, len(self._storage) - 1)
+        state, weight, future = self._storage.gather(selection[:, None] + np.arange(size))
+        return self.Batch(state, weight, future, selection, size)
 
     def _make_batch(self, from_idx, size):
         size = min(size, len(self._storage) - 1)
         state, weight, future = self._storage[from_idx:from_idx + size]
         return self.Batch(state, weight, future, from_idx, size)
 
+    def get_weights(self, batch):
+        if np.ndim(batch.index) == 0:
+            return self._storage[batch.index:batch.index + batch.size].portfolio
+        return self._storage.gather_portfolios(batch.index[:, None] + np.arange(batch.size))
+
     def update(self, batch):
-        w_idx = 0
-        for i in range(batch.index + 1, batch.index + batch.size + 1):
-            self._storage[i].portfolio = batch.predictions[w_idx][1:]
-            w_idx += 1
+        predictions = np.asarray(batch.predictions)[..., :batch.size, 1:]
+        predictions = predictions.reshape((-1,) + predictions.shape[-2:])
+        for index, portfolios in zip(np.atleast_1d(batch.index), predictions):
+            self._storage.update_portfolios(index + 1, portfolios)
 
     def save(self, file):
         d = os.path.dirname(file)
@@ -237,3 +528,95 @@ class FPMMemory:
 
     class RestorationError(IOError):
         pass
+
+    class UnknownStorageError(ValueError):
+        pass
+
+
+class PrefetchingMemory:
+    """
+    Wraps a FPMMemory and assembles the next training batch on a producer thread while the agent acts. Once a batch
+    was handed out, the selection of the next one is drawn on the calling thread right after the following record,
+    so it only covers rows whose future is known and the random number sequence stays reproducible. A prefetched
+    batch is discarded when the memory changed again before it is taken. Weights are read again when a prefetched
+    batch is handed out, because they are updated by the training in between. Writes wait for the producer to finish.
+    """
+
+    def __init__(self, memory):
+        self._memory = memory
+        self._producer = ThreadPoolExecutor(max_workers=1)
+        self._pending = None
+        self._wanted = None
+        self._version = 0
+
+    def record(self, prices, portfolio):
+        self._settle()
+        self._memory.record(prices, portfolio)
+        self._version += 1
+        if self._wanted is not None:
+            self._prefetch(*self._wanted)
+
+    def record_many(self, prices_block, portfolios_block):
+        self._discard()
+        self._memory.record_many(prices_block, portfolios_block)
+        self._version += 1
+
+    def get_latest(self):
+        return self._memory.get_latest()
+
+    def ready(self):
+        return self._memory.ready()
+
+    def get_random_batch(self, size):
+        return self._take(None, size)
+
+    def get_random_batches(self, count, size):
+        return self._take(count, size)
+
+    def _take(self, count, size):
+        self._settle()
+        batch = self._pop_prefetched(count, size)
+        if batch is None:
+            batch = self._get_now(count, size)
+        else:
+            batch.weights = self._memory.get_weights(batch)
+        self._wanted = (count, size)
+        return batch
+
+    def _pop_prefetched(self, count, size):
+        pending, self._pending = self._pending, None
+        if pending is None or pending[0] != (count, size, self._version):
+            return None
+        return pending[1].result()
+
+    def _get_now(self, count, size):
+        if count is None:
+            return self._memory.get_random_batch(size)
+        return self._memory.get_random_batches(count, size)
+
+    def _prefetch(self, count, size):
+        self._pending = None
+        selection = self._memory.select_random(size, count)
+        if selection is not None:
+            self._pending = ((count, size, self._version),
+                             self._producer.submit(self._memory.make_batch, selection, size))
+
+    def _settle(self):
+        if self._pending is not None:
+            self._pending[1].result()
+
+    def _discard(self):
+        self._settle()
+        self._pending = None
+
+    def update(self, batch):
+        self._memory.update(batch)
+
+    def save(self, file):
+        self._settle()
+        self._memory.save(file)
+
+    def restore(self, file):
+        self._discard()
+        self._memory.restore(file)
+        self._version += 1
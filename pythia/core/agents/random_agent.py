@@ -10,3 +10,6 @@ class RuleAgent:
 
     def restore(self, _):
         pass
+
+    def export(self, _):
+        pass
@@ -26,6 +26,7 @@ class FpmEnvironment:
         self.commission = config["trading"]["commission"]
         self.assets = self._make_assets()
         self.last_action = self._make_initial_action()
+        self.last_commission = 0.0
         self.last_y = None
         self.next_y = None
         self.next_prices = None
@@ -43,6 +44,7 @@ class FpmEnvironment:
     def reset(self):
         self.assets = self._make_assets()
         self.last_action = self._make_initial_action()
+        self.last_commission = 0.0
         try:
             s = self.time_series.reset()
             self.last_y = self._calc_y_from_prices(s)
@@ -62,6 +64,7 @@ class FpmEnvironment:
         self.assets += self._deduct_commission(shift)
         y = self._calc_y_from_prices(self.next_prices)
         self.last_y = y
+        self.last_commission = np.dot(y, np.where(shift > 0, shift * self.commission, 0))
         return np.dot(y, self.assets)
 
     def _calc_signal(self, action):
@@ -98,3 +101,94 @@ class FpmEnvironment:
 
     class TimeSeriesError(AttributeError):
         pass
+
+
+class BatchedFpmEnvironment:
+    """
+    Advances many independent portfolios in lockstep over the same price series. Every portfolio may use its own
+    commission and price_pow setting, the asset shifts of all portfolios are calculated on (portfolios, assets)
+    arrays at once.
+
+    :param time_series: Price series shared by all portfolios
+    :param config: Configuration used for the cash amount, the assets and the defaults of all portfolios
+    :param count: Number of portfolios simulated
+    :param commissions: Optional commission per portfolio
+    :param price_pows: Optional price_pow per portfolio, None takes the last closing price like the FpmEnvironment
+    :param seed: Optional seed of the random generator used to wiggle prices, the numpy global one is used otherwise
+    """
+
+    def __init__(self, time_series, config, count, commissions=None, price_pows=None, seed=None):
+        self._start_cash = config["trading"]["cash_amount"]
+        self._total_assets = len(config["trading"]["coins"]) + 1
+        self.count = count
+        self.time_series = time_series
+        self.commissions = self._per_portfolio(config["trading"]["commission"] if commissions is None else commissions)
+        if price_pows is None:
+            price_pows = [config["training"].get("price_pow")] * count
+        self._wiggled = np.array([p is not None for p in price_pows])
+        self._pows = np.array([1.0 if p is None else p for p in price_pows], dtype=float)
+        self._random = np.random if seed is None else np.random.RandomState(seed)
+        self.assets = self._make_assets()
+        self.last_action = self._make_initial_action()
+        self.last_y = None
+        self.next_prices = None
+
+    def _per_portfolio(self, value):
+        return np.broadcast_to(np.asarray(value, dtype=float), (self.count,)).copy()
+
+    def _make_assets(self):
+        assets = np.zeros((self.count, self._total_assets))
+        assets[:, 0] = self._start_cash
+        return assets
+
+    def _make_initial_action(self):
+        a = np.zeros((self.count, self._total_assets))
+        a[:, 0] = 1
+        return a
+
+    def reset(self):
+        self.assets = self._make_assets()
+        self.last_action = self._make_initial_action()
+        try:
+            s = self.time_series.reset()
+            self.last_y = FpmEnvironment._add_cash_prices(np.array(s))[:, 0]
+            self.next_prices = next(self.time_series)
+            return s
+        except StopIteration:
+            raise FpmEnvironment.TimeSeriesError("The time series provided is empty.")
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        r = self._calc_rewards_from(actions)
+        self.last_action = actions
+        current = self.next_prices
+        self.next_prices = next(self.time_series, None)
+        return current, r, self.next_prices is None, None
+
+    def _calc_rewards_from(self, actions):
+        next_prices = FpmEnvironment._add_cash_prices(np.array(self.next_prices))
+        shift = self._calc_asset_shift(actions - self.last_action, next_prices)
+        self.assets += np.where(shift > 0, shift * (1 - self.commissions[:, None]), shift)
+        self.last_y = next_prices[:, 0]
+        return self.assets @ self.last_y
+
+    def _calc_action_prices(self, next_prices):
+        prices = np.broadcast_to(self.last_y, (self.count, self._total_assets))
+        if not self._wiggled.any():
+            return prices
+        shift = self._random.power(self._pows)[:, None]
+        mean = self.last_y * shift + next_prices[:, 0] * (1 - shift)
+        spread = (next_prices[:, 1] - next_prices[:, 2]) / 4
+        wiggled = self._random.normal(mean, np.broadcast_to(spread, mean.shape))
+        return np.where(self._wiggled[:, None], wiggled, prices)
+
+    def _calc_asset_shift(self, signal, next_prices):
+        prices = self._calc_action_prices(next_prices)
+        sell = np.where(signal > 0, 0, signal)
+        sell_cash = ((sell / np.where(self.last_action <= 0, 1, self.last_action)) * self.assets) * prices
+        available_cash = np.abs(np.sum(sell_cash, axis=1, keepdims=True))
+        buy = np.where(signal < 0, 0, signal)
+        buy_sum = np.sum(buy, axis=1, keepdims=True)
+        buy_cash = available_cash * np.divide(buy, buy_sum, out=np.zeros_like(buy), where=buy_sum != 0)
+        shift = (sell_cash + buy_cash) / prices
+        return np.where(available_cash < 0.001, 0.0, shift)
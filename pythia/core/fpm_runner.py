@@ -3,8 +3,9 @@ from collections import namedtuple
 
 import numpy as np
 
-from pythia.core.agents.cnn_ensamble import CNNEnsemble
+from pythia.core.agents.cnn_ensamble import CNNEnsemble, FrozenEnsemble
 from pythia.core.agents.fpm_agent import FpmAgent
+from pythia.core.agents.fpm_memory import PrefetchingMemory
 from pythia.core.agents.random_agent import RuleAgent
 
 
@@ -30,7 +31,11 @@ class FpmRunner(ABC):
         self.logger.info("Using agent: {}".format(self.agent))
         if self.agent.type == "FpmAgent":
             ann = CNNEnsemble(tf_sess, len(self.coins), self.window, self.config)
-            return FpmAgent(ann, self._get_memory(), self._make_random_portfolio, self.config, self.logger)
+            return FpmAgent(ann, self._make_memory(), self._make_random_portfolio, self.config, self.logger)
+        elif self.agent.type == "FrozenFpmAgent":
+            ann = FrozenEnsemble(tf_sess)
+            return FpmAgent(ann, self._make_memory(), self._make_random_portfolio, self.config, self.logger,
+                            learning=False)
         elif self.agent.type == "RandomAgent":
             return RuleAgent(self._make_random_portfolio)
         elif self.agent.type == "HoldAgent":
@@ -38,6 +43,12 @@ class FpmRunner(ABC):
         else:
             raise UnknownConfiguration("The requested agent '{}' is unknown.".format(self.agent))
 
+    def _make_memory(self):
+        memory = self._get_memory()
+        if self.config["training"].get("prefetch", False):
+            return PrefetchingMemory(memory)
+        return memory
+
     @abstractmethod
     def _get_memory(self):
         pass
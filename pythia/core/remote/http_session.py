@@ -0,0 +1,87 @@
+import bisect
+import random
+import threading
+import time
+from collections import defaultdict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+LATENCY_BOUNDS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class LatencyHistogram:
+    """
+    Thread-safe histogram of request latencies in seconds. The last bucket counts everything above the largest bound.
+    """
+
+    def __init__(self, bounds=LATENCY_BOUNDS):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0.0
+        self.maximum = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    @property
+    def mean(self):
+        n = self.count
+        return self.total / n if n > 0 else 0.0
+
+    def observe(self, seconds):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+            self.total += seconds
+            self.maximum = max(self.maximum, seconds)
+
+    def describe(self):
+        labels = ["<={}s".format(b) for b in self.bounds] + [">{}s".format(self.bounds[-1])]
+        buckets = " ".join("{}:{}".format(l, c) for l, c in zip(labels, self.counts) if c > 0)
+        return "n={} mean={:.3f}s max={:.3f}s {}".format(self.count, self.mean, self.maximum, buckets)
+
+
+class Backoff:
+    """
+    Exponential backoff with full jitter: the n-th retry waits a random time between 0 and min(cap, base * 2^n).
+    """
+
+    def __init__(self, base=0.5, cap=30.0, rng=random):
+        self.base = base
+        self.cap = cap
+        self._rng = rng
+
+    def delay(self, attempt):
+        return self._rng.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+
+class PooledSession:
+    """
+    Keep-alive HTTP session with a connection pool which records the latency of every request per label.
+
+    :param pool_size: Number of connections kept alive per host
+    :param clock: Clock used to measure latencies
+    """
+
+    def __init__(self, pool_size=10, clock=time.perf_counter):
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._clock = clock
+        self.latencies = defaultdict(LatencyHistogram)
+
+    def get(self, url, params=None, label=None, **kwargs):
+        begin = self._clock()
+        try:
+            return self._session.get(url, params=params, **kwargs)
+        finally:
+            self.latencies[label or url].observe(self._clock() - begin)
+
+    def describe(self):
+        return "; ".join("{}: {}".format(k, h.describe()) for k, h in sorted(self.latencies.items()))
+
+    def close(self):
+        self._session.close()
@@ -0,0 +1,123 @@
+import asyncio
+import random
+import time
+from collections import deque
+
+import requests
+
+from pythia.core.remote import poloniex_api
+from pythia.core.remote.http_session import PooledSession
+from pythia.core.remote.poloniex_api import PUBLIC_API, VALID_PERIODS, InvalidParameterError, _make_chart_payload
+from pythia.core.remote.poloniex_connection import PoloniexConnection, RANDOM_DELAY, _take_keys
+
+
+class TransportError(IOError):
+    pass
+
+
+def _run_until_complete(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(coroutine)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+class HttpTransport:
+    """
+    Queries a Poloniex compatible HTTP API without blocking the event loop by running the request in the loop's
+    default executor.
+
+    :param url: Endpoint of the public API
+    :param timeout: Timeout of a single request in seconds
+    :param session: Pooled HTTP session keeping the connections alive between requests
+    """
+
+    def __init__(self, url=PUBLIC_API, timeout=3.05, session=None):
+        self.url = url
+        self.timeout = timeout
+        self.session = session or PooledSession()
+
+    async def __call__(self, params):
+        return await asyncio.get_event_loop().run_in_executor(None, self._get, params)
+
+    def _get(self, params):
+        try:
+            r = self.session.get(self.url, params, label=params.get("command"), timeout=self.timeout)
+            r.raise_for_status()
+            return r.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            raise TransportError(str(e)) from e
+
+
+class AsyncPoloniexConnection(PoloniexConnection):
+    """
+    Connection requesting the next charts of all coins concurrently within the API's rate limit. The period is waited
+    for once for all coins instead of once per coin.
+
+    :param telemetry: Telemetry recording the received charts
+    :param config: Trading configuration with period, start and retry
+    :param transport: Awaitable callable receiving the query parameters and returning the decoded JSON. It raises
+                      TransportError when a request fails
+    :param limiter: Token bucket limiting the requests, defaults to the limiter shared by all Poloniex clients
+    :param backoff: Backoff between retries of failed requests and empty charts
+    """
+
+    def __init__(self, telemetry, config, transport=None, limiter=None, backoff=None):
+        super().__init__(telemetry, config, limiter or poloniex_api.shared_limiter, backoff=backoff)
+        if self._period not in VALID_PERIODS:
+            raise InvalidParameterError("Period {} is not valid. Valid periods are: {}"
+                                        .format(self._period, VALID_PERIODS))
+        self._transport = transport or HttpTransport(config.get("api", PUBLIC_API), session=self.session)
+
+    def get_next_prices(self, cash, symbol):
+        return self.get_all_next_prices(cash, [symbol])[0]
+
+    def get_all_next_prices(self, cash, symbols):
+        return _run_until_complete(self.fetch_all_next_prices(cash, symbols))
+
+    async def fetch_all_next_prices(self, cash, symbols):
+        pairs = ["{}_{}".format(cash, s) for s in symbols]
+        next_ts = [self._telemetry.find_last_chart_ts(p, self._start_time) + self._period for p in pairs]
+        await self._wait_for_interval_async(max(next_ts))
+        return list(await asyncio.gather(*[self._fetch_next(cash, s, p, ts)
+                                           for s, p, ts in zip(symbols, pairs, next_ts)]))
+
+    async def _wait_for_interval_async(self, next_ts):
+        cur_ts = time.time()
+        period_complete = next_ts + self._period
+        if cur_ts <= period_complete:
+            await asyncio.sleep(period_complete - cur_ts + random.randint(*RANDOM_DELAY))
+
+    async def _fetch_next(self, cash, symbol, pair, next_ts):
+        if pair not in self._buffers or len(self._buffers[pair]) == 0:
+            self._buffers[pair] = deque(await self._request_charts_async(cash, symbol, next_ts))
+
+        chart = _take_keys(self._buffers[pair].popleft(), "close", "high", "low", "date")
+        self._telemetry.write_chart({pair: chart})
+        return _take_keys(chart, "close", "high", "low")
+
+    async def _request_charts_async(self, cash, symbol, start):
+        charts = None
+        for i in range(0, self._retries):
+            charts = await self._query_charts(cash, symbol, start)
+            if not self._is_empty_chart(charts):
+                return charts
+            await asyncio.sleep(self._backoff.delay(i))
+
+        raise self.NoDataError("{}_{} no valid data after {} retries\nResult: {}\nstart: {}"
+                               .format(cash, symbol, self._retries, str(charts), start))
+
+    async def _query_charts(self, cash, symbol, start):
+        for i in range(0, self._retries):
+            end = self._calc_next_full_chart_ts(start)
+            await self._limiter.acquire_async()
+            try:
+                return await self._transport(_make_chart_payload(cash, symbol, self._period, start, end))
+            except TransportError:
+                if i < self._retries - 1:
+                    await asyncio.sleep(self._backoff.delay(i))
+
+        raise self.TimeoutError("Charts of {}_{} timed out after {} retries".format(cash, symbol, self._retries))
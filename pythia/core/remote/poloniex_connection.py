@@ -4,27 +4,29 @@ from collections import deque
 
 import requests
 
+from pythia.core.remote.http_session import Backoff, PooledSession
 from pythia.core.remote.poloniex_api import return_chart_data
 
 RANDOM_DELAY = (3, 5)
 
 
-def _retry_timeout(f, n):
-    for _ in range(0, n):
+def _retry_timeout(f, n, backoff):
+    for i in range(0, n):
         try:
             return f()
         except requests.exceptions.RequestException:
-            pass
+            if i < n - 1:
+                time.sleep(backoff.delay(i))
 
     raise PoloniexConnection.TimeoutError("{} timed out after {} retries".format(str(f), n))
 
 
-def _retry_delayed_if(p, f, n, info):
+def _retry_delayed_if(p, f, n, info, backoff):
     r = None
-    for _ in range(0, n):
+    for i in range(0, n):
         r = f()
         if p(r):
-            time.sleep(random.randint(*RANDOM_DELAY))
+            time.sleep(backoff.delay(i))
         else:
             return r
 
@@ -37,8 +39,11 @@ def _take_keys(d, *ks):
 
 
 class PoloniexConnection:
-    def __init__(self, telemetry, config):
+    def __init__(self, telemetry, config, limiter=None, session=None, backoff=None):
         self._telemetry = telemetry
+        self._limiter = limiter
+        self.session = session or PooledSession(config.get("pool_size", 10))
+        self._backoff = backoff or Backoff(config.get("backoff_base", 0.5), config.get("backoff_cap", 30.0))
         self._period = config["period"]
         self._start_time = config["start"]
         self._retries = config["retry"]
@@ -54,6 +59,9 @@ class PoloniexConnection:
         self._telemetry.write_chart({pair: chart})
         return _take_keys(chart, "close", "high", "low")
 
+    def get_all_next_prices(self, cash, symbols):
+        return [self.get_next_prices(cash, s) for s in symbols]
+
     def _wait_for_interval(self, next_ts):
         cur_ts = time.time()
         period_complete = next_ts + self._period
@@ -71,13 +79,14 @@ class PoloniexConnection:
         def get_charts():
             def query_charts():
                 end = self._calc_next_full_chart_ts(start)
-                return return_chart_data(cash, symbol, self._period, start, end)
+                return return_chart_data(cash, symbol, self._period, start, end, limiter=self._limiter,
+                                         session=self.session)
 
-            return _retry_timeout(query_charts, self._retries)
+            return _retry_timeout(query_charts, self._retries, self._backoff)
 
         info = "{}: {}_{} start: {}, end: {}".format(time.time(), cash, symbol, start,
                                                      self._calc_next_full_chart_ts(start))
-        return _retry_delayed_if(self._is_empty_chart, get_charts, self._retries, info)
+        return _retry_delayed_if(self._is_empty_chart, get_charts, self._retries, info, self._backoff)
 
     def _calc_next_full_chart_ts(self, start):
         current = time.time()
@@ -0,0 +1,55 @@
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter which can be shared by threads and coroutines. Every call reserves a token under a lock
+    and then waits outside of it until the token is refilled, so callers are served in the order of their
+    reservation without holding the lock while waiting.
+
+    :param rate: Tokens refilled per second
+    :param capacity: Maximum number of tokens, i.e. the size of a burst of calls which is not delayed
+    :param clock: Monotonic clock in seconds
+    :param sleep: Blocking sleep used by acquire
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError("The rate of a token bucket needs to be positive: {}".format(rate))
+        self.rate = rate
+        self.capacity = rate if capacity is None else capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = self.capacity
+        self._last = clock()
+        self.calls = 0
+        self.throttled_calls = 0
+        self.wait_time = 0.0
+
+    def _reserve(self):
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            wait = max(0.0, -self._tokens / self.rate)
+            self.calls += 1
+            if wait > 0:
+                self.throttled_calls += 1
+                self.wait_time += wait
+            return wait
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
@@ -1,4 +1,5 @@
 import os
+from collections import deque
 from os import listdir
 from os import path
 from os import remove
@@ -10,40 +11,87 @@ def _to_csv(d, *ks):
     return ",".join([str(d[k]) for k in ks])
 
 
+def _read_tail_lines(file, n, block_size=4096):
+    """
+    Reads the last n lines of a file by seeking backwards from its end.
+
+    :return: Tuple of the last n lines and whether the file holds more lines than that
+    """
+    with open_file(file, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b""
+        while position > 0:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+            if data.count(b"\n") > n:
+                break
+    lines = [line.decode('UTF-8') for line in data.splitlines() if line.strip()]
+    if position > 0:
+        lines = lines[1:]
+    return lines[-n:], position > 0 or len(lines) > n
+
+
 class Telemetry:
-    def __init__(self, folder, limit):
+    """
+    Writes the received charts of every pair into a csv file. The last `limit` rows of a pair are kept in memory, so
+    appending a chart and looking up the last timestamp do not read the file. The file is compacted to the last
+    `limit` rows once it holds `compact_factor` times as many.
+
+    :param folder: Directory of the chart files
+    :param limit: Number of charts kept per pair
+    :param compact_factor: Multiple of the limit a file may grow to before it is compacted
+    """
+
+    def __init__(self, folder, limit, compact_factor=2):
         self._folder = folder
         self._limit = limit
+        self._compact_factor = compact_factor
+        self._tails = dict()
+        self._file_rows = dict()
 
     def write_chart(self, data):
         pair = next(iter(data))
         file = self._get_file_for_pair(pair)
-        if path.isfile(file):
-            self._rotate_lines_in_file(file)
+        tail = self._tail_of(pair, file)
+        tail.append(_to_csv(data[pair], "date", "close", "high", "low"))
+        self._file_rows[pair] += 1
+        if self._file_rows[pair] > self._compact_factor * self._limit:
+            self._compact(pair, file)
+        else:
+            with open_file(file, "a+") as f:
+                f.write(tail[-1] + "\n")
 
-        with open_file(file, "a+") as f:
-            f.write(_to_csv(data[pair], "date", "close", "high", "low") + "\n")
+    def _tail_of(self, pair, file):
+        if pair not in self._tails:
+            self._tails[pair] = deque(maxlen=self._limit)
+            self._file_rows[pair] = 0
+            if path.isfile(file):
+                lines, truncated = _read_tail_lines(file, self._limit)
+                self._tails[pair].extend(lines)
+                self._file_rows[pair] = len(lines)
+                if truncated:
+                    self._compact(pair, file)
+        return self._tails[pair]
 
-    def _rotate_lines_in_file(self, file):
-        with open_file(file, "r") as f:
-            lines = f.read().strip().splitlines()
-        if len(lines) >= self._limit:
-            with open_file(file, "w") as f:
-                f.writelines(os.linesep.join(lines[1:]))
-                f.write(os.linesep)
+    def _compact(self, pair, file):
+        with open_file(file, "w") as f:
+            f.write("".join(line + "\n" for line in self._tails[pair]))
+        self._file_rows[pair] = len(self._tails[pair])
 
     def _get_file_for_pair(self, pair):
         return path.join(self._folder, "chart_{}.csv".format(pair.lower()))
 
     def find_last_chart_ts(self, pair, default):
-        file = self._get_file_for_pair(pair)
-        if not path.isfile(file):
+        tail = self._tail_of(pair, self._get_file_for_pair(pair))
+        if len(tail) == 0:
             return default
-
-        with open_file(file, "r") as f:
-            lines = f.read().strip().splitlines()
-            return int(lines[-1].split(',')[0])
+        return int(tail[-1].split(',')[0])
 
     def reset(self):
+        self._tails.clear()
+        self._file_rows.clear()
         for f in listdir(self._folder):
             remove(path.join(self._folder, f))
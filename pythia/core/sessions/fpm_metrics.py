@@ -0,0 +1,95 @@
+import glob
+import os
+
+import numpy as np
+
+COLUMNS = ("assets", "actions", "rewards", "last_y", "commission")
+
+
+def _chunk_paths(directory, name):
+    return sorted(glob.glob(os.path.join(directory, "{}.*.npy".format(name))))
+
+
+class MetricsRecorder:
+    """
+    Append-only recorder of the per step state of an FpmEnvironment. Steps are written into preallocated chunk arrays
+    which are flushed as one .npy file per column and chunk, so memory stays bounded by the chunk size. An instance
+    can be passed to FpmSession as its recorder.
+
+    :param directory: Directory of the chunk files, previous recordings in it are replaced
+    :param chunk_size: Number of steps held in memory before they are written
+    """
+
+    def __init__(self, directory, chunk_size=4096):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self._buffers = None
+        self._fill = 0
+        self._chunk = 0
+        os.makedirs(directory, exist_ok=True)
+        for name in COLUMNS:
+            for path in _chunk_paths(directory, name):
+                os.remove(path)
+
+    def __call__(self, env):
+        self.record(env.assets, env.last_action, np.dot(env.last_y, env.assets), env.last_y,
+                    env.last_commission)
+
+    def record(self, assets, action, reward, last_y, commission):
+        if self._buffers is None:
+            self._buffers = self._allocate(len(assets))
+
+        i = self._fill
+        self._buffers["assets"][i] = assets
+        self._buffers["actions"][i] = action
+        self._buffers["rewards"][i] = reward
+        self._buffers["last_y"][i] = last_y
+        self._buffers["commission"][i] = commission
+        self._fill += 1
+        if self._fill == self.chunk_size:
+            self.flush()
+
+    def _allocate(self, n_assets):
+        return {"assets": np.empty((self.chunk_size, n_assets)),
+                "actions": np.empty((self.chunk_size, n_assets)),
+                "rewards": np.empty(self.chunk_size),
+                "last_y": np.empty((self.chunk_size, n_assets)),
+                "commission": np.empty(self.chunk_size)}
+
+    def flush(self):
+        if self._fill == 0:
+            return
+
+        for name, buffer in self._buffers.items():
+            np.save(os.path.join(self.directory, "{}.{:06d}.npy".format(name, self._chunk)), buffer[:self._fill])
+        self._chunk += 1
+        self._fill = 0
+
+
+class MetricsReader:
+    """
+    Reads the columns written by a MetricsRecorder. Chunks are memory mapped and only loaded when accessed.
+
+    :param directory: Directory of the chunk files
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def chunks(self, name):
+        if name not in COLUMNS:
+            raise self.UnknownColumnError("There is no recorded column '{}'".format(name))
+        for path in _chunk_paths(self.directory, name):
+            yield np.load(path, mmap_mode='r')
+
+    def column(self, name):
+        chunks = list(self.chunks(name))
+        if len(chunks) == 0:
+            return np.empty(0)
+        return np.concatenate(chunks)
+
+    def __len__(self):
+        return sum(len(c) for c in self.chunks("rewards"))
+
+    class UnknownColumnError(KeyError):
+        pass
@@ -1,7 +1,10 @@
 import os
 
+import numpy as np
 import pandas as pd
 
+from pythia.core.streams.price_cache import PriceCache
+
 
 class FpmTimeSeries:
     def __iter__(self):
@@ -12,28 +15,61 @@ class FpmTimeSeries:
 
 
 class FpmHistoricalSeries(FpmTimeSeries):
+    """
+    Historical prices of all symbols aligned into one contiguous (periods, symbols, [close, high, low]) array.
+    Iterating yields read-only row views into that array.
+
+    :param symbols: Data frames with close, high and low columns, one per symbol. Rows are aligned by position and
+                    truncated to the shortest frame.
+    """
+    PRICE_COLUMNS = ["close", "high", "low"]
+
     def __init__(self, *symbols):
         if len(symbols) == 0:
             raise self.NoSymbolsError()
 
-        self.symbols = symbols
-        self._reset_iters()
+        self._set_prices(self._align(symbols))
+
+    @classmethod
+    def from_prices(cls, prices):
+        series = cls.__new__(cls)
+        series._set_prices(np.asarray(prices))
+        return series
+
+    @classmethod
+    def _align(cls, symbols):
+        length = min(len(s) for s in symbols)
+        return np.stack([s[cls.PRICE_COLUMNS].values[:length] for s in symbols], axis=1).astype(np.float64)
 
     # noinspection PyAttributeOutsideInit
-    def _reset_iters(self):
-        self.symbol_iters = [s.iterrows() for s in self.symbols]
+    def _set_prices(self, prices):
+        if prices.ndim != 3 or prices.shape[2] != len(self.PRICE_COLUMNS):
+            raise self.ShapeError("Prices need the shape (periods, symbols, {}), got {}"
+                                  .format(len(self.PRICE_COLUMNS), prices.shape))
+        self.prices = prices.view()
+        self.prices.flags.writeable = False
+        self._position = 0
 
-    def __next__(self):
-        def make_price(symbol):
-            s = next(symbol)[1]
-            return [s.close, s.high, s.low]
+    def __len__(self):
+        return len(self.prices)
 
-        return [make_price(s) for s in self.symbol_iters]
+    def __next__(self):
+        if self._position >= len(self.prices):
+            raise StopIteration
+        row = self.prices[self._position]
+        self._position += 1
+        return row
 
     def reset(self):
-        self._reset_iters()
+        self._position = 0
         return self.__next__()
 
+    def slice(self, start, end=None):
+        return self.from_prices(self.prices[start:end])
+
+    class ShapeError(ValueError):
+        pass
+
 
 class FpmLiveSeries(FpmTimeSeries):
     def __init__(self, connection, config):
@@ -47,16 +83,17 @@ class FpmLiveSeries(FpmTimeSeries):
 
     def __next__(self):
         try:
-            def price_list_of(symbol):
-                r = self.connection.get_next_prices(self.cash, symbol)
-                return [r["close"], r["high"], r["low"]]
-
-            return [price_list_of(s) for s in self.symbols]
+            return [[r["close"], r["high"], r["low"]]
+                    for r in self.connection.get_all_next_prices(self.cash, self.symbols)]
         except TimeoutError:
             raise self.TimeoutError("The connection to query the next prices timed out")
 
     def reset(self):
         self.connection.reset()
+        cache = PriceCache(self.data_dir, self.cash, self.symbols)
+        if cache.is_current():
+            return cache.prices_at(self.start).tolist()
+
         initial_prices = []
         for sym in self.symbols:
             df = pd.read_csv(os.path.join(self.data_dir, "{}_{}.csv".format(self.cash, sym)), index_col='timestamp')
@@ -1,62 +1,162 @@
 import json
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from urllib.request import urlopen
-from urllib.parse import urlencode
+
+import requests
+
+from pythia.core.remote import poloniex_api
+from pythia.core.remote.http_session import Backoff, PooledSession
 
 HEADER = "timestamp,open,high,low,close,volume,quoteVolume,weightedAverage\n"
+PROGRESS_FILE = "history_progress.json"
+
+
+def _read_last_line(path, block_size=4096):
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        position = end
+        data = b""
+        while position > 0:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+            lines = data.rstrip(b"\r\n").splitlines()
+            if len(lines) > 1 or position == 0:
+                return (lines[-1] if len(lines) > 0 else b"").decode('UTF-8'), data.endswith(b"\n")
+    return "", True
 
 
 class PoloniexHistory:
-    def __init__(self, config, output_path, sleep=5):
+    """
+    Downloads the chart history of all configured coins into {cash}_{coin}.csv files. Long ranges are split into
+    windows of `chunk_periods` charts which are requested concurrently for all coins under the shared rate limit.
+    The size of every file after a written chunk is recorded in a progress file, so a chunk which was only partially
+    written by an interrupted update is discarded and the next update continues after the last complete row.
+
+    :param config: Configuration with a trading section holding api, cash, coins, period and start
+    :param output_path: Directory of the csv files
+    :param limiter: Token bucket limiting the requests, defaults to the limiter shared by all Poloniex clients
+    :param workers: Number of concurrent requests
+    :param chunk_periods: Number of periods requested at once
+    :param session: Pooled HTTP session, defaults to one with a connection per worker
+    :param backoff: Backoff between retries of failed requests
+    :param retries: Number of attempts per chunk
+    """
+
+    def __init__(self, config, output_path, limiter=None, workers=4, chunk_periods=5000, session=None, backoff=None,
+                 retries=5):
         self.trading_cfg = config["trading"]
-        self.requests = [{"coin": coin,
-                          "url": f"{self.trading_cfg['api']}?",
-                          "args": self._build_url_arguments(coin)} for coin in self.trading_cfg["coins"]]
         self.output_path = output_path
-        self.sleep = sleep
+        self.limiter = limiter or poloniex_api.shared_limiter
+        self.workers = workers
+        self.chunk_periods = chunk_periods
+        self.session = session or PooledSession(workers)
+        self.backoff = backoff or Backoff()
+        self.retries = retries
 
-    def _build_url_arguments(self, coin):
-        args = {"command": "returnChartData",
-                "currencyPair": f"{self.trading_cfg['cash']}_{coin}",
-                "period": self.trading_cfg["period"],
-                "start": str(int(time.mktime(datetime.strptime(self.trading_cfg['start'], "%Y-%m-%d").timetuple())))}
-        return args
+    @property
+    def period(self):
+        return self.trading_cfg["period"]
+
+    @property
+    def _progress_path(self):
+        return os.path.join(self.output_path, PROGRESS_FILE)
+
+    def _config_start(self):
+        return int(time.mktime(datetime.strptime(self.trading_cfg['start'], "%Y-%m-%d").timetuple()))
 
     def update(self):
-        for r in self.requests:
-            path = self._make_path_for(r["coin"])
-            exists = os.path.exists(path)
-            if exists:
-                self._update_start_time(path, r)
-
-            rates = json.loads(urlopen(r["url"] + urlencode(r["args"])).read().decode(encoding='UTF-8'))
-            if exists:
-                self._append_csv(path, rates)
+        end = int(time.time())
+        progress = self._read_progress()
+        starts = {coin: self._find_start(coin, progress) for coin in self.trading_cfg["coins"]}
+        with ThreadPoolExecutor(self.workers) as executor:
+            fetches = {coin: [executor.submit(self._fetch, coin, s, e) for s, e in self._make_windows(start, end)]
+                       for coin, start in starts.items()}
+            for coin, futures in fetches.items():
+                for f in futures:
+                    self._write_rates(coin, f.result(), progress)
+
+    def _make_windows(self, start, end):
+        span = self.chunk_periods * self.period
+        return [(s, min(s + span - self.period, end)) for s in range(start, end + 1, span)]
+
+    def _fetch(self, coin, start, end):
+        args = {"command": "returnChartData",
+                "currencyPair": self._pair_of(coin),
+                "period": self.period,
+                "start": start,
+                "end": end}
+        for attempt in range(self.retries):
+            self.limiter.acquire()
+            try:
+                r = self.session.get(self.trading_cfg['api'], args, label=poloniex_api.CMD_CHART, timeout=30)
+                r.raise_for_status()
+                return [rate for rate in r.json() if rate["date"] != 0]
+            except requests.exceptions.RequestException:
+                if attempt == self.retries - 1:
+                    raise
+                time.sleep(self.backoff.delay(attempt))
+
+    def _find_start(self, coin, progress):
+        path = self._make_path_for(coin)
+        if not os.path.exists(path):
+            progress.pop(self._pair_of(coin), None)
+            return self._config_start()
+
+        last, terminated = _read_last_line(path)
+        if not terminated:
+            entry = progress.get(self._pair_of(coin))
+            if entry is not None and os.path.getsize(path) > entry["size"]:
+                self._truncate(path, entry["size"])
+                last, terminated = _read_last_line(path)
             else:
-                self._create_csv(path, rates)
+                with open(path, "a") as f:
+                    f.write("\n")
 
-            time.sleep(self.sleep)
+        if last == "" or last == HEADER.strip():
+            return self._config_start()
+        return int(last.split(',')[0]) + self.period
+
+    @staticmethod
+    def _truncate(path, size):
+        with open(path, "r+") as f:
+            f.truncate(size)
+
+    def _pair_of(self, coin):
+        return f"{self.trading_cfg['cash']}_{coin}"
 
     def _make_path_for(self, coin):
-        return os.path.join(self.output_path, f"{self.trading_cfg['cash']}_{coin}.csv")
+        return os.path.join(self.output_path, f"{self._pair_of(coin)}.csv")
+
+    def _write_rates(self, coin, rates, progress):
+        path = self._make_path_for(coin)
+        exists = os.path.exists(path)
+        if len(rates) == 0 and exists:
+            return
 
-    def _update_start_time(self, path, r):
-        with open(path, 'r') as f:
-            last_ts = f.readlines()[-1].split(',')[0]
-            r["args"]["start"] = int(last_ts) + self.trading_cfg["period"]
+        with open(path, "a" if exists else "w") as f:
+            f.write(("" if exists else HEADER) + "".join([self._rate_to_csv(r) + "\n" for r in rates]))
+        if len(rates) > 0:
+            progress[self._pair_of(coin)] = {"last": rates[-1]["date"], "size": os.path.getsize(path)}
+            self._write_progress(progress)
 
-    def _append_csv(self, path, rates):
-        with open(path, "a") as f:
-            f.write("\n".join([self._rate_to_csv(r) for r in rates]))
+    def _read_progress(self):
+        if not os.path.exists(self._progress_path):
+            return dict()
+        with open(self._progress_path, "r") as f:
+            return json.load(f)
 
-    def _create_csv(self, path, rates):
-        with open(path, "w") as f:
-            csv = HEADER
-            csv += "\n".join([self._rate_to_csv(r) for r in rates])
-            f.write(csv)
+    def _write_progress(self, progress):
+        tmp = self._progress_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(progress, f)
+        os.replace(tmp, self._progress_path)
 
     @staticmethod
     def _rate_to_csv(rate):
-        return f'{rate["date"]},{rate["open"]},{rate["high"]},{rate["low"]},{rate["close"]},{rate["volume"]},{rate["quoteVolume"]},{rate["weightedAverage"]}'
+        return f'{rate["date"]},{rate["open"]},{rate["high"]},{rate["low"]},{rate["close"]},' \
+               f'{rate["volume"]},{rate["quoteVolume"]},{rate["weightedAverage"]}'
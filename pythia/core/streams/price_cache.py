@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import tempfile
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+
+
+class PriceCache:
+    """
+    Memory-mappable binary copy of processed Poloniex CSV recordings. Every source file is converted once into a
+    timestamp and a price array, and the configured coins are aligned on their common timestamps into one
+    (periods, coins, fields) array. A manifest keeps the modification time, size and hash of every source file so
+    only changed recordings are converted again.
+
+    :param data_directory: Directory holding the {cash}_{coin}.csv recordings
+    :param cash: Cash symbol of the recordings
+    :param coins: Coins to align, in the order of the price array
+    :param cache_directory: Directory of the binary store, defaults to a "cache" folder inside the data directory
+    """
+    MANIFEST_FILE = "manifest.json"
+    FIELDS = ("close", "high", "low")
+
+    def __init__(self, data_directory, cash, coins, cache_directory=None):
+        self.data_directory = data_directory
+        self.cash = cash
+        self.coins = list(coins)
+        self.cache_directory = cache_directory or os.path.join(data_directory, "cache")
+
+    @property
+    def _manifest_path(self):
+        return os.path.join(self.cache_directory, self.MANIFEST_FILE)
+
+    @property
+    def _aligned_name(self):
+        return "{}_{}".format(self.cash, "-".join(self.coins))
+
+    def _source_name(self, coin):
+        return "{}_{}".format(self.cash, coin)
+
+    def _source_path(self, coin):
+        return os.path.join(self.data_directory, self._source_name(coin) + ".csv")
+
+    def _cache_path(self, name, kind):
+        return os.path.join(self.cache_directory, "{}.{}.npy".format(name, kind))
+
+    def present(self):
+        return os.path.exists(self._manifest_path)
+
+    def is_current(self):
+        if not self.present():
+            return False
+        manifest = self._read_manifest()
+        aligned = manifest["aligned"].get(self._aligned_name)
+        if aligned is None:
+            return False
+        for coin in self.coins:
+            entry = manifest["sources"].get(self._source_name(coin))
+            if entry is None or not self._stat_matches(entry, self._source_path(coin)):
+                return False
+            if aligned["sources"].get(self._source_name(coin)) != entry["sha1"]:
+                return False
+        return True
+
+    def update(self):
+        """
+        Converts new or changed recordings and realigns the coins if any of them changed.
+
+        :return: Names of the recordings which were converted
+        """
+        os.makedirs(self.cache_directory, exist_ok=True)
+        manifest = self._read_manifest() if self.present() else {"sources": {}, "aligned": {}}
+        previous = json.dumps(manifest, sort_keys=True)
+        converted = [c for c in self.coins if self._update_source(manifest["sources"], c)]
+        self._update_aligned(manifest)
+        if not self.present() or json.dumps(manifest, sort_keys=True) != previous:
+            self._write_manifest(manifest)
+        return [self._source_name(c) for c in converted]
+
+    def _update_source(self, sources, coin):
+        name, path = self._source_name(coin), self._source_path(coin)
+        entry = sources.get(name)
+        cached = os.path.exists(self._cache_path(name, "prices"))
+        if cached and entry is not None and self._stat_matches(entry, path):
+            return False
+
+        stat = os.stat(path)
+        digest = self._hash_file(path)
+        sources[name] = {"mtime": stat.st_mtime, "size": stat.st_size, "sha1": digest}
+        if cached and entry is not None and entry["sha1"] == digest:
+            return False
+
+        timestamps, prices = self._read_csv(path)
+        self._save(self._cache_path(name, "timestamps"), timestamps)
+        self._save(self._cache_path(name, "prices"), prices)
+        return True
+
+    def _update_aligned(self, manifest):
+        hashes = {self._source_name(c): manifest["sources"][self._source_name(c)]["sha1"] for c in self.coins}
+        entry = manifest["aligned"].get(self._aligned_name)
+        if entry is not None and entry["sources"] == hashes and os.path.exists(self._aligned_path("prices")):
+            return
+
+        sources = [(np.load(self._cache_path(self._source_name(c), "timestamps")),
+                    np.load(self._cache_path(self._source_name(c), "prices"), mmap_mode='r')) for c in self.coins]
+        common = reduce(np.intersect1d, [ts for ts, _ in sources])
+        prices = np.stack([p[np.searchsorted(ts, common)] for ts, p in sources], axis=1)
+        self._save(self._aligned_path("timestamps"), common)
+        self._save(self._aligned_path("prices"), prices)
+        manifest["aligned"][self._aligned_name] = {"sources": hashes}
+
+    def _aligned_path(self, kind):
+        return self._cache_path(self._aligned_name, kind)
+
+    def load(self):
+        """
+        Maps the aligned store read-only into memory.
+
+        :return: Tuple of unix timestamps with shape (periods,) and prices with shape (periods, coins, fields)
+        """
+        if not self.present() or self._aligned_name not in self._read_manifest()["aligned"]:
+            raise self.MissingCacheError("No aligned price cache for {} in {}"
+                                         .format(self._aligned_name, self.cache_directory))
+        return np.load(self._aligned_path("timestamps")), np.load(self._aligned_path("prices"), mmap_mode='r')
+
+    def select(self, start=None, end=None):
+        """
+        Selects a date range of the aligned store with the same inclusive semantics as slicing a DataFrame by date.
+
+        :param start: First date of the range or None to start at the beginning
+        :param end: Last date of the range or None to select until the end
+        :return: Tuple of timestamps and prices of the range
+        """
+        timestamps, prices = self.load()
+        index = pd.DatetimeIndex(pd.to_datetime(timestamps, unit='s'))
+        selection = index.slice_indexer(start, end)
+        return timestamps[selection], prices[selection]
+
+    def prices_at(self, timestamp):
+        timestamps, prices = self.load()
+        i = np.searchsorted(timestamps, timestamp)
+        if i == len(timestamps) or timestamps[i] != timestamp:
+            raise KeyError(timestamp)
+        return prices[i]
+
+    def _read_csv(self, path):
+        df = pd.read_csv(path, index_col='timestamp')
+        df = df[~df.index.duplicated(keep='first')].sort_index()
+        return df.index.values.astype(np.int64), df[list(self.FIELDS)].values.astype(np.float64)
+
+    def _read_manifest(self):
+        with open(self._manifest_path) as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest):
+        self._replace(self._manifest_path, "w", lambda f: json.dump(manifest, f, indent=2))
+
+    def _save(self, path, array):
+        self._replace(path, "wb", lambda f: np.save(f, array))
+
+    def _replace(self, path, mode, write):
+        """
+        Writes into a temporary file unique to this process and moves it over the path, so concurrent updates never
+        share a temporary file.
+        """
+        fd, tmp = tempfile.mkstemp(dir=self.cache_directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, mode) as f:
+                write(f)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    @staticmethod
+    def _stat_matches(entry, path):
+        if not os.path.exists(path):
+            return False
+        stat = os.stat(path)
+        return entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size
+
+    @staticmethod
+    def _hash_file(path):
+        sha1 = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha1.update(chunk)
+        return sha1.hexdigest()
+
+    class MissingCacheError(FileNotFoundError):
+        pass
@@ -1,9 +1,17 @@
+from concurrent.futures import ProcessPoolExecutor
 from functools import reduce
 from math import sqrt
 
+import numpy as np
+
+from pythia.core.streams.rates_calculators import _collect_rate_columns, max_peak_to_trough
+
 ANALYSIS_STR_HEADER = " EXCHANGE |   MEAN   |    SD    |  MEDIAN  |   MIN   |   MAX   |   DIF   \n" \
                       "-------------------------------------------------------------------------\n"
 ANALYSIS_CSV_HEADER = "EXCHANGE,MEAN,SD,MEDIAN,MIN,MAX,DIF\n"
+DIFFERENCES_STR_HEADER = " EXCHANGE | MAX DIF  |  START  |   END   \n" \
+                         "----------------------------------------\n"
+DIFFERENCES_CSV_HEADER = "EXCHANGE,MAX_DIF,START,END\n"
 
 
 class RatesExchangeReport:
@@ -57,3 +65,46 @@ def analyze(rates):
         report.append(k, mean, sd, median, min(r), max(r), dif)
 
     return report
+
+
+class MaxDifferenceReport:
+    def __init__(self, exchanges, differences, starts, ends):
+        order = np.argsort(-differences, kind="stable")
+        self.records = [(exchanges[i], float(differences[i]), int(starts[i]), int(ends[i])) for i in order]
+
+    def __str__(self):
+        if len(self.records) == 0:
+            return ""
+
+        return DIFFERENCES_STR_HEADER + "".join(" {:<9}|{:>10.10}|{:>9}|{:>9}\n".format(e, str(d), s, t)
+                                                for e, d, s, t in self.records)
+
+    def to_csv(self):
+        if len(self.records) == 0:
+            return ""
+
+        return DIFFERENCES_CSV_HEADER + "".join(",".join(map(str, r)) + "\n" for r in self.records)
+
+
+def analyze_max_differences(rates, workers=1):
+    """
+    Ranks all exchanges by the largest drop of their rate below a preceding maximum, which bounds the profit a rigged
+    policy can make on them. All exchanges are scanned at once from the rate columns of the remaining records.
+
+    :param rates: ShapeShiftRates, ideally parsed into columns so the records are not iterated
+    :param workers: Number of processes the exchanges are split across
+    :return: MaxDifferenceReport ordered from the largest to the smallest difference, with start and end as steps of
+             the rates
+    """
+    first = rates.step
+    names, columns = _collect_rate_columns(rates)
+    if len(names) == 0:
+        return MaxDifferenceReport(names, np.empty(0), [], [])
+    if workers > 1 and len(columns) > 1:
+        with ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(max_peak_to_trough, np.array_split(columns, min(workers, len(columns)))))
+    else:
+        results = [max_peak_to_trough(columns)]
+
+    differences, starts, ends = (np.concatenate(r) for r in zip(*results))
+    return MaxDifferenceReport(names, differences, starts + first, ends + first)
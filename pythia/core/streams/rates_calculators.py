@@ -1,15 +1,45 @@
-from functools import reduce
+from io import StringIO
 
+import numpy as np
+
+
+def _filter_pairs(pairs, exchanges):
+    return {k: pairs[k] for k in exchanges if k in pairs} if exchanges != [] else pairs
+
+
+def _format_rates(pairs):
+    return "[ " + ",".join(map(str, pairs.values())) + "]\n"
 
-def rates_filter(in_stream, exchanges):
-    def concat_rates(rates_str, pairs):
-        f = {k: pairs[k] for k in exchanges if k in pairs} if exchanges != [] else pairs
-        if bool(f) is False:
-            return rates_str
 
-        return rates_str + "[ " + ",".join(map(str, f.values())) + "]\n"
+def split_rates(in_stream, outputs):
+    """
+    Filters the rates of every record into several output streams in a single pass over the input. Records without
+    any of the exchanges of an output are not written to it.
 
-    return reduce(concat_rates, in_stream, "")
+    :param in_stream: Iterable of records mapping pair names to rates, e.g. ShapeShiftRates
+    :param outputs: Iterable of (exchanges, out_stream) tuples. An empty list of exchanges keeps all pairs
+    :return: Number of lines written to each output stream
+    """
+    outputs = list(outputs)
+    written = [0] * len(outputs)
+    for pairs in in_stream:
+        for i, (exchanges, out_stream) in enumerate(outputs):
+            f = _filter_pairs(pairs, exchanges)
+            if bool(f) is True:
+                out_stream.write(_format_rates(f))
+                written[i] += 1
+
+    return written
+
+
+def write_filtered_rates(in_stream, exchanges, out_stream):
+    return split_rates(in_stream, [(exchanges, out_stream)])[0]
+
+
+def rates_filter(in_stream, exchanges):
+    out_stream = StringIO()
+    write_filtered_rates(in_stream, exchanges, out_stream)
+    return out_stream.getvalue()
 
 
 class ExchangeRanges:
@@ -47,6 +77,16 @@ class PairRange:
         self.min = float(pair.rate)
         self.max = float(pair.rate)
 
+    @classmethod
+    def from_columns(cls, name, min, min_position, max, max_position):
+        r = cls.__new__(cls)
+        r.name = name
+        r.min = min
+        r.min_position = min_position
+        r.max = max
+        r.max_position = max_position
+        return r
+
     def extend(self, other):
         assert self.name == other.name
         if other.min < self.min:
@@ -72,6 +112,16 @@ class PairMaxDifference(PairRange):
         self.start_position = 0
         self.end_position = 0
 
+    @classmethod
+    def from_difference(cls, name, max_difference, start_position, end_position, min, min_position, max, max_position,
+                        target_diff):
+        d = cls.from_columns(name, min, min_position, max, max_position)
+        d.target_diff = target_diff
+        d.max_difference = max_difference
+        d.start_position = start_position
+        d.end_position = end_position
+        return d
+
     def extend(self, other):
         if self.target_diff is not None and self.max_difference >= self.target_diff:
             return
@@ -91,33 +141,118 @@ class PairMaxDifference(PairRange):
         self.min_position = self.max_position
 
 
-class PairMaxDiffFactory:
-    def __init__(self, target_diff):
-        self.target_diff = target_diff
-
-    def __call__(self, index, named_pair):
-        return PairMaxDifference(index, named_pair, self.target_diff)
+def _collect_rate_columns(rates):
+    """
+    Collects the rates of the remaining records into one row per pair. Rates which provide columns themselves are
+    not iterated.
 
+    :return: Tuple of the pair names and a (pairs, steps) array of rates which is NaN where a pair is missing
+    """
+    collected = rates.rate_columns() if hasattr(rates, "rate_columns") else None
+    if collected is not None:
+        names, columns = collected
+        present = ~np.isnan(columns).all(axis=1)
+        return [n for n, p in zip(names, present) if p], columns[present]
 
-def _pair_to_accumulator(idx_pairs, accumulator):
-    idx, pairs = idx_pairs
-    return map(lambda pair: accumulator(idx, pair), pairs.items())
+    positions, values = dict(), dict()
+    steps = 0
+    for steps, pairs in enumerate(rates, 1):
+        for name, pair in pairs.items():
+            positions.setdefault(name, []).append(steps - 1)
+            values.setdefault(name, []).append(float(pair.rate))
 
-
-def _reduce_to_pairs_to_accumulator(rates, accumulator):
-    def fold_to_accumulator(acc, pair):
-        return acc.extend(pair)
-
-    def extend_exchange_ranges(ranges, idx_pairs):
-        return reduce(fold_to_accumulator, _pair_to_accumulator(idx_pairs, accumulator), ranges)
-
-    return reduce(extend_exchange_ranges, enumerate(rates), ExchangeRanges())
+    columns = np.full((len(values), steps), np.nan)
+    for row, name in enumerate(values):
+        columns[row, positions[name]] = values[name]
+    return list(values), columns
 
 
 def calculate_exchange_ranges(rates):
-    return _reduce_to_pairs_to_accumulator(rates, PairRange)
+    names, columns = _collect_rate_columns(rates)
+    ranges = ExchangeRanges()
+    if len(names) == 0:
+        return ranges
+
+    min_positions, max_positions = np.nanargmin(columns, axis=1), np.nanargmax(columns, axis=1)
+    rows = np.arange(len(names))
+    for name, mn, mn_pos, mx, mx_pos in zip(names, columns[rows, min_positions].tolist(), min_positions.tolist(),
+                                            columns[rows, max_positions].tolist(), max_positions.tolist()):
+        ranges.ranges[name] = PairRange.from_columns(name, mn, mn_pos, mx, mx_pos)
+    return ranges
 
 
 def calculate_exchange_max_differences(rates, target_diff=None):
-    maxDiff = PairMaxDiffFactory(target_diff)
-    return _reduce_to_pairs_to_accumulator(rates, maxDiff)
\ No newline at end of file
+    names, columns = _collect_rate_columns(rates)
+    ranges = ExchangeRanges()
+    if len(names) == 0:
+        return ranges
+
+    differences, starts, ends = max_peak_to_trough(columns, target_diff)
+    minima, min_positions, maxima, max_positions = _accumulated_extrema(columns, target_diff)
+    for name, d, s, e, mn, mn_pos, mx, mx_pos in zip(names, differences.tolist(), starts.tolist(), ends.tolist(),
+                                                     minima.tolist(), min_positions.tolist(), maxima.tolist(),
+                                                     max_positions.tolist()):
+        ranges.ranges[name] = PairMaxDifference.from_difference(name, d, s, e, mn, mn_pos, mx, mx_pos, target_diff)
+    return ranges
+
+
+def _running_drops(rates):
+    peaks = np.fmax.accumulate(rates, axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        drops = np.nan_to_num((peaks - rates) / peaks, nan=0.0, posinf=0.0, neginf=0.0)
+    return peaks, drops
+
+
+def _stop_positions(rates, drops, target_diff):
+    """
+    Positions of the last rates a PairMaxDifference takes into account, which is the first drop reaching the target
+    difference or the last rate.
+    """
+    present = ~np.isnan(rates)
+    last = rates.shape[1] - 1 - np.argmax(present[:, ::-1], axis=1)
+    if target_diff is None:
+        return last
+    reached = (drops >= target_diff) & present
+    return np.where(reached.any(axis=1), np.argmax(reached, axis=1), last)
+
+
+def _accumulated_extrema(rates, target_diff):
+    """
+    Calculates the minimum and maximum a PairMaxDifference holds after accumulating the rates: the running maximum
+    and the minimum since that maximum was reached.
+
+    :return: Tuple of arrays holding the minima, their positions, the maxima and their positions
+    """
+    peaks, drops = _running_drops(rates)
+    stops = _stop_positions(rates, drops, target_diff)
+    rows, positions = np.arange(len(rates)), np.arange(rates.shape[1])
+    considered = ~np.isnan(rates) & (positions <= stops[:, None])
+    maxima = peaks[rows, stops]
+    max_positions = np.argmax(considered & (rates == maxima[:, None]), axis=1)
+    since_max = np.where(considered & (positions >= max_positions[:, None]), rates, np.inf)
+    min_positions = np.argmin(since_max, axis=1)
+    return since_max[rows, min_positions], min_positions, maxima, max_positions
+
+
+def max_peak_to_trough(rates, target_diff=None):
+    """
+    Calculates the largest relative drop of every rate series below its preceding maximum, the quantity
+    PairMaxDifference accumulates, with cumulative array operations. Missing rates are NaN and skipped.
+
+    :param rates: (pairs, steps) array of rates
+    :param target_diff: Optionally stop at the first drop reaching this difference
+    :return: Tuple of arrays holding the differences, the positions of the peaks and the positions of the troughs
+    """
+    rates = np.atleast_2d(np.asarray(rates, dtype=np.float64))
+    peaks, drops = _running_drops(rates)
+    rows = np.arange(len(rates))
+    ends = np.argmax(drops, axis=1)
+    if target_diff is not None:
+        stops = _stop_positions(rates, drops, target_diff)
+        ends = np.where(drops[rows, stops] >= target_diff, stops, ends)
+    differences = drops[rows, ends]
+    at_peak = (rates == peaks[rows, ends][:, None]) & (np.arange(rates.shape[1]) <= ends[:, None])
+    starts = np.argmax(at_peak, axis=1)
+    no_drop = differences <= 0
+    starts[no_drop], ends[no_drop] = 0, 0
+    return differences, starts, ends
@@ -1,7 +1,9 @@
 import json
+import math
+import os
+from io import SEEK_CUR, SEEK_END
 
-from decimal import Decimal
-from io import SEEK_CUR
+import numpy as np
 
 SUPPORTED_COINS = [
     "BTC",
@@ -62,6 +64,10 @@ SUPPORTED_COINS = [
 ]
 
 
+FIELDS = ("rate", "limit", "maxLimit", "min", "fee")
+INFO_KEYS = ("rate", "limit", "maxLimit", "min", "minerFee")
+
+
 class RatesPair:
     def __init__(self, info):
         self._pair = info["pair"]
@@ -71,6 +77,17 @@ class RatesPair:
         self.min = float(info["min"])
         self.fee = float(info["minerFee"])
 
+    @classmethod
+    def from_values(cls, pair, rate, limit, max_limit, min, fee):
+        p = cls.__new__(cls)
+        p._pair = pair
+        p.rate = rate
+        p.limit = limit
+        p.maxLimit = max_limit
+        p.min = min
+        p.fee = fee
+        return p
+
     def __str__(self):
         return '{{"rate":"{}","limit":{},"pair":"{}","maxLimit":{},"min":{},"minerFee":{}}}' \
             .format(self.rate, self.limit, self._pair, self.maxLimit, self.min, self.fee)
@@ -79,19 +96,32 @@ class RatesPair:
         return 'RatesPair: {}'.format(str(self))
 
 
+def _parse_line(line):
+    return json.loads(line[line.find('['):line.find(']') + 1])
+
+
 class ShapeShiftRates:
-    def __init__(self, stream, preload=False):
+    def __init__(self, stream, preload=False, index_path=None, columnar=False):
         """
         Thin wrapper around a shape shift token exchange market info json file. Provides simple iterator mechanics to
-        walk efficiently through the token exchange stream. Random access is not provided and stream has to be reset.
+        walk efficiently through the token exchange stream. Random access is provided when the stream is preloaded or
+        indexed, otherwise the stream has to be reset.
 
         :param stream: Steam of data containing a new line separated list of shapeshift market info json strings
         :param preload: Optionally load the rates data into memory for faster access
+        :param index_path: Optional sidecar file storing the index, so it is only built when the stream changed.
+                           Columnar rates are stored next to it in one memory mapped {index_path}.{field}.npy per field
+        :param columnar: Optionally parse the rates once into one (pairs, steps) array per field of FIELDS
         """
         self.stream = stream
         self.preload = preload
         self.cache = None
-        self.cache_idx = 0
+        self.step = 0
+        self.offsets = None
+        self.pairs = None
+        self.columns = None
+        if index_path is not None or columnar:
+            self._index(index_path, columnar)
         if self.preload:
             self.cache = [p for p in self]
             self.reset()
@@ -102,54 +132,217 @@ class ShapeShiftRates:
     def __next__(self):
         if self.cache is not None:
             return self._return_from_cache()
+        if self.columns is not None:
+            return self._return_from_columns()
 
         line = self.stream.readline()
         if line == "":
             raise StopIteration
 
-        json_obj = json.loads(line[line.find('['):line.find(']') + 1])
+        self.step += 1
         pairs = dict()
-        for pair in json_obj:
+        for pair in _parse_line(line):
             pairs[pair["pair"]] = RatesPair(pair)
 
         return pairs
 
+    def __len__(self):
+        if self.cache is not None:
+            return len(self.cache)
+        if self.offsets is None:
+            raise self.NotIndexedError("The length of the rates is only known when they are preloaded or indexed")
+        return len(self.offsets) - 1
+
     def _return_from_cache(self):
-        self.cache_idx += 1
-        if self.cache_idx > len(self.cache):
+        if self.step >= len(self.cache):
             raise StopIteration
-        return self.cache[self.cache_idx - 1]
+        self.step += 1
+        return self.cache[self.step - 1]
+
+    def _return_from_columns(self):
+        if self.step >= len(self):
+            raise StopIteration
+        row = np.stack([self.columns[f][:, self.step] for f in FIELDS], axis=1).tolist()
+        self.step += 1
+        return {pair: RatesPair.from_values(pair, *v) for pair, v in zip(self.pairs, row) if not math.isnan(v[0])}
+
+    def rate_columns(self):
+        """
+        Consumes the remaining records of columnar rates at once.
+
+        :return: Tuple of the pair names and a (pairs, steps) array of rates which is NaN where a pair is missing, or
+                 None when the rates are not columnar
+        """
+        if self.columns is None:
+            return None
+        columns = self.columns["rate"][:, self.step:]
+        self.step = len(self)
+        return self.pairs, columns
+
+    @property
+    def is_random_access(self):
+        return self.cache is not None or self.offsets is not None
+
+    def seek(self, step):
+        """
+        Moves to the record at the given step in constant time.
+
+        :param step: Index of the record returned next
+        """
+        if not self.is_random_access:
+            raise self.NotIndexedError("Seeking requires preloaded or indexed rates")
+        if not 0 <= step <= len(self):
+            raise IndexError("Step {} is out of range [0, {}]".format(step, len(self)))
+        self.step = step
+        if self.cache is None and self.columns is None:
+            self.stream.seek(int(self.offsets[step]))
 
     def reset(self):
         self.stream.seek(0)
-        self.cache_idx = 0
+        self.step = 0
 
     def lookahead(self):
         return InterimLookahead(self)
 
+    def _index(self, index_path, columnar):
+        size = self.stream.seek(0, SEEK_END)
+        if index_path is None or not self._load_index(index_path, size, columnar):
+            self._build_index(columnar)
+            if index_path is not None:
+                self._save_index(index_path)
+        self.stream.seek(0)
+
+    def _load_index(self, index_path, size, columnar):
+        if not os.path.exists(index_path):
+            return False
+        with np.load(index_path) as data:
+            if data["offsets"][-1] != size or (columnar and "pairs" not in data.files):
+                return False
+            offsets = data["offsets"]
+            pairs = tuple(data["pairs"].tolist()) if "pairs" in data.files else None
+        if pairs is not None:
+            columns = dict()
+            for f in FIELDS:
+                path = _column_path(index_path, f)
+                if not os.path.exists(path):
+                    return False
+                columns[f] = np.load(path, mmap_mode='r')
+                if columns[f].shape != (len(pairs), len(offsets) - 1):
+                    return False
+            self.pairs, self.columns = pairs, columns
+        self.offsets = offsets
+        return True
+
+    def _build_index(self, columnar):
+        self.stream.seek(0)
+        offsets = []
+        columns = _ColumnBuilder() if columnar else None
+        while True:
+            offsets.append(self.stream.tell())
+            line = self.stream.readline()
+            if line == "":
+                break
+            if columnar:
+                columns.add(len(offsets) - 1, _parse_line(line))
+
+        self.offsets = np.array(offsets, dtype=np.int64)
+        if columnar:
+            self.pairs, self.columns = columns.finish(len(offsets) - 1)
+
+    def _save_index(self, index_path):
+        arrays = {"offsets": self.offsets}
+        for f in FIELDS:
+            path = _column_path(index_path, f)
+            if self.columns is not None:
+                _save_atomic(path, np.save, self.columns[f])
+            elif os.path.exists(path):
+                os.remove(path)
+        if self.columns is not None:
+            arrays.update(pairs=np.array(self.pairs, dtype=str))
+        _save_atomic(index_path, np.savez, **arrays)
+
+    class NotIndexedError(TypeError):
+        pass
+
+
+def _column_path(index_path, field):
+    return "{}.{}.npy".format(index_path, field)
+
+
+def _save_atomic(path, save_fn, *args, **kwargs):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        save_fn(f, *args, **kwargs)
+    os.replace(tmp, path)
+
+
+class _ColumnBuilder:
+    """
+    Streams parsed records into preallocated (pairs, steps) arrays per field. The entries are buffered in chunks
+    which are scattered into the arrays at once, and the arrays double in size whenever a chunk exceeds them.
+    """
+    CHUNK = 1 << 16
+
+    def __init__(self):
+        self.pairs = dict()
+        self.columns = {f: np.full((8, 1024), np.nan) for f in FIELDS}
+        self._chunk = []
+
+    def add(self, step, infos):
+        for info in infos:
+            p = self.pairs.setdefault(info["pair"], len(self.pairs))
+            self._chunk.append((p, step) + tuple(float(info[k]) for k in INFO_KEYS))
+        if len(self._chunk) >= self.CHUNK:
+            self._flush()
+
+    def finish(self, steps):
+        self._flush()
+        return tuple(self.pairs), {f: c[:len(self.pairs), :steps] for f, c in self.columns.items()}
+
+    def _flush(self):
+        if len(self._chunk) == 0:
+            return
+        a = np.array(self._chunk)
+        self._chunk = []
+        pairs, steps = a[:, 0].astype(np.int64), a[:, 1].astype(np.int64)
+        self._reserve(len(self.pairs), steps[-1] + 1)
+        for i, f in enumerate(FIELDS):
+            self.columns[f][pairs, steps] = a[:, 2 + i]
+
+    def _reserve(self, pairs, steps):
+        rows, cols = self.columns["rate"].shape
+        if pairs <= rows and steps <= cols:
+            return
+        while rows < pairs:
+            rows *= 2
+        while cols < steps:
+            cols *= 2
+        for f, c in self.columns.items():
+            grown = np.full((rows, cols), np.nan)
+            grown[:c.shape[0], :c.shape[1]] = c
+            self.columns[f] = grown
+
 
 class InterimLookahead:
     def __init__(self, rates):
         self.rates = rates
-        self.cache_idx = None
+        self.step = None
         self.seek_offset = None
 
     def __enter__(self):
-        if self.rates.cache is not None:
-            self.cache_idx = self.rates.cache_idx
-        else:
+        self.step = self.rates.step
+        if not self.rates.is_random_access:
             self.seek_offset = self.rates.stream.seek(0, SEEK_CUR)
 
         return self.rates
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if self.cache_idx is not None:
-            self.rates.cache_idx = self.cache_idx
+        if self.seek_offset is None:
+            self.rates.seek(self.step)
         else:
             self.rates.stream.seek(self.seek_offset)
+            self.rates.step = self.step
 
 
 def interim_lookahead(rates):
     return rates.lookahead()
-
-
@@ -1,9 +1,13 @@
 import csv
-from decimal import Decimal
-from io import SEEK_CUR
+import warnings
+from itertools import chain
+
+import numpy as np
 
 
 class RatesPair:
+    __slots__ = ("open", "high", "low", "close", "volume", "rate", "fee")
+
     def __init__(self, open, high, low, close, volume):
         self.open = open
         self.high = high
@@ -41,6 +45,20 @@ class Symbol:
     def _is_header(columns):
         return columns[0] == "timestamp"
 
+    def read_columns(self):
+        """
+        Parses all remaining rows of the stream at once.
+
+        :return: Tuple of an (n, 4) array of open, high, low and close prices and an (n,) array of volumes
+        """
+        lines = iter(self.stream)
+        first = next(lines, "")
+        rows = lines if first.startswith("timestamp") else chain([first], lines)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)
+            data = np.loadtxt(rows, delimiter=",", usecols=range(1, 6), ndmin=2)
+        return data[:, 0:4], data[:, 4].astype(np.int64)
+
     def seek(self, *args, **kwargs):
         return self.stream.seek(*args, **kwargs)
 
@@ -51,12 +69,32 @@ class IdentitySymbol:
 
 
 class ShareRates:
+    """
+    Exchange rates between two symbols, or between a symbol and its currency when only one symbol is given. The
+    symbol streams are parsed once into NumPy columns and the rates of both directions are computed as array
+    divisions. Iterating hands out the rates of one row at a time.
+
+    :param symbol_stream: Symbol providing the prices of the first token
+    :param second_symbol_stream: Symbol providing the prices of the second token, defaults to the currency
+    """
+    FIAT_TAG = "CURRENCY"
+
     def __init__(self, symbol_stream, second_symbol_stream=None):
         self.symbol_stream = symbol_stream
         self.second_symbol_stream = second_symbol_stream
-        self.rates = [r for r in self.StreamIterator(symbol_stream, second_symbol_stream)]
+        prices_a, volumes_a = symbol_stream.read_columns()
+        if second_symbol_stream is not None:
+            prices_b, volumes_b = second_symbol_stream.read_columns()
+            name_b = second_symbol_stream.name
+        else:
+            prices_b, volumes_b, name_b = np.ones_like(prices_a), volumes_a, self.FIAT_TAG
+
+        self.size = min(len(prices_a), len(prices_b))
+        prices_a, prices_b = prices_a[:self.size], prices_b[:self.size]
+        self.pairs = (symbol_stream.name + "_" + name_b, name_b + "_" + symbol_stream.name)
+        self.prices = np.stack([prices_a / prices_b, prices_b / prices_a])
+        self.volumes = np.stack([volumes_a[:self.size], volumes_b[:self.size]])
         self.cursor = 0
-        self.size = len(self.rates)
 
     def __iter__(self):
         return self
@@ -65,9 +103,20 @@ class ShareRates:
         if self.cursor == self.size:
             raise StopIteration
 
-        r = self.rates[self.cursor]
+        i = self.cursor
         self.cursor += 1
-        return r
+        return {pair: RatesPair(*self.prices[k, i].tolist(), int(self.volumes[k, i]))
+                for k, pair in enumerate(self.pairs)}
+
+    def rate_columns(self):
+        """
+        Consumes the remaining rows at once.
+
+        :return: Tuple of the pair names and a (pairs, steps) array of their rates
+        """
+        columns = self.prices[:, self.cursor:, 0]
+        self.cursor = self.size
+        return self.pairs, columns
 
     def reset(self):
         self.cursor = 0
@@ -75,37 +124,6 @@ class ShareRates:
     def lookahead(self):
         return InterimLookahead(self)
 
-    class StreamIterator:
-        FIAT_TAG = "CURRENCY"
-
-        def __init__(self, symbol_stream, second_symbol_stream):
-            self.symbol_stream = symbol_stream
-            self.second_symbol_stream = second_symbol_stream
-
-        def __iter__(self):
-            return self
-
-        def __next__(self):
-            symbol_a, name_a = next(self.symbol_stream), self.symbol_stream.name
-            symbol_b, name_b = self._get_other_symbol(symbol_a[4])
-
-            def calc_rate(t):
-                a, b = t
-                return a / b
-
-            rates = dict()
-            rates[name_a + "_" + name_b] = RatesPair(
-                *map(calc_rate, zip(symbol_a[0:4], symbol_b[0:4])), symbol_a[4])
-            rates[name_b + "_" + name_a] = RatesPair(
-                *map(calc_rate, zip(symbol_b[0:4], symbol_a[0:4])), symbol_b[4])
-            return rates
-
-        def _get_other_symbol(self, volume_a):
-            if self.second_symbol_stream is not None:
-                return next(self.second_symbol_stream), self.second_symbol_stream.name
-            else:
-                return (1, 1, 1, 1, volume_a), self.FIAT_TAG
-
 
 class InterimLookahead:
     def __init__(self, rates):
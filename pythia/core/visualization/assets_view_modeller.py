@@ -32,6 +32,10 @@ class AssetViewModeller:
             for i in range(0, len(self._assets)):
                 self._assets[i] /= np.sum(self._assets[i])
 
+    @classmethod
+    def from_metrics(cls, reader, use_zero_cash=False, relative_weights=False):
+        return MetricsAssetViewModeller(reader, use_zero_cash, relative_weights)
+
     def __iter__(self):
         return self
 
@@ -39,10 +43,38 @@ class AssetViewModeller:
         self._cursor += 1
         if self._cursor == len(self):
             raise StopIteration
-        return self._prices[self._cursor], self._assets[self._cursor]
+        return self._row(self._cursor)
+
+    def _row(self, i):
+        return self._prices[i], self._assets[i]
 
     def __len__(self):
         return self._size
 
     class MismatchError(AssertionError):
         pass
+
+
+class MetricsAssetViewModeller(AssetViewModeller):
+    """
+    Asset view of a recording read by a MetricsReader. The series of an asset is assembled chunk by chunk from the
+    memory mapped recording when the asset is reached, so only one series is held in memory at a time.
+    """
+
+    def __init__(self, reader, use_zero_cash=False, relative_weights=False):
+        self._reader = reader
+        self._use_zero_cash = use_zero_cash
+        self._relative_weights = relative_weights
+        self._cursor = -1
+        first = next(reader.chunks("assets"), None)
+        self._size = 0 if first is None else first.shape[1] - (1 if relative_weights else 0)
+
+    def _row(self, i):
+        asset = i + 1 if self._relative_weights else i
+        prices = np.concatenate([y[:, asset] for y in self._reader.chunks("last_y")])
+        if asset == 0:
+            prices = np.zeros_like(prices) if self._use_zero_cash else np.ones_like(prices)
+        weights = np.concatenate([a[:, asset] / np.sum(a, axis=1) for a in self._reader.chunks("assets")])
+        if self._relative_weights:
+            weights /= np.sum(weights)
+        return prices, weights
@@ -0,0 +1,115 @@
+import argparse
+import time
+
+import numpy as np
+
+from pythia.core.agents.fpm_agent import FpmAgent
+from pythia.core.agents.fpm_memory import FPMMemory, PrefetchingMemory
+from pythia.core.utils.profiling import clock_block
+
+
+def make_config(window, size, coins, dtype, storage="window"):
+    return {"training": {"window": window, "size": size, "beta": 5e-5, "dtype": dtype, "storage": storage},
+            "trading": {"coins": ["SYM{}".format(i) for i in range(coins)]}}
+
+
+def make_filled_memory(cfg, periods):
+    coins = len(cfg["trading"]["coins"])
+    memory = FPMMemory(cfg)
+    prices = np.random.random_sample((periods, coins, 3)) + 0.5
+    portfolios = np.random.random_sample((periods, coins + 1))
+    memory.record_many(prices, portfolios)
+    return memory
+
+
+def as_fed(*arrays):
+    # TensorFlow casts every fed array to the float32 placeholders, so the cast is part of the feed cost
+    return [np.asarray(a, dtype=np.float32) for a in arrays]
+
+
+def feed_step(memory, batch_size):
+    b = memory.get_random_batch(batch_size)
+    as_fed(b.prices, b.weights, b.future)
+    prices, portfolio = memory.get_latest()
+    as_fed(np.expand_dims(prices, axis=0), np.expand_dims(portfolio, axis=0))
+
+
+def benchmark_feed(window, size, coins, batch_size, steps):
+    for dtype in ["float64", "float32"]:
+        memory = make_filled_memory(make_config(window, size, coins, dtype), size)
+        with clock_block("{} feed of {} steps".format(dtype, steps)):
+            for _ in range(steps):
+                feed_step(memory, batch_size)
+
+
+class StubAnn:
+    """Stands in for the CNNEnsemble so only the memory side of an agent step is measured"""
+
+    def __init__(self, assets, train_seconds=0.0):
+        self._assets = assets
+        self._train_seconds = train_seconds
+
+    def predict(self, prices, previous_omega):
+        return np.full(self._assets + 1, 1.0 / (self._assets + 1))
+
+    def train(self, states, future_prices):
+        prices, _ = states
+        if self._train_seconds > 0:
+            time.sleep(self._train_seconds)
+        return np.random.dirichlet(np.ones(self._assets + 1), len(prices))
+
+
+class SilentLogger:
+    def info(self, msg):
+        pass
+
+
+def update_per_record(memory, batch):
+    storage = memory._storage
+    for w_idx, i in enumerate(range(batch.index + 1, batch.index + batch.size + 1)):
+        storage[i].portfolio = batch.predictions[w_idx][1:]
+
+
+def benchmark_agent_step(window, size, coins, batch_size, steps):
+    cfg = make_config(window, size, coins, "float32")
+    cfg["setup"] = {"initial_portfolio": [1.0] + [0.0] * coins}
+    cfg["training"]["batch_size"] = batch_size
+    prices = np.random.random_sample((steps, coins, 3)) + 0.5
+    for name, update in [("per record", update_per_record), ("batched", None)]:
+        memory = make_filled_memory(cfg, size)
+        if update is not None:
+            memory.update = lambda b, m=memory: update(m, b)
+        agent = FpmAgent(StubAnn(coins), memory, None, cfg, SilentLogger())
+        with clock_block("FpmAgent.step with {} write-back of {} steps".format(name, steps)):
+            for p in prices:
+                agent.step(p)
+
+
+def benchmark_prefetch(window, size, coins, batch_size, steps, train_seconds):
+    cfg = make_config(window, size, coins, "float32", "ring")
+    cfg["setup"] = {"initial_portfolio": [1.0] + [0.0] * coins}
+    cfg["training"]["batch_size"] = batch_size
+    prices = np.random.random_sample((steps, coins, 3)) + 0.5
+    for name, wrap in [("without", lambda m: m), ("with", PrefetchingMemory)]:
+        memory = wrap(make_filled_memory(cfg, size))
+        agent = FpmAgent(StubAnn(coins, train_seconds), memory, None, cfg, SilentLogger())
+        with clock_block("FpmAgent.step {} prefetch of {} steps".format(name, steps)):
+            for p in prices:
+                agent.step(p)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the per step cost of feeding FPM memory batches")
+    parser.add_argument("--window", type=int, default=31)
+    parser.add_argument("--size", type=int, default=10000)
+    parser.add_argument("--coins", type=int, default=9)
+    parser.add_argument("--batch_size", type=int, default=109)
+    parser.add_argument("--steps", type=int, default=2000)
+    parser.add_argument("--train_seconds", type=float, default=0.0005,
+                        help="Time the stubbed network blocks in training without holding the GIL")
+    args = parser.parse_args()
+
+    np.random.seed(0)
+    benchmark_feed(args.window, args.size, args.coins, args.batch_size, args.steps)
+    benchmark_agent_step(args.window, args.size, args.coins, args.batch_size, args.steps)
+    benchmark_prefetch(args.window, args.size, args.coins, args.batch_size, args.steps, args.train_seconds)
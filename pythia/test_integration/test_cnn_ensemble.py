@@ -5,7 +5,7 @@ import shutil
 import numpy as np
 import tensorflow as tf
 
-from pythia.core.agents.cnn_ensamble import DEFAULT_ACTIVATION, CNNEnsemble
+from pythia.core.agents.cnn_ensamble import DEFAULT_ACTIVATION, CNNEnsemble, FrozenEnsemble
 
 
 def layer_config(out_channels, kernel, strides=None, activation=None, padding=None, regularizer=None,
@@ -158,6 +158,24 @@ class CNNEnsembleTests(tf.test.TestCase):
             out = nn.train((np.ones([5, f, m, n]), np.ones([5, m])), np.ones([5, m]))
             assert (5, m + 1) == out.shape
 
+    def test_training_on_multiple_batches_produces_output_for_every_batch(self):
+        f, m, n = 3, 11, 50
+        with self.test_session() as sess:
+            nn = self._make_ensemble_for_setup(sess, m, n)
+            sess.run(tf.global_variables_initializer())
+            out = nn.train_batches((np.ones([4, 5, f, m, n]), np.ones([4, 5, m])), np.ones([4, 5, m]))
+            assert (4, 5, m + 1) == out.shape
+
+    def test_fused_training_and_prediction_produces_outputs_with_the_correct_shape(self):
+        f, m, n = 3, 11, 50
+        with self.test_session() as sess:
+            nn = self._make_ensemble_for_setup(sess, m, n)
+            sess.run(tf.global_variables_initializer())
+            out, a = nn.train_and_predict((np.ones([5, f, m, n]), np.ones([5, m])), np.ones([5, m]),
+                                          (np.ones([f, m, n]), np.ones([m])))
+            assert (5, m + 1) == out.shape
+            assert (m + 1,) == a.shape
+
     def _do_make_test_output_of_cnn(self, f, m, n):
         with self.test_session() as sess:
             nn = self._make_ensemble_for_setup(sess, m, n)
@@ -202,6 +220,22 @@ class CNNEnsembleTests(tf.test.TestCase):
             a = nn.predict(np.ones([f, m, n]), np.ones([m]))
             assert (m + 1,) == a.shape
 
+    def test_frozen_inference_model_predicts_like_the_trained_model(self):
+        f, m, n = 3, 2, 5
+        export_file = os.path.join(os.path.dirname(self.checkpoint_save), "inference.pb")
+        prices, omega = np.random.rand(f, m, n), np.random.rand(m)
+        with self.test_session() as sess:
+            nn = self._make_ensemble_for_setup(sess, m, n)
+            sess.run(tf.global_variables_initializer())
+            expected = nn.predict(prices, omega)
+            nn.export_inference(export_file)
+
+        tf.reset_default_graph()
+        with self.test_session() as sess:
+            frozen = FrozenEnsemble(sess)
+            frozen.restore(export_file)
+            np.testing.assert_allclose(expected, frozen.predict(prices, omega), rtol=1e-6)
+
     def test_save_model(self):
         with self.test_session() as sess:
             nn = self._make_ensemble_for_setup(sess, 1, 2)
@@ -1,11 +1,13 @@
 import os
 import shutil
 
+import numpy as np
 import pytest
 
 from pythia.core.agents.fpm_memory import FPMMemory
 from pythia.tests.fpm_doubles import Prices
-from pythia.tests.fpm_memory_test_functions import assert_states, assert_batch, record, batch, get_stable_batch
+from pythia.tests.fpm_memory_test_functions import assert_states, assert_batch, record, batch, get_stable_batch, \
+    environment_input
 
 
 class FPMMemorySUT(FPMMemory):
@@ -29,6 +31,14 @@ class ConfigBuilder:
         self.cfg["training"]["window"] = value
         return self
 
+    def storage(self, value):
+        self.cfg["training"]["storage"] = value
+        return self
+
+    def dtype(self, value):
+        self.cfg["training"]["dtype"] = value
+        return self
+
 
 @pytest.fixture
 def save_file():
@@ -39,6 +49,15 @@ def save_file():
         shutil.rmtree(d)
 
 
+@pytest.fixture
+def save_directory():
+    directory = os.path.join(os.path.dirname(os.path.realpath(__file__)), "test_data/test_save_memory/point")
+    yield directory
+    d = os.path.dirname(directory)
+    if os.path.exists(d):
+        shutil.rmtree(d)
+
+
 @pytest.fixture
 def default():
     return ConfigBuilder()
@@ -48,21 +67,23 @@ def make_memory(cfg=None):
     return FPMMemorySUT(ConfigBuilder().cfg if cfg is None else cfg)
 
 
-def test_fpm_memory_restores_latest_record(save_file):
-    m_saved = make_memory()
+@pytest.mark.parametrize("storage", ["window", "ring"])
+def test_fpm_memory_restores_latest_record(save_file, storage):
+    m_saved = make_memory(ConfigBuilder().storage(storage).cfg)
     m_saved.record(Prices({"SYM1": {"high": 4.0, "low": 1.0, "close": 1.5}}), [1.0, 0.0])
     m_saved.record(Prices({"SYM1": {"high": 2.5, "low": 1.2, "close": 2.0}}), [1.0, 0.0])
     m_saved.record(Prices({"SYM1": {"high": 2.0, "low": 0.5, "close": 1.0}}), [0.0, 1.0])
     m_saved.save(save_file)
     assert_states([[[2.0, 1.0]], [[2.5, 2.0]], [[1.2, 0.5]]], [1.0], *m_saved.get_latest())
 
-    m_restored = make_memory()
+    m_restored = make_memory(ConfigBuilder().storage(storage).cfg)
     m_restored.restore(save_file)
     assert_states([[[2.0, 1.0]], [[2.5, 2.0]], [[1.2, 0.5]]], [1.0], *m_restored.get_latest())
 
 
-def test_fpm_memory_restores_with_correctly_when_exceeding_capacity(save_file, default):
-    cfg = default.window(1).size(2).cfg
+@pytest.mark.parametrize("storage", ["window", "ring"])
+def test_fpm_memory_restores_with_correctly_when_exceeding_capacity(save_file, default, storage):
+    cfg = default.window(1).size(2).storage(storage).cfg
 
     m_saved = make_memory(cfg)
     record(m_saved, 3)
@@ -74,10 +95,26 @@ def test_fpm_memory_restores_with_correctly_when_exceeding_capacity(save_file, d
     assert_batch(batch(2.0, 3.0), get_stable_batch(m_restored, 1, 11))
 
 
+@pytest.mark.parametrize("storage", ["window", "ring"])
+def test_fpm_memory_converts_restored_float64_memory_to_configured_dtype(save_file, storage):
+    m_saved = make_memory(ConfigBuilder().storage(storage).dtype("float64").cfg)
+    record(m_saved, 3)
+    m_saved.save(save_file)
+
+    m_restored = make_memory(ConfigBuilder().storage(storage).dtype("float32").cfg)
+    m_restored.restore(save_file)
+    prices, portfolio = m_restored.get_latest()
+    assert prices.dtype == np.float32 and portfolio.dtype == np.float32
+    assert_states(*m_saved.get_latest(), prices, portfolio)
+
+
 @pytest.mark.parametrize("saved_cfg, restored_cfg", [
     (ConfigBuilder().size(2).cfg, ConfigBuilder().size(1).cfg),
     (ConfigBuilder().num_symbols(1).cfg, ConfigBuilder().num_symbols(2).cfg),
-    (ConfigBuilder().window(2).cfg, ConfigBuilder().window(3).cfg)
+    (ConfigBuilder().window(2).cfg, ConfigBuilder().window(3).cfg),
+    (ConfigBuilder().storage("ring").size(2).cfg, ConfigBuilder().storage("ring").size(1).cfg),
+    (ConfigBuilder().storage("ring").num_symbols(1).cfg, ConfigBuilder().storage("ring").num_symbols(2).cfg),
+    (ConfigBuilder().storage("ring").window(2).cfg, ConfigBuilder().storage("ring").window(3).cfg)
 ])
 def test_fpm_memory_raises_error_when_restored_memory_does_not_fit_configuration(save_file, saved_cfg, restored_cfg):
     m_saved = make_memory(saved_cfg)
@@ -85,3 +122,60 @@ def test_fpm_memory_raises_error_when_restored_memory_does_not_fit_configuration
     m_restored = make_memory(restored_cfg)
     with pytest.raises(FPMMemory.RestorationError):
         m_restored.restore(save_file)
+
+
+@pytest.mark.parametrize("storage", ["window", "ring"])
+def test_fpm_memory_restores_memory_mapped_directory(save_directory, storage):
+    m_saved = make_memory(ConfigBuilder().storage(storage).cfg)
+    record(m_saved, 5)
+    m_saved.save(save_directory)
+
+    m_restored = make_memory(ConfigBuilder().storage(storage).cfg)
+    m_restored.restore(save_directory)
+    assert_states(*m_saved.get_latest(), *m_restored.get_latest())
+    assert_batch(get_stable_batch(m_saved, 2, 7), get_stable_batch(m_restored, 2, 7))
+
+
+@pytest.mark.parametrize("storage", ["window", "ring"])
+def test_fpm_memory_restored_from_directory_is_paged_in_lazily(save_directory, storage):
+    m_saved = make_memory(ConfigBuilder().storage(storage).cfg)
+    record(m_saved, 5)
+    m_saved.save(save_directory)
+
+    m_restored = make_memory(ConfigBuilder().storage(storage).cfg)
+    m_restored.restore(save_directory)
+    assert isinstance(m_restored._storage.symbs_matrix, np.memmap)
+
+
+@pytest.mark.parametrize("storage", ["window", "ring"])
+def test_fpm_memory_incremental_checkpoints_persist_all_changes(save_directory, storage):
+    cfg = ConfigBuilder().storage(storage).size(4).cfg
+    m_saved = make_memory(cfg)
+    record(m_saved, 3)
+    m_saved.save(save_directory)
+    m_continued = make_memory(cfg)
+    m_continued.restore(save_directory)
+    for i in range(4, 7):
+        m_continued.record(*environment_input(i))
+    b = get_stable_batch(m_continued, 2, 1)
+    b.predictions = [[0.5, 0.5]] * 2
+    m_continued.update(b)
+    m_continued.save(save_directory)
+
+    m_restored = make_memory(cfg)
+    m_restored.restore(save_directory)
+    assert_states(*m_continued.get_latest(), *m_restored.get_latest())
+    for seed in range(3):
+        assert_batch(get_stable_batch(m_continued, 2, seed), get_stable_batch(m_restored, 2, seed))
+
+
+def test_fpm_memory_checkpoint_writes_only_rows_modified_since_last_save(save_directory):
+    cfg = ConfigBuilder().size(10).cfg
+    m = make_memory(cfg)
+    record(m, 3)
+    m.save(save_directory)
+    m.record(*environment_input(4))
+    assert m._storage.dirty['state'].ranges() == [(2, 4)]
+    assert m._storage.dirty['symbs'].ranges() == [(2, 4)]
+    m.save(save_directory)
+    assert m._storage.dirty['state'].ranges() == []
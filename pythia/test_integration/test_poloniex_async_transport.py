@@ -0,0 +1,57 @@
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+from pythia.core.remote.poloniex_async import AsyncPoloniexConnection, HttpTransport
+
+LATENCY = 0.2
+
+
+class ChartHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(LATENCY)
+        query = parse_qs(urlparse(self.path).query)
+        value = len(query["currencyPair"][0])
+        chart = [{"date": int(query["start"][0]), "close": value, "high": value + 1, "low": value - 1}]
+        body = json.dumps(chart).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TelemetryStub:
+    def find_last_chart_ts(self, pair, default):
+        return default
+
+    def write_chart(self, chart):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ChartHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:{}/public".format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def test_prices_of_all_coins_are_fetched_concurrently_from_http_server(server_url):
+    config = {"period": 1800, "start": int(time.time()) - 3 * 1800, "retry": 3}
+    connection = AsyncPoloniexConnection(TelemetryStub(), config, HttpTransport(server_url))
+    begin = time.perf_counter()
+    prices = connection.get_all_next_prices("BTC", ["ETH", "LTC", "DASH"])
+    elapsed = time.perf_counter() - begin
+    assert prices == [{"close": 7, "high": 8, "low": 6}, {"close": 7, "high": 8, "low": 6},
+                      {"close": 8, "high": 9, "low": 7}]
+    assert elapsed < 2 * LATENCY
@@ -4,9 +4,18 @@ from pythia.core.agents.fpm_memory import FPMMemory
 from pythia.tests.fpm_doubles import Prices
 
 
+def assert_stored(expected, actual):
+    expected = np.array(expected)
+    if actual is None or expected.dtype == object:
+        assert (expected == actual).all()
+        return
+    tolerance = 4 * np.finfo(actual.dtype).eps
+    assert np.allclose(expected, actual, rtol=tolerance, atol=0)
+
+
 def assert_states(expected_prices, expected_portfolio, actual_prices, actual_portfolio):
-    assert (np.array(expected_prices) == actual_prices).all()
-    assert (np.array(expected_portfolio) == actual_portfolio).all()
+    assert_stored(expected_prices, actual_prices)
+    assert_stored(expected_portfolio, actual_portfolio)
 
 
 def assert_batch(expected, actual):
@@ -16,9 +25,9 @@ def assert_batch(expected, actual):
         ap, aw, af = a
         assert ep.shape == ap.shape
         assert ew.shape == aw.shape
-        assert (ep == ap).all()
-        assert (ew == aw).all()
-        assert (ef == af).all()
+        assert_stored(ep, ap)
+        assert_stored(ew, aw)
+        assert_stored(ef, af)
 
 
 def environment_input(identifier):
@@ -1,7 +1,8 @@
 import pytest
 from decimal import Decimal
 
-from pythia.core.streams.rates_analytics import RatesExchangeReport, analyze
+from pythia.core.streams.rates_analytics import RatesExchangeReport, analyze, analyze_max_differences
+from pythia.core.streams.shape_shift_rates import ShapeShiftRates
 from pythia.tests.crypto_doubles import RecordsStub, RatesStub, entry
 
 
@@ -70,3 +71,40 @@ def test_report_csv_export():
     assert report.to_csv() == "EXCHANGE,MEAN,SD,MEDIAN,MIN,MAX,DIF\n" \
                               "BTC_ETH,1.267,0.23,1.5,0.3,1.998,-0.2\n" \
                               "LIC_GAME,11.2,12.3456789,12.2,10,20.12,0.3\n"
+
+
+@pytest.fixture
+def records():
+    s = RecordsStub()
+    yield s
+    s.close()
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_exchanges_are_ranked_by_max_difference(records, workers):
+    records.add_record(entry("BTC_ETH", "10"), entry("LIC_GAME", "2")) \
+        .add_record(entry("BTC_ETH", "9"), entry("LIC_GAME", "1")) \
+        .add_record(entry("BTC_ETH", "12")).finish()
+    report = analyze_max_differences(ShapeShiftRates(records, columnar=True), workers)
+    assert str(report) == " EXCHANGE | MAX DIF  |  START  |   END   \n" \
+                          "----------------------------------------\n" \
+                          " LIC_GAME |       0.5|        0|        1\n" \
+                          " BTC_ETH  |       0.1|        0|        1\n"
+    assert report.to_csv() == "EXCHANGE,MAX_DIF,START,END\nLIC_GAME,0.5,0,1\nBTC_ETH,0.1,0,1\n"
+
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_max_differences_start_at_the_current_step(records, columnar):
+    records.add_record(entry("BTC_ETH", "10"), entry("LIC_GAME", "2")) \
+        .add_record(entry("BTC_ETH", "12")) \
+        .add_record(entry("BTC_ETH", "9")).finish()
+    rates = ShapeShiftRates(records, columnar=columnar)
+    next(rates)
+    assert analyze_max_differences(rates).to_csv() == "EXCHANGE,MAX_DIF,START,END\nBTC_ETH,0.25,1,2\n"
+
+
+def test_max_differences_of_exhausted_rates(records):
+    records.add_record(entry("BTC_ETH", "10")).finish()
+    rates = ShapeShiftRates(records, columnar=True)
+    next(rates)
+    assert str(analyze_max_differences(rates)) == ""
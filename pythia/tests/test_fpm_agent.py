@@ -11,8 +11,10 @@ class MemorySpy:
         self.last_record = (PriceStub(), PortfolioStub())
         self.is_ready = True
         self.received_state = None
+        self.received_block = None
         self.received_weights_to_update = None
         self.queried_batch_size = None
+        self.queried_batch_count = None
         self.received_save_file = None
         self.received_restore_file = None
 
@@ -28,6 +30,9 @@ class MemorySpy:
     def record(self, prices, portfolio):
         self.received_state = (prices, portfolio)
 
+    def record_many(self, prices_block, portfolios_block):
+        self.received_block = (prices_block, portfolios_block)
+
     def ready(self):
         return self.is_ready
 
@@ -38,6 +43,11 @@ class MemorySpy:
         self.queried_batch_size = size
         return self.batch
 
+    def get_random_batches(self, count, size):
+        self.queried_batch_count = count
+        self.queried_batch_size = size
+        return self.batch
+
     def update(self, batch):
         self.received_weights_to_update = batch.predictions
 
@@ -54,6 +64,9 @@ class AnnSpy:
         self.training_predictions = None
         self.predicted = None
         self.received_batch = None
+        self.received_batches = None
+        self.received_latest = None
+        self.received_export_file = None
         self.received_save_file = None
         self.received_restore_file = None
 
@@ -71,6 +84,18 @@ class AnnSpy:
         self.received_batch = (states, future_prices)
         return self.training_predictions
 
+    def train_and_predict(self, states, future_prices, latest):
+        self.received_batch = (states, future_prices)
+        self.received_latest = latest
+        return self.training_predictions, self.portfolio
+
+    def train_batches(self, states, future_prices):
+        self.received_batches = (states, future_prices)
+        return self.training_predictions
+
+    def export_inference(self, file):
+        self.received_export_file = file
+
     def save(self, file):
         self.received_save_file = file
 
@@ -240,6 +265,92 @@ def test_agent_does_not_train_on_empty_batches(agent, ann, memory):
     assert ann.received_batch is None
 
 
+def test_agent_trains_on_multiple_batches_in_one_step_when_configured(ann, memory, config, logger, batch_size):
+    config["training"]["batches_per_step"] = 4
+    agent = FpmAgent(ann, memory, lambda: RandomPortfolio(), config, logger)
+    memory.set_batch(make_batch(make_state(1), make_prices(2)))
+    ann.set_training_predictions(make_portfolio(1))
+    agent.step(make_prices())
+    assert memory.queried_batch_count == 4 and memory.queried_batch_size == batch_size
+    assert ann.received_batches == (make_state(1), make_prices(2)) and ann.received_batch is None
+    assert memory.received_weights_to_update == make_portfolio(1)
+
+
+@pytest.fixture
+def fused_agent(ann, memory, config, logger):
+    config["training"]["fused_step"] = True
+    return FpmAgent(ann, memory, lambda: RandomPortfolio(), config, logger)
+
+
+def test_fused_agent_trains_and_predicts_latest_memory_in_one_call(fused_agent, ann, memory):
+    memory.set_batch(make_batch(make_state(1), make_prices(2)))
+    memory.set_last_record(make_prices(3), make_portfolio(3))
+    ann.set_training_predictions(make_portfolio(4))
+    ann.set_predictions(make_portfolio(5))
+    a = fused_agent.step(make_prices())
+    assert ann.received_batch == (make_state(1), make_prices(2))
+    assert ann.received_latest == (make_prices(3), make_portfolio(3))
+    assert ann.predicted is None
+    assert memory.received_weights_to_update == make_portfolio(4)
+    assert a == make_portfolio(5)
+
+
+def test_fused_agent_only_predicts_when_batch_is_empty(fused_agent, ann, memory):
+    memory.set_batch(make_empty_batch())
+    memory.set_last_record(make_prices(3), make_portfolio(3))
+    ann.set_predictions(make_portfolio(5))
+    assert fused_agent.step(make_prices()) == make_portfolio(5)
+    assert ann.received_batch is None and ann.predicted == (make_prices(3), make_portfolio(3))
+
+
+def test_fused_agent_returns_random_actions_when_memory_is_not_ready(fused_agent, ann, memory):
+    memory.set_ready(False)
+    assert fused_agent.step(make_prices()) == RandomPortfolio()
+    assert ann.received_latest is None
+
+
+@pytest.fixture
+def inference_agent(ann, memory, config, logger):
+    return FpmAgent(ann, memory, lambda: RandomPortfolio(), config, logger, learning=False)
+
+
+def test_inference_agent_predicts_without_training(inference_agent, ann, memory):
+    memory.set_last_record(make_prices(1), make_portfolio(1))
+    ann.set_predictions(make_portfolio(2))
+    assert inference_agent.step(make_prices()) == make_portfolio(2)
+    assert ann.received_batch is None and memory.queried_batch_size is None
+
+
+def test_inference_agent_restores_inference_model(inference_agent, ann):
+    inference_agent.restore("restore_directory")
+    assert ann.received_restore_file == os.path.join("restore_directory", inference_agent.inference_file_name)
+
+
+def test_agent_exports_inference_model(agent, ann, logger):
+    agent.export("export_directory")
+    assert ann.received_export_file == os.path.join("export_directory", agent.inference_file_name)
+    assert ann.received_export_file in logger.received_info_logs[0]
+
+
+def test_inference_agent_does_not_export(inference_agent, ann):
+    inference_agent.export("export_directory")
+    assert ann.received_export_file is None
+
+
+def test_agent_preloads_memory_with_initial_portfolio(agent, memory, initial_portfolio):
+    prices = [make_prices(1), make_prices(2)]
+    agent.preload(prices)
+    assert memory.received_block == (prices, [initial_portfolio] * 2)
+
+
+def test_agent_pretrains_on_batches_from_memory(agent, ann, memory):
+    memory.set_batch(make_batch(make_state(1), make_prices(2)))
+    ann.set_training_predictions(make_portfolio(1))
+    agent.pretrain(2)
+    assert ann.received_batch == (make_state(1), make_prices(2))
+    assert memory.received_weights_to_update == make_portfolio(1)
+
+
 def test_agent_saves_model_and_memory(agent, ann, memory):
     path = "save_directory"
     agent.save(path)
@@ -254,6 +365,23 @@ def test_agent_restores_model_and_memory(agent, ann, memory):
     assert memory.received_restore_file == os.path.join(path, agent.memory_file_name)
 
 
+def test_agent_saves_and_restores_memory_mapped_when_configured(ann, memory, config, logger):
+    config["training"]["persistence"] = "mmap"
+    agent = FpmAgent(ann, memory, lambda: RandomPortfolio(), config, logger)
+    agent.save("save_directory")
+    agent.restore("restore_directory")
+    assert memory.received_save_file == os.path.join("save_directory", agent.memory_directory_name)
+    assert memory.received_restore_file == os.path.join("restore_directory", agent.memory_directory_name)
+
+
+def test_agent_configured_memory_mapped_restores_memory_archive_of_older_models(ann, memory, config, logger, tmpdir):
+    config["training"]["persistence"] = "mmap"
+    agent = FpmAgent(ann, memory, lambda: RandomPortfolio(), config, logger)
+    tmpdir.join(agent.memory_file_name).write("")
+    agent.restore(str(tmpdir))
+    assert memory.received_restore_file == os.path.join(str(tmpdir), agent.memory_file_name)
+
+
 def test_info_logs_saving(agent, logger):
     path = "save_directory"
     agent.save(path)
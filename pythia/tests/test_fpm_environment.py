@@ -3,7 +3,7 @@ from collections import deque
 import numpy as np
 import pytest
 
-from pythia.core.environment.fpm_environment import FpmEnvironment, WiggledPrice
+from pythia.core.environment.fpm_environment import FpmEnvironment, WiggledPrice, BatchedFpmEnvironment
 from pythia.tests.fpm_doubles import Prices
 
 
@@ -233,6 +233,16 @@ def test_reward_deducts_commission_fee(env, series, starting_cash):
     assert get_reward(env.step(action([1.0, 0.0]))) == (1 - env.commission) * (1 - env.commission) * starting_cash * 4
 
 
+def test_step_exposes_value_of_deducted_commission(env, series, starting_cash):
+    env.commission = 0.1
+    prep_env_series(env, series, 0.5, 2, 0.1)
+    assert env.last_commission == 0
+    env.step(action([0.0, 1.0]))
+    assert env.last_commission == pytest.approx(env.commission * starting_cash * 4)
+    env.step(action([0.0, 1.0]))
+    assert env.last_commission == 0
+
+
 def test_reward_is_correctly_calculated_with_multiple_assets(config, series, starting_cash):
     config["trading"]["coins"] = ["SYM1", "SYM2"]
     env = FpmEnvironment(series, config)
@@ -281,3 +291,75 @@ def test_wiggle_prices_uses_normal_distributen_to_simulated_spread_based_on_min_
     WiggledPrice(2)(last, next)
     assert (norm.received_args[0] == last).all()
     assert (norm.received_args[1] == (next[:, 1] - next[:, 2]) / 4).all()
+
+
+def random_price_rows(rng, steps, coins):
+    closings = rng.random_sample((steps, coins)) + 0.5
+    return [[[c, c * 1.1, c * 0.9] for c in row] for row in closings]
+
+
+def random_actions(rng, steps, count, assets):
+    return rng.dirichlet(np.ones(assets), (steps, count))
+
+
+def run_single(series, config, actions):
+    env = FpmEnvironment(series, config)
+    env.reset()
+    rewards = [get_reward(env.step(a)) for a in actions]
+    return rewards, env.assets
+
+
+@pytest.fixture
+def multi_config():
+    return {"trading": {"cash_amount": 100, "commission": 0.0025, "coins": ["SYM1", "SYM2", "SYM3"]},
+            "training": {}}
+
+
+def test_batched_environment_matches_single_environments_with_different_commissions(series, multi_config):
+    rng = np.random.RandomState(3)
+    steps, commissions = 20, [0.0, 0.0025, 0.01]
+    series.set_prices(*random_price_rows(rng, steps + 1, 3))
+    actions = random_actions(rng, steps, len(commissions), 4)
+
+    batched = BatchedFpmEnvironment(series, multi_config, len(commissions), commissions=commissions)
+    batched.reset()
+    rewards = np.array([get_reward(batched.step(a)) for a in actions])
+
+    for i, commission in enumerate(commissions):
+        multi_config["trading"]["commission"] = commission
+        expected_rewards, expected_assets = run_single(series, multi_config, actions[:, i])
+        np.testing.assert_allclose(expected_rewards, rewards[:, i], rtol=1e-12)
+        np.testing.assert_allclose(expected_assets, batched.assets[i], rtol=1e-12)
+
+
+def test_batched_environment_is_done_at_the_end_of_the_series(series, multi_config):
+    series.set_prices(*random_price_rows(np.random.RandomState(1), 3, 3))
+    batched = BatchedFpmEnvironment(series, multi_config, 2)
+    batched.reset()
+    hold = np.tile([1.0, 0.0, 0.0, 0.0], (2, 1))
+    assert not batched.step(hold)[2]
+    assert batched.step(hold)[2]
+
+
+def test_batched_environment_raises_an_error_when_time_series_is_empty(series, multi_config):
+    series.set_prices()
+    with pytest.raises(FpmEnvironment.TimeSeriesError):
+        BatchedFpmEnvironment(series, multi_config, 2).reset()
+
+
+def test_batched_environment_wiggles_prices_reproducibly_per_portfolio(series, multi_config):
+    rng = np.random.RandomState(5)
+    series.set_prices(*random_price_rows(rng, 11, 3))
+    actions = random_actions(rng, 10, 3, 4)
+
+    def run(seed):
+        batched = BatchedFpmEnvironment(series, multi_config, 3, price_pows=[None, 1.5, 1.5], seed=seed)
+        batched.reset()
+        return np.array([get_reward(batched.step(a)) for a in actions])
+
+    first, second = run(7), run(7)
+    assert np.array_equal(first, second)
+    assert not np.array_equal(first[:, 1], first[:, 2])
+    multi_config["trading"]["commission"] = 0.0025
+    expected, _ = run_single(series, multi_config, actions[:, 0])
+    np.testing.assert_allclose(expected, first[:, 0], rtol=1e-12)
@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import pytest
 
@@ -39,23 +40,23 @@ def test_time_series_needs_at_least_one_symbol():
 @pytest.mark.parametrize("symbol", [1, 3])
 def test_prices_are_given_in_defined_cash(symbol):
     s = make_series(uniform_data(symbol))
-    assert next(s) == uniform_prices(symbol)
+    assert np.array_equal(next(s), uniform_prices(symbol))
 
 
 def test_produces_correct_high_and_low_values():
     s = make_series(data((1, 2, 3)))
-    assert next(s) == prices((1, 2, 3))
+    assert np.array_equal(next(s), prices((1, 2, 3)))
 
 
 def test_can_handle_multiple_assets():
     s = make_series(uniform_data(1), uniform_data(3))
-    assert next(s) == uniform_prices(1, 3)
+    assert np.array_equal(next(s), uniform_prices(1, 3))
 
 
 def test_can_handle_multiple_series_entries():
     s = make_series(uniform_data(1, 2))
-    assert next(s) == uniform_prices(1)
-    assert next(s) == uniform_prices(2)
+    assert np.array_equal(next(s), uniform_prices(1))
+    assert np.array_equal(next(s), uniform_prices(2))
 
 
 def test_raise_stop_iteration_when_reaching_end_of_series():
@@ -67,8 +68,48 @@ def test_raise_stop_iteration_when_reaching_end_of_series():
 
 def test_can_reset_series():
     s = make_series(uniform_data(1, 2))
-    assert s.reset() == uniform_prices(1)
-    assert next(s) == uniform_prices(2)
+    assert np.array_equal(s.reset(), uniform_prices(1))
+    assert np.array_equal(next(s), uniform_prices(2))
 
-    assert s.reset() == uniform_prices(1)
-    assert next(s) == uniform_prices(2)
+    assert np.array_equal(s.reset(), uniform_prices(1))
+    assert np.array_equal(next(s), uniform_prices(2))
+
+
+def test_series_with_different_lengths_is_truncated_to_the_shortest_symbol():
+    s = make_series(uniform_data(1, 2, 3), uniform_data(4, 5))
+    assert len(s) == 2
+    assert np.array_equal(s.reset(), uniform_prices(1, 4))
+    assert np.array_equal(next(s), uniform_prices(2, 5))
+    with pytest.raises(StopIteration):
+        next(s)
+
+
+def test_yielded_rows_are_read_only_views_of_the_price_block():
+    s = make_series(uniform_data(1, 2))
+    row = next(s)
+    assert np.shares_memory(row, s.prices)
+    with pytest.raises(ValueError):
+        row[0, 0] = 5
+
+
+def test_slice_iterates_over_sub_range_sharing_the_price_block():
+    s = make_series(uniform_data(1, 2, 3, 4))
+    sub = s.slice(1, 3)
+    assert np.shares_memory(sub.prices, s.prices)
+    assert np.array_equal(sub.reset(), uniform_prices(2))
+    assert np.array_equal(next(sub), uniform_prices(3))
+    with pytest.raises(StopIteration):
+        next(sub)
+
+
+def test_series_yields_the_same_prices_as_iterating_the_data_frames():
+    frames = [data(*np.random.RandomState(i).random_sample((5, 3))) for i in range(3)]
+    s = make_series(*frames)
+    for i in range(5):
+        expected = [[f.close[i], f.high[i], f.low[i]] for f in frames]
+        assert np.array_equal(next(s), expected)
+
+
+def test_series_from_prices_requires_close_high_and_low():
+    with pytest.raises(FpmHistoricalSeries.ShapeError):
+        FpmHistoricalSeries.from_prices(np.ones((2, 3, 2)))
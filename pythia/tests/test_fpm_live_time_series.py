@@ -1,7 +1,9 @@
+import pandas as pd
 import pytest
 
 import pythia.core.streams.fpm_time_series as sut
 from pythia.core.streams.fpm_time_series import FpmLiveSeries
+from pythia.core.streams.price_cache import PriceCache
 
 
 def uniform_return(value):
@@ -28,6 +30,9 @@ class ConnectionStub:
             raise TimeoutError
         return self.return_values.get(symbol, uniform_return(0))
 
+    def get_all_next_prices(self, cash, symbols):
+        return [self.get_next_prices(cash, s) for s in symbols]
+
 
 class ConnectionSpy(ConnectionStub):
     def __init__(self):
@@ -184,3 +189,13 @@ def test_reset_returns_price_data_at_start_time_from_records(series, pandas, sta
     pandas.for_pairs(cash, coins[0]).on(start).do_return(2, 3, 1)
     pandas.for_pairs(cash, coins[1]).on(start).do_return(12, 15, 5)
     assert series.reset() == [[2, 3, 1], [12, 15, 5]]
+
+
+def test_reset_returns_price_data_at_start_time_from_current_price_cache(connection, config, tmpdir, start):
+    for i, coin in enumerate(config["coins"]):
+        value = float(i + 1)
+        pd.DataFrame({"timestamp": [start - 1800, start], "close": [0.0, value], "high": [0.0, value * 2],
+                           "low": [0.0, value / 2]}).to_csv(str(tmpdir.join("SYM0_{}.csv".format(coin))), index=False)
+    PriceCache(str(tmpdir), config["cash"], config["coins"]).update()
+    config["training_data_dir"] = str(tmpdir)
+    assert make_series(connection, config).reset() == [[1, 2, 0.5], [2, 4, 1]]
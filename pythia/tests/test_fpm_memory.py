@@ -3,10 +3,10 @@ import time
 import numpy as np
 import pytest
 
-from pythia.core.agents.fpm_memory import FPMMemory
+from pythia.core.agents.fpm_memory import FPMMemory, Storage, DirtyRows, PrefetchingMemory
 from pythia.tests.fpm_doubles import Prices
-from pythia.tests.fpm_memory_test_functions import assert_states, assert_batch, environment_input, batch, record, \
-    get_stable_batch
+from pythia.tests.fpm_memory_test_functions import assert_states, assert_stored, assert_batch, environment_input, batch, \
+    record, get_stable_batch
 
 
 class MemoryTestBuilder:
@@ -31,6 +31,14 @@ class MemoryTestBuilder:
     def beta(self, value):
         self.cfg["training"]["beta"] = value
 
+    @property
+    def storage(self):
+        return self.cfg["training"].get("storage", "window")
+
+    @storage.setter
+    def storage(self, value):
+        self.cfg["training"]["storage"] = value
+
     @property
     def coins(self):
         return self.cfg["trading"]["coins"]
@@ -50,6 +58,9 @@ class MemoryTestBuilder:
     def record(self, prices, portfolio):
         self.memory.record(prices.to_array(), portfolio)
 
+    def record_many(self, prices, portfolios):
+        self.memory.record_many([p.to_array() for p in prices], portfolios)
+
     def get_latest(self):
         return self.memory.get_latest()
 
@@ -74,6 +85,15 @@ def memory():
     return MemoryTestBuilder()
 
 
+def get_stable_random_batches(memory, count, size, seed):
+    np.random.seed(seed)
+    return memory.memory.get_random_batches(count, size)
+
+
+def batch_of(batches, i):
+    return FPMMemory.Batch(batches.prices[i], batches.weights[i], batches.future[i], batches.index[i], batches.size)
+
+
 def identify_state(state):
     prices, _, _ = state
     return int(1.0 / prices[1][0][0])
@@ -247,6 +267,70 @@ def test_portfolio_weight_update_is_clamped_to_record_size(memory):
     memory.update(b)
 
 
+@pytest.mark.parametrize("capacity, n_records, seed", [(100, 40, 3), (7, 12, 1), (7, 12, 5), (7, 30, 2)])
+def test_batch_update_writes_the_same_portfolios_as_updating_each_record(capacity, n_records, seed):
+    cfg = {"training": {"window": 2, "size": capacity, "beta": 0.3}, "trading": {"coins": ["SYM1", "SYM2"]}}
+    batched, single = FPMMemory(cfg), FPMMemory(cfg)
+    for m in (batched, single):
+        for i in range(1, n_records + 1):
+            m.record([[i, i, i], [2 * i, i, i]], [0.5, 0.25, 0.25])
+
+    b = get_stable_batch(batched, 5, seed)
+    b.predictions = np.random.RandomState(seed).random_sample((b.size, 3))
+    batched.update(b)
+    for w_idx, i in enumerate(range(b.index + 1, b.index + b.size + 1)):
+        single._storage[i].portfolio = b.predictions[w_idx][1:]
+
+    rows = min(capacity, n_records)
+    assert np.array_equal(single._storage.symbs_matrix[:rows], batched._storage.symbs_matrix[:rows])
+
+
+@pytest.mark.parametrize("storage", ["window", "ring"])
+def test_random_batches_are_stacked_contiguous_batches(memory, storage):
+    memory.storage = storage
+    memory.window = 2
+    record(memory, 20)
+    b = get_stable_random_batches(memory, 3, 4, 5)
+    assert b.prices.shape == (3, 4, 3, 1, 2) and b.weights.shape == (3, 4, 1) and b.future.shape == (3, 4, 1)
+    for i, index in enumerate(b.index):
+        single = memory.memory._make_batch(index, 4)
+        assert_batch(single, FPMMemory.Batch(b.prices[i], b.weights[i], b.future[i], index, b.size))
+
+
+def test_first_of_random_batches_equals_random_batch_of_the_same_seed(memory):
+    record(memory, 20)
+    assert_batch(get_stable_batch(memory, 3, 11), batch_of(get_stable_random_batches(memory, 1, 3, 11), 0))
+
+
+def test_random_batches_are_empty_when_future_prices_are_unavailable(memory):
+    record(memory, 1)
+    assert memory.memory.get_random_batches(2, 1).empty
+
+
+def test_random_batches_truncate_to_available_records(memory):
+    record(memory, 3)
+    b = get_stable_random_batches(memory, 2, 5, 1)
+    assert b.size == 2 and b.prices.shape[:2] == (2, 2)
+
+
+def test_random_batch_selection_follows_a_geometrically_decaying_distribution(memory):
+    np.random.seed(7)
+    memory.beta = 0.5
+    record(memory, 6)
+    b = memory.memory.get_random_batches(1000, 2)
+    distribution = np.bincount(b.index, minlength=4) / 1000
+    assert pytest.approx([0.125, 0.125, 0.25, 0.5], 0.1) == distribution
+
+
+def test_portfolio_weights_of_multiple_batches_can_be_updated_with_predictions(memory):
+    record(memory, 20)
+    b = get_stable_random_batches(memory, 2, 3, 3)
+    b.predictions = np.zeros((2, 3, 2))
+    memory.update(b)
+    for index in b.index:
+        assert_weights([[0.0]] * 3, memory.memory._make_batch(index + 1, 3).weights)
+
+
 def test_drop_history_when_memory_capacity_is_reached(memory):
     memory.capacity = 2
     record(memory, 3)
@@ -265,7 +349,7 @@ def test_futures_are_calculated_correctly_for_multiple_assets(memory):
     memory.record(p3, [0.0, 0.0, 1.0])
     memory.record(p4, [1.0, 0.0, 0.0])
     b = get_stable_batch(memory, 2, 1)
-    assert (b.future == [[3 / 2, 0.5 / 0.5], [4 / 3, 0.8 / 0.5]]).all()
+    assert_stored([[3 / 2, 0.5 / 0.5], [4 / 3, 0.8 / 0.5]], b.future)
 
 
 def test_the_correct_portfolios_are_returned_for_multiple_assets_in_a_batch(memory):
@@ -283,3 +367,227 @@ def test_the_correct_portfolios_are_returned_for_multiple_assets_in_a_batch(memo
     memory.record(p5, [0.0, 0.5, 0.5])
     b = get_stable_batch(memory, 2, 1)
     assert (b.weights == np.array([[0.0, 1.0], [0.5, 0.0]])).all()
+
+
+def make_filled_storage(capacity, window, n_assets):
+    s = Storage(capacity, 3, n_assets, window)
+    s.state_matrix[:] = 0
+    s.symbs_matrix[:] = 0
+    return s
+
+
+def assert_storages_equal(expected, actual):
+    assert np.array_equal(expected.state_matrix, actual.state_matrix)
+    assert np.array_equal(expected.symbs_matrix, actual.symbs_matrix)
+    assert len(expected) == len(actual)
+    assert expected.offset == actual.offset
+
+
+@pytest.mark.parametrize("capacity, window, n_assets, n_records, n_appended", [
+    (10, 1, 1, 5, 0),
+    (10, 3, 2, 7, 0),
+    (10, 3, 2, 7, 2),
+    (5, 3, 2, 23, 4),
+    (8, 4, 3, 61, 7),
+    (2, 1, 1, 9, 1),
+    (3, 3, 1, 10, 0),
+])
+def test_extending_storage_is_identical_to_appending_each_record(capacity, window, n_assets, n_records, n_appended):
+    rng = np.random.RandomState(3)
+    prices = rng.random_sample((n_records, n_assets, 3)) + 0.5
+    portfolios = rng.random_sample((n_records, n_assets))
+    appended = make_filled_storage(capacity, window, n_assets)
+    extended = make_filled_storage(capacity, window, n_assets)
+    for p, w in zip(prices, portfolios):
+        appended.append(p, w)
+
+    for p, w in zip(prices[:n_appended], portfolios[:n_appended]):
+        extended.append(p, w)
+    extended.extend(prices[n_appended:], portfolios[n_appended:])
+    assert_storages_equal(appended, extended)
+
+
+def test_record_many_returns_the_same_batches_as_recording_one_by_one(memory):
+    inputs = [environment_input(i) for i in range(1, 6)]
+    memory.record_many([p for p, _ in inputs], [w for _, w in inputs])
+    assert_batch(batch(3.0, 4.0, 5.0), get_stable_batch(memory, 2, 7))
+
+
+def test_record_many_raises_data_mismatch_error_when_portfolio_length_does_not_fit(memory):
+    with pytest.raises(FPMMemory.DataMismatchError):
+        memory.record_many([environment_input(1)[0]], [[1.0, 0.0, 0.0]])
+
+
+def test_record_many_raises_data_mismatch_error_when_amount_of_records_does_not_match(memory):
+    with pytest.raises(FPMMemory.DataMismatchError):
+        memory.record_many([environment_input(1)[0]] * 2, [[1.0, 0.0]])
+
+
+def make_memory(storage, window, capacity, coins):
+    return FPMMemory({"training": {"window": window, "size": capacity, "beta": 0.3, "storage": storage},
+                      "trading": {"coins": coins}})
+
+
+@pytest.mark.parametrize("window, capacity, n_records", [
+    (1, 20, 10),
+    (3, 20, 15),
+    (5, 41, 40),
+    (1, 4, 17),
+])
+def test_ring_storage_produces_the_same_states_as_window_storage(window, capacity, n_records):
+    coins = ["SYM1", "SYM2"]
+    rng = np.random.RandomState(5)
+    prices = rng.random_sample((n_records, len(coins), 3)) + 0.5
+    portfolios = rng.random_sample((n_records, len(coins) + 1))
+    window_memory = make_memory("window", window, capacity, coins)
+    ring_memory = make_memory("ring", window, capacity, coins)
+    for p, w in zip(prices, portfolios):
+        window_memory.record(p, w)
+    ring_memory.record_many(prices, portfolios)
+
+    assert_states(*window_memory.get_latest(), *ring_memory.get_latest())
+    for seed in range(5):
+        assert_batch(get_stable_batch(window_memory, 4, seed), get_stable_batch(ring_memory, 4, seed))
+
+
+def test_ring_storage_keeps_every_price_only_once():
+    window_memory = make_memory("window", 31, 1000, ["SYM1"])
+    ring_memory = make_memory("ring", 31, 1000, ["SYM1"])
+    window_bytes = sum(a.nbytes for a in window_memory._storage._numpy_data.values())
+    ring_bytes = sum(a.nbytes for a in ring_memory._storage._numpy_data.values())
+    assert ring_bytes * 10 < window_bytes
+
+
+@pytest.mark.parametrize("storage", ["window", "ring"])
+def test_memory_stores_float32_by_default(memory, storage):
+    memory.storage = storage
+    record(memory, 3)
+    b = get_stable_batch(memory, 2, 7)
+    assert b.prices.dtype == np.float32 and b.weights.dtype == np.float32 and b.future.dtype == np.float32
+
+
+@pytest.mark.parametrize("storage", ["window", "ring"])
+def test_memory_stores_configured_dtype(memory, storage):
+    memory.storage = storage
+    memory.cfg["training"]["dtype"] = "float64"
+    record(memory, 3)
+    b = get_stable_batch(memory, 2, 7)
+    assert b.prices.dtype == np.float64 and b.weights.dtype == np.float64 and b.future.dtype == np.float64
+
+
+def test_raise_error_when_configured_storage_is_unknown(memory):
+    memory.storage = "unknown"
+    with pytest.raises(FPMMemory.UnknownStorageError):
+        memory.ready()
+
+
+def test_dirty_rows_merge_overlapping_and_adjacent_ranges():
+    dirty = DirtyRows()
+    dirty.mark(5, 7)
+    dirty.mark(0, 2)
+    dirty.mark(7, 9)
+    dirty.mark(1, 3)
+    assert dirty.ranges() == [(0, 3), (5, 9)]
+
+
+@pytest.mark.parametrize("index, expected", [
+    (3, [(3, 4)]),
+    (slice(2, 5), [(2, 5)]),
+    ([8, 9, 0, 1], [(0, 2), (8, 10)]),
+])
+def test_dirty_rows_are_marked_by_storage_indices(index, expected):
+    dirty = DirtyRows()
+    dirty.mark_index(index)
+    assert dirty.ranges() == expected
+
+
+def test_cleared_dirty_rows_are_empty():
+    dirty = DirtyRows()
+    dirty.mark(0, 4)
+    dirty.clear()
+    assert dirty.ranges() == []
+
+
+def make_prefetching_memory(records):
+    m = PrefetchingMemory(FPMMemory({"training": {"window": 2, "size": 100, "beta": 0.3},
+                                     "trading": {"coins": ["SYM1"]}}))
+    for i in range(1, records + 1):
+        record_input(m, i)
+    return m
+
+
+def record_input(memory, identifier):
+    prices, portfolio = environment_input(identifier)
+    memory.record(prices.to_array(), portfolio)
+
+
+def sample_training_steps(memory, steps, count=None):
+    indices = list()
+    for i in range(steps):
+        b = memory.get_random_batch(3) if count is None else memory.get_random_batches(count, 3)
+        b.predictions = np.zeros(np.shape(b.weights)[:-1] + (2,))
+        memory.update(b)
+        record_input(memory, 100 + i)
+        indices.append(np.array(b.index).tolist())
+    return indices
+
+
+@pytest.mark.parametrize("count", [None, 3])
+def test_prefetching_memory_is_reproducible_with_a_fixed_seed(count):
+    np.random.seed(5)
+    first = sample_training_steps(make_prefetching_memory(20), 10, count)
+    np.random.seed(5)
+    second = sample_training_steps(make_prefetching_memory(20), 10, count)
+    assert first == second
+
+
+@pytest.mark.parametrize("count", [None, 2])
+def test_prefetched_batches_contain_the_current_memory_content(count):
+    np.random.seed(3)
+    m = make_prefetching_memory(20)
+    sample_training_steps(m, 2, count)
+    b = m.get_random_batch(3) if count is None else m.get_random_batches(count, 3)
+    expected = m._memory.make_batch(b.index, 3)
+    assert np.array_equal(expected.prices, b.prices)
+    assert np.array_equal(expected.weights, b.weights)
+    assert np.array_equal(expected.future, b.future)
+
+
+def test_prefetching_memory_samples_synchronously_when_batch_request_changes():
+    np.random.seed(3)
+    m = make_prefetching_memory(20)
+    m.get_random_batch(3)
+    b = m.get_random_batches(2, 4)
+    assert b.prices.shape[:2] == (2, 4)
+
+
+def test_prefetching_memory_returns_empty_batches_until_future_prices_are_available():
+    m = make_prefetching_memory(2)
+    assert m.get_random_batch(3).empty
+    record_input(m, 3)
+    assert not m.get_random_batch(3).empty
+
+
+@pytest.mark.parametrize("count", [None, 2])
+def test_prefetched_batches_equal_freshly_gathered_batches_across_wraps(count):
+    np.random.seed(11)
+    m = PrefetchingMemory(FPMMemory({"training": {"window": 1, "size": 6, "beta": 0.3},
+                                     "trading": {"coins": ["SYM1"]}}))
+    for i in range(1, 4):
+        record_input(m, i)
+    for i in range(4, 40):
+        b = m.get_random_batch(2) if count is None else m.get_random_batches(count, 2)
+        fresh = m._memory.make_batch(b.index, b.size)
+        assert np.array_equal(b.prices, fresh.prices)
+        assert np.array_equal(b.weights, fresh.weights)
+        assert np.array_equal(b.future, fresh.future)
+        record_input(m, i)
+
+
+def test_prefetched_batch_is_discarded_when_memory_changed_again():
+    m = make_prefetching_memory(20)
+    m.get_random_batch(3)
+    record_input(m, 21)
+    record_input(m, 22)
+    b = m.get_random_batch(3)
+    assert np.array_equal(b.future, m._memory.make_batch(b.index, b.size).future)
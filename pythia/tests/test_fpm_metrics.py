@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from pythia.core.sessions.fpm_metrics import MetricsRecorder, MetricsReader
+from pythia.core.visualization.assets_view_modeller import AssetViewModeller
+
+
+class EnvironmentStub:
+    def __init__(self, step):
+        self.assets = np.array([1.0, step, 2 * step])
+        self.last_action = np.array([0.5, 0.25, 0.25]) * step
+        self.last_y = np.array([1.0, 2.0, 3.0]) + step
+        self.last_commission = 0.0025 * step
+
+
+@pytest.fixture
+def directory(tmpdir):
+    return str(tmpdir.join("metrics"))
+
+
+def record_steps(recorder, count):
+    envs = [EnvironmentStub(i) for i in range(count)]
+    for env in envs:
+        recorder(env)
+    recorder.flush()
+    return envs
+
+
+def test_empty_recording(directory):
+    MetricsRecorder(directory).flush()
+    reader = MetricsReader(directory)
+    assert len(reader) == 0
+    assert len(reader.column("assets")) == 0
+
+
+@pytest.mark.parametrize("steps,chunk_size", [(5, 10), (10, 5), (11, 5)])
+def test_recorded_columns_are_read_back_in_order(directory, steps, chunk_size):
+    envs = record_steps(MetricsRecorder(directory, chunk_size), steps)
+    reader = MetricsReader(directory)
+    assert len(reader) == steps
+    assert np.array_equal(reader.column("assets"), [e.assets for e in envs])
+    assert np.array_equal(reader.column("actions"), [e.last_action for e in envs])
+    assert np.array_equal(reader.column("last_y"), [e.last_y for e in envs])
+    assert np.array_equal(reader.column("rewards"), [np.dot(e.last_y, e.assets) for e in envs])
+    assert np.array_equal(reader.column("commission"), [e.last_commission for e in envs])
+
+
+def test_full_chunks_are_flushed_while_recording(directory):
+    recorder = MetricsRecorder(directory, chunk_size=2)
+    for i in range(5):
+        recorder(EnvironmentStub(i))
+    assert len(MetricsReader(directory)) == 4
+    assert [len(c) for c in MetricsReader(directory).chunks("rewards")] == [2, 2]
+
+
+def test_new_recorder_replaces_previous_recording(directory):
+    record_steps(MetricsRecorder(directory, 2), 5)
+    record_steps(MetricsRecorder(directory, 2), 1)
+    assert len(MetricsReader(directory)) == 1
+
+
+def test_reading_an_unknown_column_raises_an_error(directory):
+    with pytest.raises(MetricsReader.UnknownColumnError):
+        MetricsReader(directory).column("unknown")
+
+
+class ChunkedReader(MetricsReader):
+    def column(self, name):
+        raise AssertionError("The whole column of '{}' was loaded".format(name))
+
+
+@pytest.mark.parametrize("use_zero_cash,relative_weights", [(False, False), (True, False), (False, True)])
+def test_asset_view_modeller_reads_recording_chunk_by_chunk(directory, use_zero_cash, relative_weights):
+    envs = record_steps(MetricsRecorder(directory, 3), 4)
+    view = AssetViewModeller.from_metrics(ChunkedReader(directory), use_zero_cash, relative_weights)
+    expected = AssetViewModeller([[e.last_y[i] for e in envs] for i in (1, 2)], [e.assets for e in envs],
+                                 use_zero_cash, relative_weights)
+    assert len(view) == len(expected)
+    rows = list(view)
+    assert len(rows) == len(expected)
+    for (p, w), (ep, ew) in zip(rows, expected):
+        assert np.array_equal(p, ep)
+        assert np.array_equal(w, ew)
+
+
+def test_asset_view_modeller_of_empty_recording_is_empty(directory):
+    MetricsRecorder(directory)
+    assert len(AssetViewModeller.from_metrics(MetricsReader(directory))) == 0
@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+from trainer.fpm_seed_search import SeedSearch
+
+REWARDS = {1: 1.5, 2: 3.0, 3: 2.0}
+
+
+def backtest_stub(config, _, output_directory):
+    with open(os.path.join(output_directory, "threads.txt"), "w") as f:
+        f.write(os.environ["OMP_NUM_THREADS"])
+    return REWARDS[config["setup"]["fixed_seed"]]
+
+
+class LoggerStub:
+    def info(self, msg):
+        pass
+
+    def error(self, msg):
+        pass
+
+
+@pytest.fixture
+def data_dir(tmpdir):
+    directory = tmpdir.mkdir("data")
+    directory.join("BTC_ETH.csv").write("timestamp,open,high,low,close,volume,quoteVolume,weightedAverage\n"
+                                        "1435708800,1,1.1,0.9,1,1,1,1\n"
+                                        "1435710600,2,2.2,1.8,2,1,1,2\n")
+    return str(directory)
+
+
+@pytest.fixture
+def backup_dir(tmpdir):
+    return str(tmpdir.mkdir("backup"))
+
+
+@pytest.fixture
+def seed_file(tmpdir):
+    return str(tmpdir.join("seed.txt"))
+
+
+@pytest.fixture
+def search(data_dir, backup_dir, seed_file):
+    config = {"setup": {}, "trading": {"cash": "BTC", "coins": ["ETH"]}}
+    return SeedSearch(config, data_dir, backup_dir, seed_file, LoggerStub(), workers=2, threads_per_worker=3,
+                      run_fn=backtest_stub)
+
+
+def backups(backup_dir):
+    return sorted(d for d in os.listdir(backup_dir) if d != SeedSearch.WORK_DIRECTORY)
+
+
+def test_search_keeps_only_the_best_run(search, backup_dir):
+    assert sorted(search.run([1, 2, 3])) == [(1, 1.5), (2, 3.0), (3, 2.0)]
+    assert backups(backup_dir) == ["3.0000_2"]
+    assert os.listdir(search.work_directory) == []
+
+
+def test_search_records_all_seeds(search, seed_file):
+    search.run([1, 2, 3])
+    with open(seed_file) as f:
+        assert sorted(f.read().splitlines()) == ["1,1.5", "2,3.0", "3,2.0"]
+
+
+def test_workers_inherit_the_thread_limit(search, backup_dir):
+    previous = os.environ.get("OMP_NUM_THREADS")
+    search.run([2])
+    with open(os.path.join(backup_dir, "3.0000_2", "threads.txt")) as f:
+        assert f.read() == "3"
+    assert os.environ.get("OMP_NUM_THREADS") == previous
+
+
+def test_keeping_a_better_run_removes_the_previous_best(search, backup_dir):
+    for seed, reward in [(1, 1.5), (2, 3.0)]:
+        os.makedirs(search._run_directory(seed))
+        search._keep(seed, reward)
+    assert backups(backup_dir) == ["3.0000_2"]
+
+
+def test_runs_not_beating_the_seed_file_are_discarded(search, backup_dir, seed_file):
+    with open(seed_file, "w") as f:
+        f.write("7,4.5\n\n8,None\n")
+    search.run([1, 2, 3])
+    assert backups(backup_dir) == []
+
+
+def test_best_reward_is_read_from_the_seed_file(search, seed_file):
+    with open(seed_file, "w") as f:
+        f.write("7,2.5\n8,None\n\n9,4.25\n\n")
+    assert search._read_best_reward() == 4.25
+
+
+def test_best_reward_without_seed_file_is_unbounded(search):
+    assert search._read_best_reward() == float("-inf")
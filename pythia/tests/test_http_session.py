@@ -0,0 +1,97 @@
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from pythia.core.remote.http_session import LatencyHistogram, Backoff, PooledSession
+
+
+class RandomSpy:
+    def __init__(self):
+        self.recorded_bounds = []
+
+    def uniform(self, low, high):
+        self.recorded_bounds.append((low, high))
+        return high
+
+
+class ClockStub:
+    def __init__(self, *ticks):
+        self.ticks = list(ticks)
+
+    def __call__(self):
+        return self.ticks.pop(0)
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    ports = set()
+
+    def do_GET(self):
+        EchoHandler.ports.add(self.client_address[1])
+        body = json.dumps({"path": self.path}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    EchoHandler.ports = set()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), EchoHandler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:{}/public".format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def test_latencies_are_counted_in_their_buckets():
+    h = LatencyHistogram([0.1, 1.0])
+    for s in [0.05, 0.1, 0.5, 2.0]:
+        h.observe(s)
+    assert h.counts == [2, 1, 1]
+    assert h.count == 4
+    assert h.mean == pytest.approx(2.65 / 4)
+    assert h.maximum == 2.0
+
+
+def test_empty_histogram_has_zero_mean():
+    assert LatencyHistogram().mean == 0.0
+
+
+def test_describe_lists_only_filled_buckets():
+    h = LatencyHistogram([0.1, 1.0])
+    h.observe(2.0)
+    assert h.describe() == "n=1 mean=2.000s max=2.000s >1.0s:1"
+
+
+def test_backoff_grows_exponentially_until_cap():
+    rng = RandomSpy()
+    backoff = Backoff(base=1, cap=5, rng=rng)
+    assert [backoff.delay(i) for i in range(4)] == [1, 2, 4, 5]
+    assert rng.recorded_bounds == [(0, 1), (0, 2), (0, 4), (0, 5)]
+
+
+def test_pooled_session_records_latency_per_label(server_url):
+    session = PooledSession(clock=ClockStub(0, 0.2, 1, 1.05))
+    assert session.get(server_url, {"command": "a"}, label="chart").json() == {"path": "/public?command=a"}
+    session.get(server_url, label="chart")
+    session.close()
+    assert session.latencies["chart"].count == 2
+    assert session.latencies["chart"].total == pytest.approx(0.25)
+
+
+def test_pooled_session_reuses_connection(server_url):
+    session = PooledSession()
+    for _ in range(5):
+        session.get(server_url)
+    session.close()
+    assert len(EchoHandler.ports) == 1
+    assert session.latencies[server_url].count == 5
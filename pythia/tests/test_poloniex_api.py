@@ -2,7 +2,7 @@ import pytest
 
 import pythia.core.remote.poloniex_api as sut
 from pythia.core.remote.poloniex_api import return_chart_data, InvalidParameterError
-from pythia.tests.fpm_doubles import TimeSpy, RandomStub
+from pythia.core.remote.rate_limiter import TokenBucket
 
 DATE_2019_03_01 = 1551434416
 DATE_2019_04_20 = 1555747496
@@ -52,20 +52,13 @@ class RequestsSpy(RequestsStub):
         return super().get(url, params, **kwargs)
 
 
-class Repeater:
-    def __init__(self, time):
-        self.time = time
-        self.function = None
+class LimiterSpy:
+    def __init__(self, requests):
+        self.requests = requests
+        self.gets_before_acquire = []
 
-    def repeat_in(self, range, interval):
-        for i in range:
-            self.time.set(i * interval)
-            self.function()
-
-
-@pytest.fixture(autouse=True)
-def reset_globals():
-    sut._previous_request_times = []
+    def acquire(self):
+        self.gets_before_acquire.append(self.requests.num_get_calls)
 
 
 @pytest.fixture(autouse=True)
@@ -76,41 +69,6 @@ def requests():
     sut.requests = prev_requests
 
 
-@pytest.fixture(autouse=True)
-def time():
-    prev_time = sut.time
-    sut.time = TimeSpy(0)
-    yield sut.time
-    sut.time = prev_time
-
-
-@pytest.fixture(autouse=True)
-def random():
-    prev_rnd = sut.random
-    sut.random = RandomStub()
-    yield sut.random
-    sut.random = prev_rnd
-
-
-@pytest.fixture
-def repeater(time):
-    return Repeater(time)
-
-
-def milliseconds(v):
-    return v
-
-
-def to_seconds(milliseconds):
-    return milliseconds * 0.001
-
-
-def _make_n_calls(time, interval, range, f, *args, **kwargs):
-    for i in range:
-        time.set(i * interval)
-        f(*args, **kwargs)
-
-
 def test_return_chart_data_creates_well_formatted_http_request(requests):
     return_chart_data("CASH", "SYMBOL", 1800, DATE_2019_03_01, DATE_2019_04_20)
     assert requests.received_get_url == "https://poloniex.com/public"
@@ -151,40 +109,20 @@ def test_return_chart_data_can_be_invoked_without_an_end_date(requests):
                                              "period": 300, "start": A_UNIX_DATE}
 
 
-def test_subsequent_calls_to_chart_data_are_randomly_delayed_minus_the_time_already_expired(requests, random, time):
-    random.last_random_value = milliseconds(42)
-    time.set(0)
-    return_chart_data("CASH", "SYMBOL", 300, A_UNIX_DATE)
-    time.set(to_seconds(10))
-    return_chart_data("CASH", "SYMBOL", 300, A_UNIX_DATE)
-    assert time.recorded_sleeps == [to_seconds(32)]
-
-
-def test_subsequent_calls_are_not_delayed_additionally_when_time_between_calls_exceeds_randomly_selected_delay(requests,
-                                                                                                               random,
-                                                                                                               time):
-    random.last_random_value = milliseconds(42)
-    time.set(0)
-    return_chart_data("CASH", "SYMBOL", 300, A_UNIX_DATE)
-    time.set(to_seconds(42))
-    return_chart_data("CASH", "SYMBOL", 300, A_UNIX_DATE)
-    assert time.recorded_sleeps == []
-
-
-def test_calls_to_chart_data_do_not_exceed_max_calls_per_second(requests, random, time, repeater):
-    random.last_random_value = milliseconds(10)
-    repeater.function = lambda: return_chart_data("CASH", "SYMBOL", 300, A_UNIX_DATE)
+def test_return_chart_data_acquires_a_token_of_the_limiter_before_each_request(requests):
+    limiter = LimiterSpy(requests)
+    return_chart_data("CASH", "SYMBOL", 300, A_UNIX_DATE, limiter=limiter)
+    return_chart_data("CASH", "SYMBOL", 300, A_UNIX_DATE, limiter=limiter)
+    assert limiter.gets_before_acquire == [0, 1]
 
-    repeater.repeat_in(range(0, sut.MAX_CALLS_PER_SECOND), 0.1)
 
-    time.set(sut.MAX_CALLS_PER_SECOND * 0.1)
+def test_return_chart_data_uses_the_shared_limiter_by_default(requests, monkeypatch):
+    limiter = LimiterSpy(requests)
+    monkeypatch.setattr(sut, "shared_limiter", limiter)
     return_chart_data("CASH", "SYMBOL", 300, A_UNIX_DATE)
+    assert limiter.gets_before_acquire == [0]
 
-    repeater.repeat_in(range(sut.MAX_CALLS_PER_SECOND + 1, sut.MAX_CALLS_PER_SECOND * 2), 0.1)
-
-    assert time.recorded_sleeps == [0.6]
-
-    time.set(sut.MAX_CALLS_PER_SECOND * 2 * 0.1)
-    return_chart_data("CASH", "SYMBOL", 300, A_UNIX_DATE)
 
-    assert time.recorded_sleeps == [0.6, 0.6]
+def test_shared_limiter_allows_max_calls_per_second():
+    assert isinstance(sut.shared_limiter, TokenBucket)
+    assert sut.shared_limiter.rate == sut.MAX_CALLS_PER_SECOND
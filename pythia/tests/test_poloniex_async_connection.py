@@ -0,0 +1,156 @@
+import asyncio
+from collections import deque
+
+import pytest
+
+import pythia.core.remote.poloniex_async as sut
+import pythia.core.remote.poloniex_connection as base
+from pythia.core.remote.poloniex_async import AsyncPoloniexConnection, TransportError
+from pythia.core.remote.http_session import Backoff
+from pythia.core.remote.rate_limiter import TokenBucket
+from pythia.tests.fpm_doubles import TimeStub, RandomStub
+
+CHART_KEYS = ("date", "high", "low", "open", "close", "volume", "quoteVolume", "weightedAverage")
+
+
+def uniform_chart(value):
+    return {k: value for k in CHART_KEYS}
+
+
+def prices_from(chart):
+    return {k: chart[k] for k in ("close", "high", "low",)}
+
+
+EMPTY_CHART = [uniform_chart(0)]
+
+
+class TransportSpy:
+    def __init__(self):
+        self.received_params = list()
+        self.returns = dict()
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def set_returns_of(self, pair, *charts):
+        self.returns[pair] = deque(charts)
+
+    async def __call__(self, params):
+        self.received_params.append(params)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        if self.errors > 0:
+            self.errors -= 1
+            raise TransportError("A transport error")
+        pair = params["currencyPair"]
+        charts = self.returns.get(pair)
+        if charts is None or len(charts) == 0:
+            return [uniform_chart(len(pair))]
+        return charts.popleft()
+
+
+class TelemetrySpy:
+    def __init__(self):
+        self.last_chart_ts = dict()
+        self.received_charts = dict()
+
+    def find_last_chart_ts(self, pair, default):
+        return self.last_chart_ts.get(pair, default)
+
+    def write_chart(self, chart):
+        self.received_charts.update(chart)
+
+
+@pytest.fixture
+def config():
+    return {"period": 1800, "start": 1551434400, "retry": 3}
+
+
+@pytest.fixture(autouse=True)
+def time(config):
+    prev_time = sut.time
+    sut.time = base.time = TimeStub(config["start"] + 2 * config["period"])
+    yield sut.time
+    sut.time = base.time = prev_time
+
+
+@pytest.fixture(autouse=True)
+def random():
+    prev_rnd = sut.random
+    sut.random = RandomStub()
+    sut.random.last_random_value = 0
+    yield sut.random
+    sut.random = prev_rnd
+
+
+@pytest.fixture
+def transport():
+    return TransportSpy()
+
+
+@pytest.fixture
+def telemetry():
+    return TelemetrySpy()
+
+
+@pytest.fixture
+def connection(telemetry, config, transport):
+    return AsyncPoloniexConnection(telemetry, config, transport, TokenBucket(1000, 1000), Backoff(0, 0))
+
+
+def test_queries_all_coins_concurrently(connection, transport):
+    connection.get_all_next_prices("CASH", ["SYM1", "SYM2", "SYM3"])
+    assert transport.max_in_flight == 3
+
+
+def test_queries_with_chart_parameters_of_next_period(connection, transport, config):
+    connection.get_all_next_prices("CASH", ["SYM1"])
+    start = config["start"] + config["period"]
+    assert transport.received_params == [{"command": "returnChartData", "currencyPair": "CASH_SYM1",
+                                          "period": config["period"], "start": start, "end": start}]
+
+
+def test_returns_prices_in_order_of_symbols(connection, transport):
+    transport.set_returns_of("CASH_SYM1", [uniform_chart(1)])
+    transport.set_returns_of("CASH_SYM2", [uniform_chart(2)])
+    assert connection.get_all_next_prices("CASH", ["SYM2", "SYM1"]) == [prices_from(uniform_chart(2)),
+                                                                        prices_from(uniform_chart(1))]
+
+
+def test_writes_received_charts_to_telemetry(connection, transport, telemetry):
+    transport.set_returns_of("CASH_SYM1", [uniform_chart(1)])
+    connection.get_all_next_prices("CASH", ["SYM1"])
+    assert telemetry.received_charts == {"CASH_SYM1": {"date": 1, "close": 1, "high": 1, "low": 1}}
+
+
+def test_multiple_charts_are_buffered_per_symbol(connection, transport):
+    transport.set_returns_of("CASH_SYM1", [uniform_chart(1), uniform_chart(2)])
+    connection.get_all_next_prices("CASH", ["SYM1"])
+    assert connection.get_next_prices("CASH", "SYM1") == prices_from(uniform_chart(2))
+    assert len(transport.received_params) == 1
+
+
+def test_transport_errors_are_retried(connection, transport):
+    transport.errors = 2
+    transport.set_returns_of("CASH_SYM1", [uniform_chart(1)])
+    assert connection.get_next_prices("CASH", "SYM1") == prices_from(uniform_chart(1))
+
+
+def test_raises_timeout_error_when_retries_are_exhausted(connection, transport, config):
+    transport.errors = config["retry"]
+    with pytest.raises(AsyncPoloniexConnection.TimeoutError):
+        connection.get_next_prices("CASH", "SYM1")
+
+
+def test_empty_charts_are_queried_again(connection, transport):
+    transport.set_returns_of("CASH_SYM1", EMPTY_CHART, [uniform_chart(1)])
+    assert connection.get_next_prices("CASH", "SYM1") == prices_from(uniform_chart(1))
+    assert len(transport.received_params) == 2
+
+
+def test_raises_no_data_error_when_only_empty_charts_are_returned(connection, transport, config):
+    transport.set_returns_of("CASH_SYM1", *([EMPTY_CHART] * config["retry"]))
+    with pytest.raises(AsyncPoloniexConnection.NoDataError):
+        connection.get_next_prices("CASH", "SYM1")
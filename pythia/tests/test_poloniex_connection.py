@@ -126,9 +126,17 @@ def telemetry():
     return TelemetrySpy()
 
 
+class BackoffStub:
+    def __init__(self, random):
+        self.random = random
+
+    def delay(self, attempt):
+        return self.random.last_random_value
+
+
 @pytest.fixture
-def connection(telemetry, config):
-    return PoloniexConnection(telemetry, config)
+def connection(telemetry, config, random):
+    return PoloniexConnection(telemetry, config, backoff=BackoffStub(random))
 
 
 def assert_random_delayed_repeat(t, a, r, n):
@@ -239,3 +247,17 @@ def test_charts_are_buffered_per_symbol(connection, api):
 def test_reset_resets_the_telemetry_object(connection, telemetry):
     connection.reset()
     assert telemetry.received_reset_call
+
+
+def test_failed_queries_are_retried_with_backoff(connection, api, time, random, config):
+    api.set_to_have_request_error()
+    with pytest.raises(PoloniexConnection.TimeoutError):
+        connection.get_next_prices("CASH", "SYMBOL")
+    assert len(time.recorded_sleeps) == 1 + config["retry"] - 1
+
+
+def test_queries_are_made_with_the_pooled_session_of_the_connection(connection, api, monkeypatch):
+    received = []
+    monkeypatch.setattr(sut, "return_chart_data", lambda *args, **kwargs: received.append(kwargs) or [uniform_chart(1)])
+    connection.get_next_prices("CASH", "SYMBOL")
+    assert received[0]["session"] is connection.session
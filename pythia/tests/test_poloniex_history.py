@@ -1,196 +1,200 @@
-"""
-https://poloniex.com/public?command=returnChartData&currencyPair=BTC_ETH&period=1800&start=1535211000
-[{"date":1535211000,"high":0.04164207,"low":0.04145529,"open":0.04155495,"close":0.04159499,"volume":1.16195203,"quoteVolume":27.94722352,"weightedAverage":0.04157665},{"date":1535212800,"high":0.04159809,"low":0.04151278,"open":0.04159802,"close":0.04151278,"volume":0.28771422,"quoteVolume":6.91684214,"weightedAverage":0.04159618}]
-"""
-import pytest
-import pythia.core.streams.poloniex_history as sut
-
-from pythia.core.streams.poloniex_history import PoloniexHistory
-
-
-class UrlibSpy:
-    class ResultStub:
-        def __init__(self, res):
-            self.res = res
-
-        def read(self):
-            return self.res.encode('UTF-8')
-
-    def __init__(self):
-        self.received_urls = []
-        self.returns = '[{"date":1535211000,"high":0.04164207,"low":0.04145529,"open":0.04155495,"close":0.04159499,"volume":1.16195203,"quoteVolume":27.94722352,"weightedAverage":0.04157665}]'
-
-    def open(self, url):
-        self.received_urls.append(url)
-        return self.ResultStub(self.returns)
+import json
+import os
+import threading
+import time as real_time
+import types
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
 
+import pytest
 
-class FileHandleSpy:
-    def __init__(self, data=None):
-        self.written = None
-        self.data = data
-
-    def __enter__(self):
-        return self
+import pythia.core.streams.poloniex_history as sut
+from pythia.core.remote.rate_limiter import TokenBucket
+from pythia.core.streams.poloniex_history import PoloniexHistory, HEADER
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        pass
+PERIOD = 1800
+START = int(real_time.mktime(real_time.strptime("2015-07-01", "%Y-%m-%d")))
+PERIODS = 25
+NOW = START + (PERIODS - 1) * PERIOD
 
-    def write(self, data):
-        self.written = data
 
-    def readlines(self):
-        return self.data.splitlines()
+def chart_of(date, value):
+    return {"date": date, "high": value + 1, "low": value - 1, "open": value, "close": value, "volume": 1,
+            "quoteVolume": 2, "weightedAverage": value}
 
 
-class FilesSpy:
+class FakePoloniex:
     def __init__(self):
-        self.written_to = None
-        self.appended_to = None
-        self.files = {}
-
-    def open(self, *args):
-        path = args[0]
-        if args[1] == "w":
-            self.written_to = path
-        if args[1] == "a":
-            self.appended_to = path
-
-        if path in self.files:
-            return self.files[path]
+        self.charts = dict()
+        self.received_queries = list()
+        self.failing_starts = set()
+        self.lock = threading.Lock()
 
-        file = FileHandleSpy()
-        self.files[self.written_to] = file
-        return file
+    def set_charts(self, pair, first, count):
+        self.charts[pair] = [chart_of(first + i * PERIOD, i) for i in range(count)]
 
-    def exists(self, path):
-        return path in self.files
+    def respond(self, query):
+        with self.lock:
+            self.received_queries.append(query)
+        start, end = int(query["start"]), int(query["end"])
+        if start in self.failing_starts:
+            return None
+        rates = [c for c in self.charts.get(query["currencyPair"], []) if start <= c["date"] <= end]
+        return rates if len(rates) > 0 else [chart_of(0, 0)]
 
 
-TEST_OUTPUT_DIR = "History/output/"
-
-
-@pytest.fixture(autouse=True)
-def requests():
-    prev = sut.urlopen
-    u = UrlibSpy()
-    sut.urlopen = lambda *args: u.open(args[0])
-    yield u
-    sut.urlopen = prev
+@pytest.fixture
+def poloniex():
+    fake = FakePoloniex()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+            rates = fake.respond(query)
+            if rates is None:
+                self.send_error(500)
+                return
+            body = json.dumps(rates).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True).start()
+    fake.url = "http://127.0.0.1:{}/public".format(server.server_address[1])
+    yield fake
+    server.shutdown()
+    server.server_close()
 
 
 @pytest.fixture(autouse=True)
-def files():
-    prev = sut.os.path.exists
-    f = FilesSpy()
-    sut.open = lambda *args: f.open(*args)
-    sut.os.path.exists = lambda *args: f.exists(args[0])
-    yield f
-    sut.os.path.exists = prev
-    del sut.open
+def time():
+    prev = sut.time
+    sut.time = types.SimpleNamespace(time=lambda: NOW, mktime=real_time.mktime, sleep=lambda s: None)
+    yield sut.time
+    sut.time = prev
 
 
 @pytest.fixture
-def history():
-    return make_history("https://poloniex.test/api", "BTC", ["ETH"], 1800, "2015-07-01")
+def output(tmpdir):
+    return str(tmpdir)
 
 
-def make_history(api, cash, coins, period, start):
-    config = {"trading": {"api": api, "cash": cash, "coins": coins, "period": period, "start": start}}
-    return PoloniexHistory(config, TEST_OUTPUT_DIR, 0)
+def make_history(poloniex, output, coins=("ETH",), chunk_periods=100):
+    config = {"trading": {"api": poloniex.url, "cash": "BTC", "coins": list(coins), "period": PERIOD,
+                          "start": "2015-07-01"}}
+    return PoloniexHistory(config, output, TokenBucket(1000, 1000), chunk_periods=chunk_periods)
 
 
-def make_history_for(coins):
-    return make_history("https://poloniex.test/api", "BTC", coins, 1800, "2015-07-01")
+def output_of(output, coin):
+    return os.path.join(output, f"BTC_{coin}.csv")
 
 
-def url_for(coin):
-    return f"https://poloniex.test/api?command=returnChartData&currencyPair=BTC_{coin}&period=1800&start=1435701600"
+def csv_rows(*charts):
+    return "".join(PoloniexHistory._rate_to_csv(c) + "\n" for c in charts)
 
 
-def output_of(coin):
-    return TEST_OUTPUT_DIR + f"BTC_{coin}.csv"
+def read(path):
+    with open(path) as f:
+        return f.read()
 
 
-def json_from(date, high, low, open, close, volume, quoteVolume, weightedAverage):
-    return f'{{"date":{date},"high":{high},"low":{low},"open":{open},"close":{close},"volume":{volume},"quoteVolume":{quoteVolume},"weightedAverage":{weightedAverage}}}'
+def timestamps_in(path):
+    return [int(line.split(',')[0]) for line in read(path).splitlines()[1:]]
 
 
-def return_string_of(*params):
-    rt = "["
-    rt += ",".join([json_from(*p) for p in params])
-    return rt + "]"
+def test_queries_coin_from_start_when_file_does_not_exist(poloniex, output):
+    make_history(poloniex, output).update()
+    assert poloniex.received_queries == [{"command": "returnChartData", "currencyPair": "BTC_ETH",
+                                          "period": str(PERIOD), "start": str(START), "end": str(NOW)}]
 
 
-def csv_from(date, high, low, open, close, volume, quoteVolume, weightedAverage):
-    return f'{date},{open},{high},{low},{close},{volume},{quoteVolume},{weightedAverage}'
+def test_requests_are_dispatched_for_all_coins(poloniex, output):
+    make_history(poloniex, output, ["ETH", "LTC"]).update()
+    assert sorted(q["currencyPair"] for q in poloniex.received_queries) == ["BTC_ETH", "BTC_LTC"]
 
 
-def csv_string_of(with_header, *params):
-    rt = ""
-    if with_header:
-        rt = "timestamp,open,high,low,close,volume,quoteVolume,weightedAverage\n"
-    rt += "\n".join([csv_from(*p) for p in params])
-    return rt
+def test_new_csv_contains_header_and_returned_data(poloniex, output):
+    poloniex.set_charts("BTC_ETH", START, 2)
+    make_history(poloniex, output).update()
+    assert read(output_of(output, "ETH")) == HEADER + csv_rows(*poloniex.charts["BTC_ETH"])
 
 
-def make_file(data):
-    return FileHandleSpy(data)
+def test_long_ranges_are_requested_in_chunks_and_written_in_order(poloniex, output):
+    poloniex.set_charts("BTC_ETH", START, PERIODS)
+    make_history(poloniex, output, chunk_periods=10).update()
+    windows = sorted((int(q["start"]), int(q["end"])) for q in poloniex.received_queries)
+    assert windows == [(START, START + 9 * PERIOD), (START + 10 * PERIOD, START + 19 * PERIOD),
+                       (START + 20 * PERIOD, NOW)]
+    assert timestamps_in(output_of(output, "ETH")) == [START + i * PERIOD for i in range(PERIODS)]
 
 
-def row_of(time):
-    return time, 0, 0, 0, 0, 0, 0, 0
+def test_existing_data_is_queried_from_last_data_point_and_appended_without_header(poloniex, output):
+    poloniex.set_charts("BTC_ETH", START, PERIODS)
+    existing = HEADER + csv_rows(*poloniex.charts["BTC_ETH"][:3])
+    with open(output_of(output, "ETH"), "w") as f:
+        f.write(existing)
+    make_history(poloniex, output).update()
+    assert poloniex.received_queries[0]["start"] == str(START + 3 * PERIOD)
+    assert read(output_of(output, "ETH")) == HEADER + csv_rows(*poloniex.charts["BTC_ETH"])
 
 
-@pytest.mark.parametrize("test_config,expected", [
-    (("https://poloniex.test/api", "BTC", ["ETH"], 1800, "2015-07-01"),
-     "https://poloniex.test/api?command=returnChartData&currencyPair=BTC_ETH&period=1800&start=1435701600"),
-    (("https://poloniex.test/api/v2", "ETH", ["BTC"], 60, "2016-01-01"),
-     "https://poloniex.test/api/v2?command=returnChartData&currencyPair=ETH_BTC&period=60&start=1451602800"),
-])
-def test_that_queries_coin_from_start_when_file_does_not_exist(test_config, expected, requests):
-    make_history(*test_config).update()
-    assert requests.received_urls[0] == expected
+def test_data_is_appended_on_a_new_line_when_file_does_not_end_with_one(poloniex, output):
+    poloniex.set_charts("BTC_ETH", START, PERIODS)
+    with open(output_of(output, "ETH"), "w") as f:
+        f.write((HEADER + csv_rows(*poloniex.charts["BTC_ETH"][:3])).rstrip("\n"))
+    make_history(poloniex, output).update()
+    assert timestamps_in(output_of(output, "ETH")) == [START + i * PERIOD for i in range(PERIODS)]
 
 
-def test_that_requests_are_dispatched_for_all_coins(requests):
-    make_history_for(["ETH", "LTC"]).update()
-    assert requests.received_urls[0] == url_for("ETH")
-    assert requests.received_urls[1] == url_for("LTC")
+def test_interrupted_update_resumes_after_last_complete_chunk(poloniex, output):
+    poloniex.set_charts("BTC_ETH", START, PERIODS)
+    poloniex.failing_starts.add(START + 10 * PERIOD)
+    with pytest.raises(Exception):
+        make_history(poloniex, output, chunk_periods=10).update()
+    assert timestamps_in(output_of(output, "ETH")) == [START + i * PERIOD for i in range(10)]
 
+    poloniex.failing_starts.clear()
+    make_history(poloniex, output, chunk_periods=10).update()
+    assert timestamps_in(output_of(output, "ETH")) == [START + i * PERIOD for i in range(PERIODS)]
 
-def test_that_a_new_csv_is_written_when_it_does_not_exist_yet(history, requests, files):
-    history.update()
-    assert files.written_to == output_of("ETH")
 
+def test_partially_written_chunk_is_discarded_on_resume(poloniex, output):
+    poloniex.set_charts("BTC_ETH", START, PERIODS)
+    make_history(poloniex, output, chunk_periods=10).update()
+    path = output_of(output, "ETH")
+    complete = read(path)
+    with open(path, "w") as f:
+        f.write(complete[:complete.index(str(START + 12 * PERIOD))])
+    progress = {"BTC_ETH": {"last": START + 9 * PERIOD,
+                            "size": len(HEADER + csv_rows(*poloniex.charts["BTC_ETH"][:10]))}}
+    with open(os.path.join(output, sut.PROGRESS_FILE), "w") as f:
+        json.dump(progress, f)
+    with open(path, "a") as f:
+        f.write("1435")
 
-def test_that_a_new_csv_writes_header_and_returned_data(history, requests, files):
-    requests.returns = return_string_of(
-        (1435701600, 0.04164207, 0.04145529, 0.04155495, 0.04159499, 1.16195203, 27.94722352, 0.04157665),
-        (1435703400, 0.04159809, 0.04151278, 0.04159802, 0.04151278, 0.28771422, 6.91684214, 0.04159618))
-    history.update()
-    assert files.files[files.written_to].written == csv_string_of(True,
-                                                                  (1435701600, 0.04164207, 0.04145529, 0.04155495,
-                                                                   0.04159499, 1.16195203, 27.94722352, 0.04157665),
-                                                                  (1435703400, 0.04159809, 0.04151278, 0.04159802,
-                                                                   0.04151278, 0.28771422, 6.91684214, 0.04159618))
+    make_history(poloniex, output, chunk_periods=10).update()
+    assert read(path) == complete
 
 
-def test_if_data_already_exists_query_from_last_data_point(history, requests, files):
-    files.files[output_of("ETH")] = make_file(csv_string_of(True, row_of(1435701600), row_of(1435703400)))
-    history.update()
-    assert requests.received_urls[0] == \
-           "https://poloniex.test/api?command=returnChartData&currencyPair=BTC_ETH&period=1800&start=1435705200"
+def test_empty_chart_responses_are_not_written(poloniex, output):
+    make_history(poloniex, output).update()
+    assert read(output_of(output, "ETH")) == HEADER
 
 
-def test_if_data_already_exists_append_to_existing_file(history, files):
-    files.files[output_of("ETH")] = make_file(csv_string_of(True, row_of(1435701600), row_of(1435703400)))
-    history.update()
-    assert files.appended_to == output_of("ETH")
+def test_last_line_is_found_across_read_blocks(tmpdir):
+    path = str(tmpdir.join("lines.csv"))
+    with open(path, "w") as f:
+        f.write("header\n" + "".join("{},{}\n".format(i, "x" * 10) for i in range(20)))
+    assert sut._read_last_line(path, block_size=7) == ("19,xxxxxxxxxx", True)
 
 
-def test_if_data_already_exists_append_new_data_to_file_without_header(history, files, requests):
-    files.files[output_of("ETH")] = make_file(csv_string_of(True, row_of(1435701600), row_of(1435703400)))
-    requests.returns = return_string_of(row_of(1435705200))
-    history.update()
-    assert files.files[files.appended_to].written == csv_string_of(False, row_of(1435705200))
+def test_last_line_of_unterminated_file(tmpdir):
+    path = str(tmpdir.join("lines.csv"))
+    with open(path, "w") as f:
+        f.write("header\n1,a\n2,b")
+    assert sut._read_last_line(path) == ("2,b", False)
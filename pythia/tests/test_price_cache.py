@@ -0,0 +1,139 @@
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pythia.core.streams.fpm_time_series import FpmHistoricalSeries
+from pythia.core.streams.price_cache import PriceCache
+
+PERIOD = 1800
+FIRST = 1435708800
+
+
+def write_recording(directory, name, timestamps, seed):
+    closing = np.random.RandomState(seed).random_sample(len(timestamps))
+    df = pd.DataFrame({"timestamp": timestamps, "open": closing, "high": closing * 1.1, "low": closing * 0.9,
+                       "close": closing, "volume": 1.0, "quoteVolume": 1.0, "weightedAverage": closing})
+    df.to_csv(os.path.join(directory, name + ".csv"), index=False)
+
+
+def timeline(count, first=FIRST):
+    return [first + i * PERIOD for i in range(count)]
+
+
+def load_frames(directory, coins, start=None, end=None):
+    frames = []
+    for coin in coins:
+        df = pd.read_csv(os.path.join(directory, "BTC_{}.csv".format(coin)), index_col='timestamp')
+        df.index = pd.to_datetime(df.index, unit='s')
+        frames.append(df[start:end])
+    return frames
+
+
+@pytest.fixture
+def data_dir(tmpdir):
+    for i, coin in enumerate(["ETH", "LTC", "XRP"]):
+        write_recording(str(tmpdir), "BTC_" + coin, timeline(200), i)
+    return str(tmpdir)
+
+
+@pytest.fixture
+def cache(data_dir):
+    return PriceCache(data_dir, "BTC", ["ETH", "LTC", "XRP"])
+
+
+def test_cache_is_not_present_before_update(cache):
+    assert not cache.present()
+    assert not cache.is_current()
+    with pytest.raises(PriceCache.MissingCacheError):
+        cache.load()
+
+
+def test_update_converts_all_recordings_initially(cache):
+    assert cache.update() == ["BTC_ETH", "BTC_LTC", "BTC_XRP"]
+    assert cache.is_current()
+
+
+def test_loaded_prices_equal_the_historical_series_of_the_recordings(cache, data_dir):
+    cache.update()
+    timestamps, prices = cache.load()
+    assert prices.shape == (200, 3, 3)
+    assert np.array_equal(timestamps, timeline(200))
+    assert np.array_equal(prices, FpmHistoricalSeries(*load_frames(data_dir, cache.coins)).prices)
+
+
+@pytest.mark.parametrize("start,end", [("2015-07-01", None), ("2015-07-02", "2015-07-03"), (None, "2015-07-02")])
+def test_selected_range_equals_date_slicing_of_data_frames(cache, data_dir, start, end):
+    cache.update()
+    _, prices = cache.select(start, end)
+    expected = FpmHistoricalSeries(*load_frames(data_dir, cache.coins, start, end)).prices
+    assert np.array_equal(prices, expected)
+
+
+def test_only_changed_recordings_are_converted_again(cache, data_dir):
+    cache.update()
+    write_recording(data_dir, "BTC_LTC", timeline(201), 7)
+    assert not cache.is_current()
+    assert cache.update() == ["BTC_LTC"]
+    assert cache.is_current()
+    assert np.array_equal(cache.load()[1], FpmHistoricalSeries(*load_frames(data_dir, cache.coins)).prices)
+
+
+def test_touched_recordings_with_unchanged_content_are_not_converted(cache, data_dir):
+    cache.update()
+    path = os.path.join(data_dir, "BTC_ETH.csv")
+    os.utime(path, (os.stat(path).st_atime, os.stat(path).st_mtime + 10))
+    assert cache.update() == []
+    assert cache.is_current()
+
+
+def test_coins_are_aligned_on_common_timestamps(data_dir):
+    write_recording(data_dir, "BTC_XRP", timeline(150, FIRST + 50 * PERIOD), 3)
+    cache = PriceCache(data_dir, "BTC", ["ETH", "XRP"])
+    cache.update()
+    timestamps, prices = cache.load()
+    assert np.array_equal(timestamps, timeline(150, FIRST + 50 * PERIOD))
+    eth = load_frames(data_dir, ["ETH"])[0]
+    assert np.array_equal(prices[:, 0], eth[["close", "high", "low"]].values[50:])
+
+
+def test_different_coin_selections_share_converted_recordings(cache, data_dir):
+    cache.update()
+    other = PriceCache(data_dir, "BTC", ["XRP", "ETH"])
+    assert not other.is_current()
+    assert other.update() == []
+    assert np.array_equal(other.load()[1], cache.load()[1][:, [2, 0]])
+    assert cache.is_current()
+
+
+def test_prices_at_returns_prices_of_all_coins_at_timestamp(cache):
+    cache.update()
+    assert np.array_equal(cache.prices_at(FIRST + 3 * PERIOD), cache.load()[1][3])
+    with pytest.raises(KeyError):
+        cache.prices_at(FIRST + 1)
+
+
+def test_manifest_is_not_rewritten_when_nothing_changed(cache):
+    cache.update()
+    manifest = os.path.join(cache.cache_directory, PriceCache.MANIFEST_FILE)
+    os.utime(manifest, (0, 0))
+    assert cache.update() == []
+    assert os.stat(manifest).st_mtime == 0
+
+
+def _update(data_dir):
+    PriceCache(data_dir, "BTC", ["ETH", "LTC", "XRP"]).update()
+
+
+def test_concurrent_updates_do_not_share_temporary_files(cache, data_dir):
+    ctx = multiprocessing.get_context("fork")
+    processes = [ctx.Process(target=_update, args=(data_dir,)) for _ in range(8)]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+    assert [p.exitcode for p in processes] == [0] * 8
+    assert cache.is_current()
+    assert [f for f in os.listdir(cache.cache_directory) if f.endswith(".tmp")] == []
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+
+import pytest
+
+from pythia.core.remote.rate_limiter import TokenBucket
+
+
+class ClockStub:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+class SleepSpy:
+    def __init__(self, clock):
+        self.clock = clock
+        self.recorded_sleeps = []
+
+    def __call__(self, seconds):
+        self.recorded_sleeps.append(seconds)
+        self.clock.t += seconds
+
+
+@pytest.fixture
+def clock():
+    return ClockStub()
+
+
+@pytest.fixture
+def sleep(clock):
+    return SleepSpy(clock)
+
+
+def make_bucket(clock, sleep, rate=4, capacity=None):
+    return TokenBucket(rate, capacity, clock, sleep)
+
+
+def test_rate_needs_to_be_positive(clock, sleep):
+    with pytest.raises(ValueError):
+        make_bucket(clock, sleep, rate=0)
+
+
+def test_burst_up_to_capacity_is_not_delayed(clock, sleep):
+    bucket = make_bucket(clock, sleep, capacity=4)
+    for _ in range(4):
+        bucket.acquire()
+    assert sleep.recorded_sleeps == []
+    assert bucket.throttled_calls == 0
+
+
+def test_calls_exceeding_the_burst_wait_for_the_next_token(clock, sleep):
+    bucket = make_bucket(clock, sleep, capacity=4)
+    for _ in range(6):
+        bucket.acquire()
+    assert sleep.recorded_sleeps == [pytest.approx(0.25), pytest.approx(0.25)]
+
+
+def test_tokens_refill_with_rate_up_to_capacity(clock, sleep):
+    bucket = make_bucket(clock, sleep, capacity=2)
+    bucket.acquire()
+    bucket.acquire()
+    clock.t += 10
+    for _ in range(3):
+        bucket.acquire()
+    assert sleep.recorded_sleeps == [pytest.approx(0.25)]
+
+
+def test_counters_record_calls_throttled_calls_and_wait_time(clock, sleep):
+    bucket = make_bucket(clock, sleep, capacity=1)
+    for _ in range(3):
+        bucket.acquire()
+    assert bucket.calls == 3
+    assert bucket.throttled_calls == 2
+    assert bucket.wait_time == pytest.approx(0.5)
+
+
+def test_waiting_calls_reserve_tokens_in_order(clock, sleep):
+    bucket = make_bucket(clock, sleep, capacity=1)
+    waits = [bucket._reserve() for _ in range(4)]
+    assert waits == [0, pytest.approx(0.25), pytest.approx(0.5), pytest.approx(0.75)]
+
+
+def test_asynchronous_acquire_reserves_from_the_same_bucket(clock, sleep, monkeypatch):
+    bucket = make_bucket(clock, sleep, capacity=1)
+    slept = []
+
+    async def async_sleep(seconds):
+        slept.append(seconds)
+
+    monkeypatch.setattr(asyncio, "sleep", async_sleep)
+
+    async def acquire_all():
+        await asyncio.gather(*[bucket.acquire_async() for _ in range(3)])
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(acquire_all())
+    loop.close()
+    assert sorted(slept) == [pytest.approx(0.25), pytest.approx(0.5)]
+
+
+def test_bucket_is_thread_safe():
+    bucket = TokenBucket(1e6, 1e6)
+
+    def acquire_many():
+        for _ in range(1000):
+            bucket.acquire()
+
+    threads = [threading.Thread(target=acquire_many) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert bucket.calls == 8000
@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+
+from pythia.core.streams.rates_calculators import PairMaxDifference, PairRange, calculate_exchange_ranges, \
+    calculate_exchange_max_differences, max_peak_to_trough
+from pythia.core.streams.shape_shift_rates import ShapeShiftRates
+from pythia.tests.crypto_doubles import RecordsStub, entry
+
+PAIRS = ["A_B", "B_C", "C_D"]
+
+
+@pytest.fixture
+def records():
+    s = RecordsStub()
+    yield s
+    s.close()
+
+
+@pytest.fixture
+def series():
+    return np.random.RandomState(7).uniform(1, 2, (len(PAIRS), 50))
+
+
+def write_series(records, series, missing=None):
+    for step in range(series.shape[1]):
+        records.add_record(*[entry(p, series[i, step]) for i, p in enumerate(PAIRS)
+                             if missing is None or not missing[i, step]])
+    records.finish()
+
+
+def accumulate(rates, make_accumulator):
+    accumulators = dict()
+    for idx, pairs in enumerate(rates):
+        for named_pair in pairs.items():
+            a = make_accumulator(idx, named_pair)
+            if a.name in accumulators:
+                accumulators[a.name].extend(a)
+            else:
+                accumulators[a.name] = a
+    return accumulators
+
+
+def test_max_peak_to_trough_of_single_series():
+    differences, starts, ends = max_peak_to_trough([[2, 4, 3, 5, 1, 6]])
+    assert differences.tolist() == [0.8] and starts.tolist() == [3] and ends.tolist() == [4]
+
+
+def test_max_peak_to_trough_without_drop_is_zero_at_start():
+    differences, starts, ends = max_peak_to_trough([[1, 2, 3], [np.nan, 2, 2]])
+    assert differences.tolist() == [0, 0] and starts.tolist() == [0, 0] and ends.tolist() == [0, 0]
+
+
+def test_max_peak_to_trough_skips_missing_rates():
+    differences, starts, ends = max_peak_to_trough([[np.nan, 4, np.nan, 2, np.nan]])
+    assert differences.tolist() == [0.5] and starts.tolist() == [1] and ends.tolist() == [3]
+
+
+def test_max_peak_to_trough_stops_at_target_difference():
+    differences, starts, ends = max_peak_to_trough([[4, 3, 5, 1]], target_diff=0.2)
+    assert differences.tolist() == [0.25] and starts.tolist() == [0] and ends.tolist() == [1]
+
+
+def test_empty_rates_have_no_ranges(records):
+    records.finish()
+    assert len(calculate_exchange_ranges(ShapeShiftRates(records))) == 0
+    assert len(calculate_exchange_max_differences(ShapeShiftRates(records))) == 0
+
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_ranges_equal_accumulated_pair_ranges(records, series, columnar):
+    missing = np.random.RandomState(3).uniform(size=series.shape) < 0.2
+    write_series(records, series, missing)
+    expected = accumulate(ShapeShiftRates(records), PairRange)
+    records.seek(0)
+    ranges = calculate_exchange_ranges(ShapeShiftRates(records, columnar=columnar))
+    assert len(ranges) == len(PAIRS)
+    for p in PAIRS:
+        e, r = expected[p], ranges[p]
+        assert (r.name, r.min, r.min_position, r.max, r.max_position) == \
+               (e.name, e.min, e.min_position, e.max, e.max_position)
+        assert ranges.normalize_rate(p, e.max) == 1
+
+
+@pytest.mark.parametrize("columnar", [False, True])
+@pytest.mark.parametrize("target_diff", [None, 0.3, 0.6])
+def test_max_differences_equal_accumulated_pair_max_differences(records, series, columnar, target_diff):
+    missing = np.random.RandomState(5).uniform(size=series.shape) < 0.2
+    write_series(records, series, missing)
+    expected = accumulate(ShapeShiftRates(records), lambda i, p: PairMaxDifference(i, p, target_diff))
+    records.seek(0)
+    differences = calculate_exchange_max_differences(ShapeShiftRates(records, columnar=columnar), target_diff)
+    for p in PAIRS:
+        e, d = expected[p], differences[p]
+        assert d.max_difference == pytest.approx(e.max_difference)
+        assert (d.start_position, d.end_position) == (e.start_position, e.end_position)
+        assert (d.min, d.min_position, d.max, d.max_position) == (e.min, e.min_position, e.max, e.max_position)
+
+
+@pytest.mark.parametrize("target_diff", [None, 0, 0.3])
+def test_max_differences_keep_accumulated_extrema_of_many_series(records, target_diff):
+    rng = np.random.RandomState(13)
+    series = rng.randint(1, 6, (40, 12)).astype(float)
+    missing = rng.uniform(size=series.shape) < 0.2
+    missing[:, 0] = False
+    names = ["P{}_X".format(i) for i in range(len(series))]
+    for step in range(series.shape[1]):
+        records.add_record(*[entry(n, series[i, step]) for i, n in enumerate(names) if not missing[i, step]])
+    records.finish()
+    expected = accumulate(ShapeShiftRates(records), lambda i, p: PairMaxDifference(i, p, target_diff))
+    records.seek(0)
+    differences = calculate_exchange_max_differences(ShapeShiftRates(records, columnar=True), target_diff)
+    for n in names:
+        e, d = expected[n], differences[n]
+        assert (d.max_difference, d.start_position, d.end_position) == \
+               pytest.approx((e.max_difference, e.start_position, e.end_position))
+        assert (d.min, d.min_position, d.max, d.max_position) == (e.min, e.min_position, e.max, e.max_position)
+
+
+def test_calculation_consumes_the_rates(records, series):
+    write_series(records, series)
+    rates = ShapeShiftRates(records, columnar=True)
+    next(rates)
+    ranges = calculate_exchange_ranges(rates)
+    assert ranges["A_B"].max == series[0, 1:].max()
+    with pytest.raises(StopIteration):
+        next(rates)
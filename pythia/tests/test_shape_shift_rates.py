@@ -1,9 +1,10 @@
 import io
 
+import numpy as np
 import pytest
 
-from pythia.core.streams.shape_shift_rates import ShapeShiftRates, interim_lookahead
-from pythia.core.streams.rates_calculators import rates_filter
+from pythia.core.streams.shape_shift_rates import FIELDS, ShapeShiftRates, _ColumnBuilder, interim_lookahead
+from pythia.core.streams.rates_calculators import rates_filter, write_filtered_rates, split_rates
 from pythia.tests.crypto_doubles import PairEntryStub, RecordsStub
 
 
@@ -112,6 +113,31 @@ def test_filter_exchange_of_multiple_records(stream):
         next(iter(filtered))
 
 
+def test_filtered_rates_are_written_to_output_stream(stream, out_stream):
+    stream.add_record(entry("ETH_BTC", "1.1", 0.7, 6.2, 0.1, "0.5"),
+                      entry("ETH_1ST", "1.5", 0.1, 4.1, 1.1, "1.9")) \
+          .add_record(entry("ETH_BTC", "1.2", 0.7, 6.2, 0.1, "0.4")).finish()
+    assert write_filtered_rates(ShapeShiftRates(stream), ["ETH_1ST"], out_stream) == 1
+    out_stream.seek(0)
+    filtered = ShapeShiftRates(out_stream)
+    assert next(filtered) == {"ETH_1ST": entry("ETH_1ST", "1.5", 0.1, 4.1, 1.1, "1.9")}
+    with pytest.raises(StopIteration):
+        next(filtered)
+
+
+def test_split_rates_into_several_outputs_in_one_pass(stream):
+    stream.add_record(entry("ETH_BTC", "1.1", 0.7, 6.2, 0.1, "0.5"),
+                      entry("ETH_1ST", "1.5", 0.1, 4.1, 1.1, "1.9")) \
+          .add_record(entry("ETH_BTC", "1.2", 0.7, 6.2, 0.1, "0.4"),
+                      entry("BTC_ETH", "1.0", 0.7, 6.2, 0.1, "0.4")).finish()
+    eth_btc, eth_1st = io.StringIO(), io.StringIO()
+    assert split_rates(ShapeShiftRates(stream), [(["ETH_BTC", "BTC_ETH"], eth_btc), (["ETH_1ST"], eth_1st)]) == [2, 1]
+    eth_btc.seek(0)
+    eth_1st.seek(0)
+    assert [list(p) for p in ShapeShiftRates(eth_btc)] == [["ETH_BTC"], ["ETH_BTC", "BTC_ETH"]]
+    assert [list(p) for p in ShapeShiftRates(eth_1st)] == [["ETH_1ST"]]
+
+
 def test_preloaded(stream):
     stream.add_record(entry("ETH_BTC", "1.1", 0.7, 6.2, 0.1, "0.5"),
                       entry("ETH_1ST", "1.5", 0.1, 4.1, 1.1, "1.9"))\
@@ -146,4 +172,123 @@ def test_interim_look_ahead(stream, should_preload):
         assert next(rates)["ETH_SALT"] == entry("ETH_SALT", 1.2, 0.5, 6.7, 0.3, 0.9)
         assert next(rates)["ETH_SALT"] == entry("ETH_SALT", 1.3, 0.6, 6.3, 0.2, 0.7)
     assert next(rates)["ETH_SALT"] == entry("ETH_SALT", 1.2, 0.5, 6.7, 0.3, 0.9)
-    assert next(rates)["ETH_SALT"] == entry("ETH_SALT", 1.3, 0.6, 6.3, 0.2, 0.7)
\ No newline at end of file
+    assert next(rates)["ETH_SALT"] == entry("ETH_SALT", 1.3, 0.6, 6.3, 0.2, 0.7)
+
+@pytest.fixture
+def three_records(stream):
+    stream.add_record(entry("ETH_SALT", 1.1, 0.7, 6.2, 0.1, 0.5)) \
+        .add_record(entry("ETH_SALT", 1.2, 0.5, 6.7, 0.3, 0.9),
+                    entry("RCN_1ST", 1.52, 0.1, 4.1, 1.1, 1.9)) \
+        .add_record(entry("ETH_SALT", 1.3, 0.6, 6.3, 0.2, 0.7)).finish()
+    return stream
+
+
+class ReadlineCounter(io.StringIO):
+    def __init__(self, text):
+        super().__init__(text)
+        self.count = 0
+
+    def readline(self, *args):
+        self.count += 1
+        return super().readline(*args)
+
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_indexed_rates_seek_to_any_record(three_records, tmpdir, columnar):
+    rates = ShapeShiftRates(three_records, index_path=str(tmpdir.join("rates.idx")), columnar=columnar)
+    assert len(rates) == 3
+    rates.seek(2)
+    assert next(rates)["ETH_SALT"] == entry("ETH_SALT", 1.3, 0.6, 6.3, 0.2, 0.7)
+    rates.seek(1)
+    pairs = next(rates)
+    assert pairs["ETH_SALT"] == entry("ETH_SALT", 1.2, 0.5, 6.7, 0.3, 0.9)
+    assert pairs["RCN_1ST"] == entry("RCN_1ST", 1.52, 0.1, 4.1, 1.1, 1.9)
+    rates.seek(3)
+    with pytest.raises(StopIteration):
+        next(rates)
+
+
+def test_columnar_rates_omit_pairs_missing_in_a_record(three_records):
+    rates = ShapeShiftRates(three_records, columnar=True)
+    assert list(next(rates)) == ["ETH_SALT"]
+    assert rates.pairs == ("ETH_SALT", "RCN_1ST")
+    assert all(rates.columns[f].shape == (2, 3) for f in FIELDS)
+
+
+def test_seek_out_of_range_raises(three_records):
+    rates = ShapeShiftRates(three_records, columnar=True)
+    with pytest.raises(IndexError):
+        rates.seek(4)
+
+
+def test_seek_requires_index(three_records):
+    with pytest.raises(ShapeShiftRates.NotIndexedError):
+        ShapeShiftRates(three_records).seek(1)
+
+
+def test_columnar_look_ahead_does_not_read_stream(three_records):
+    stream = ReadlineCounter(three_records.getvalue())
+    rates = ShapeShiftRates(stream, columnar=True)
+    reads = stream.count
+    next(rates)
+    with interim_lookahead(rates):
+        assert next(rates)["ETH_SALT"] == entry("ETH_SALT", 1.2, 0.5, 6.7, 0.3, 0.9)
+    assert next(rates)["ETH_SALT"] == entry("ETH_SALT", 1.2, 0.5, 6.7, 0.3, 0.9)
+    assert stream.count == reads
+
+
+def test_index_is_loaded_from_sidecar_file(three_records, tmpdir):
+    index_path = str(tmpdir.join("rates.idx"))
+    ShapeShiftRates(three_records, index_path=index_path, columnar=True)
+    stream = ReadlineCounter(three_records.getvalue())
+    rates = ShapeShiftRates(stream, index_path=index_path, columnar=True)
+    assert stream.count == 0
+    rates.seek(2)
+    assert next(rates)["ETH_SALT"] == entry("ETH_SALT", 1.3, 0.6, 6.3, 0.2, 0.7)
+
+
+def test_stale_sidecar_file_is_rebuilt(three_records, tmpdir):
+    index_path = str(tmpdir.join("rates.idx"))
+    ShapeShiftRates(three_records, index_path=index_path)
+    three_records.seek(0, io.SEEK_END)
+    three_records.add_record(entry("ETH_SALT", 1.4, 0.6, 6.3, 0.2, 0.7)).finish()
+    rates = ShapeShiftRates(three_records, index_path=index_path)
+    assert len(rates) == 4
+    rates.seek(3)
+    assert next(rates)["ETH_SALT"] == entry("ETH_SALT", 1.4, 0.6, 6.3, 0.2, 0.7)
+
+
+def test_sidecar_columns_are_memory_mapped_per_field(three_records, tmpdir):
+    index_path = str(tmpdir.join("rates.idx"))
+    ShapeShiftRates(three_records, index_path=index_path, columnar=True)
+    three_records.seek(0)
+    rates = ShapeShiftRates(three_records, index_path=index_path, columnar=True)
+    assert all(isinstance(rates.columns[f], np.memmap) for f in FIELDS)
+    assert tmpdir.join("rates.idx.fee.npy").check()
+    np.testing.assert_array_equal(rates.columns["rate"], [[1.1, 1.2, 1.3], [np.nan, 1.52, np.nan]])
+
+
+def test_rebuilt_plain_index_removes_stale_field_files(three_records, tmpdir):
+    index_path = str(tmpdir.join("rates.idx"))
+    ShapeShiftRates(three_records, index_path=index_path, columnar=True)
+    three_records.seek(0, io.SEEK_END)
+    three_records.add_record(entry("ETH_SALT", 1.4, 0.6, 6.3, 0.2, 0.7)).finish()
+    ShapeShiftRates(three_records, index_path=index_path)
+    assert not tmpdir.join("rates.idx.rate.npy").check()
+    three_records.seek(0)
+    rates = ShapeShiftRates(three_records, index_path=index_path, columnar=True)
+    assert rates.columns["rate"].shape == (2, 4)
+
+
+def test_columns_grow_beyond_their_preallocation(stream, monkeypatch):
+    monkeypatch.setattr(_ColumnBuilder, "CHUNK", 7)
+    for i in range(1500):
+        stream.add_record(*[entry("PAIR_{}".format(p), i + p / 100, 0.5, 6.7, 0.3, 0.9) for p in range(i % 11)])
+    stream.finish()
+    rates = ShapeShiftRates(stream, columnar=True)
+    assert rates.columns["rate"].shape == (10, 1500)
+    assert len(rates) == 1500
+    rates.seek(1499)
+    record = next(rates)
+    assert sorted(record) == ["PAIR_{}".format(p) for p in range(3)]
+    assert record["PAIR_2"] == entry("PAIR_2", 1499.02, 0.5, 6.7, 0.3, 0.9)
@@ -159,3 +159,29 @@ def test_look_ahead_only_one_symbol(symbol_a):
     with rates.lookahead():
         assert next(rates)["SYMA_CURRENCY"] == entry(1.1, 1.4, 1.0, 1.2, 2100)
     assert next(rates)["SYMA_CURRENCY"] == entry(1.1, 1.4, 1.0, 1.2, 2100)
+
+
+def test_read_columns_parses_all_rows_at_once():
+    symbol = make_symbol("SomeName", StringIO("timestamp,open,high,low,close,volume\n"
+                                              "2018-03-20 09:30:00,49.0900,49.1100,49.0700,49.1100,79426\n"
+                                              "2018-03-20 09:31:00,49.1100,49.1400,49.1000,49.1200,173824"))
+    prices, volumes = symbol.read_columns()
+    assert prices.tolist() == [[49.09, 49.11, 49.07, 49.11], [49.11, 49.14, 49.1, 49.12]]
+    assert volumes.tolist() == [79426, 173824]
+
+
+def test_read_columns_of_empty_symbol():
+    prices, volumes = make_symbol("SomeName", StringIO("timestamp,open,high,low,close,volume\n")).read_columns()
+    assert prices.shape == (0, 4) and volumes.shape == (0,)
+
+
+def test_rates_of_both_directions_are_held_as_columns(symbol_a, symbol_b):
+    with symbol_a as sa:
+        sa.add_record(entry(1.0, 2.0, 4.0, 8.0, 2100))
+        sa.add_record(entry(2.0, 2.0, 2.0, 2.0, 2200))
+    with symbol_b as sb:
+        sb.add_record(entry(2.0, 2.0, 2.0, 2.0, 4100))
+    rates = make_rates(symbol_a, symbol_b)
+    assert rates.pairs == ("SYMA_SYMB", "SYMB_SYMA")
+    assert rates.prices.tolist() == [[[0.5, 1.0, 2.0, 4.0]], [[2.0, 1.0, 0.5, 0.25]]]
+    assert rates.volumes.tolist() == [[2100], [4100]]
@@ -0,0 +1,41 @@
+import pytest
+
+from trainer.walk_forward import WalkForwardError, make_folds, warm_folds
+
+
+def test_folds_step_by_the_testing_periods_by_default():
+    assert make_folds(10, 4, 2) == [(0, 4, 6), (2, 6, 8), (4, 8, 10)]
+
+
+def test_last_fold_ends_within_the_training_range():
+    assert make_folds(11, 4, 2)[-1] == (4, 8, 10)
+
+
+def test_single_fold_when_range_fits_exactly():
+    assert make_folds(6, 4, 2) == [(0, 4, 6)]
+
+
+def test_folds_with_custom_step():
+    assert make_folds(12, 4, 2, step=3) == [(0, 4, 6), (3, 7, 9), (6, 10, 12)]
+
+
+def test_range_too_short_for_a_fold():
+    with pytest.raises(WalkForwardError):
+        make_folds(5, 4, 2)
+
+
+def test_warm_folds_train_only_on_unseen_periods():
+    assert warm_folds(make_folds(10, 4, 2)) == [(0, 4, 6), (6, 6, 8), (8, 8, 10)]
+
+
+def test_warm_folds_skip_periods_between_folds():
+    assert warm_folds(make_folds(14, 4, 2, step=4)) == [(0, 4, 6), (6, 8, 10), (10, 12, 14)]
+
+
+def test_warm_folds_train_on_the_remaining_unseen_periods():
+    assert warm_folds([(0, 4, 6), (1, 8, 10)]) == [(0, 4, 6), (6, 8, 10)]
+
+
+def test_warm_folds_reject_overlapping_testing_periods():
+    with pytest.raises(WalkForwardError):
+        warm_folds(make_folds(10, 4, 2, step=1))
@@ -1,9 +1,4 @@
 #!/bin/bash
 source $1/bin/activate
 export PYTHONPATH=~/repos/pythia
-for i in $(seq 1 $2)
-do 
-  echo "Running process $i"
-  python trainer/fpm_backtest.py
-  python trainer/back_up_best_model.py data/seed.txt data/models/fpm data/models/bkk
-done
+python trainer/fpm_seed_search.py --runs $2 --data data/recordings/poloniex/processed --backup data/models/bkk --seeds data/seed.txt
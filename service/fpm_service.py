@@ -10,6 +10,7 @@ import tensorflow as tf
 from pythia.core.agents.fpm_memory import FPMMemory
 from pythia.core.environment.fpm_environment import FpmEnvironment
 from pythia.core.fpm_runner import FpmRunner
+from pythia.core.remote.poloniex_async import AsyncPoloniexConnection
 from pythia.core.remote.poloniex_connection import PoloniexConnection
 from pythia.core.remote.telemetry import Telemetry
 from pythia.core.sessions.fpm_session import FpmSession
@@ -26,10 +27,10 @@ def _set_seed(seed):
 class FpmService(FpmRunner):
     def __init__(self, config, log_fn):
         super(FpmService, self).__init__(config, log_fn)
-        self.tf_saver = tf.train.Saver()
         self.config = config
         log_cfg = self.config["log"]
         self.telemetry = Telemetry(log_cfg["telemetry_path"], log_cfg["telemetry_limit"])
+        self.connection = None
 
     @property
     def restore_path(self):
@@ -65,7 +66,11 @@ class FpmService(FpmRunner):
         return fpm_sess
 
     def _load_time_series(self, config):
-        connection = PoloniexConnection(self.telemetry, config)
+        if config.get("concurrent_requests", False):
+            connection = AsyncPoloniexConnection(self.telemetry, config)
+        else:
+            connection = PoloniexConnection(self.telemetry, config)
+        self.connection = connection
         return FpmLiveSeries(connection, config)
 
     def _make_session_for_agent(self, agent, series):
@@ -76,6 +81,8 @@ class FpmService(FpmRunner):
 
     def _log_reward(self, reward):
         self.logger.info("Intermediate reward {:.4f}".format(reward))
+        if self.config["log"].get("profiling", False):
+            self.logger.info("Request latencies {}".format(self.connection.session.describe()))
 
     class LoadingError(FileNotFoundError):
         pass
@@ -29,7 +29,7 @@ if __name__ == '__main__':
     path = "../data/recordings/filtered/2018-02-28-shapeshift-{}_{}.json".format(COIN_A, COIN_B) if len(sys.argv) == 1 else sys.argv[0]
     with open(path) as stream, tf.Session():
         with clock_block("Initialization"):
-            rates = ShapeShiftRates(stream, preload=True)
+            rates = ShapeShiftRates(stream, index_path=path + ".idx", columnar=True)
             vis = CoinExchangeVisualizer(rates)
             env = ExchangeTradingAiEnvironment(rates, COIN_A, "10", WINDOW, {1: COIN_A, 2: COIN_B}, TotalBalanceReward())
             env.register_listener(vis.record_exchange)
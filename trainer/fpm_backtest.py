@@ -1,7 +1,9 @@
 import json
+import multiprocessing
 import os
 import random
 import time
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import pandas as pd
@@ -11,10 +13,18 @@ from tensorflow import Summary
 from pythia.core.agents.fpm_memory import FPMMemory
 from pythia.core.environment.fpm_environment import FpmEnvironment
 from pythia.core.fpm_runner import FpmRunner
+from pythia.core.sessions.fpm_metrics import MetricsRecorder
 from pythia.core.sessions.fpm_session import FpmSession
 from pythia.core.streams.fpm_time_series import FpmHistoricalSeries
 from pythia.core.streams.poloniex_history import PoloniexHistory
+from pythia.core.streams.price_cache import PriceCache
 from pythia.logger import Logger
+from trainer.walk_forward import make_folds, warm_folds
+
+
+def _run_cold_fold(config, data_directory, output_directory, fold):
+    with Logger(os.path.join(output_directory, "fold.log")) as logger:
+        return FpmBackTest(config, data_directory, logger).run_fold(fold, output_directory)
 
 
 def _set_seed(seed):
@@ -34,7 +44,6 @@ class FpmBackTest(FpmRunner):
 
         self._tf_board_writer = None
         self._last_intermediate = None
-        self._assets_log = list()
 
     @property
     def episodes(self):
@@ -52,25 +61,138 @@ class FpmBackTest(FpmRunner):
     def restore(self):
         return self.config["setup"]["restore_last_checkpoint"]
 
+    @property
+    def export_inference(self):
+        return self.config["setup"].get("export_inference", False)
+
+    @property
+    def price_cache(self):
+        return self.config["setup"].get("price_cache", False)
+
+    @property
+    def update_price_cache(self):
+        return self.config["setup"].get("update_price_cache", True)
+
+    @property
+    def walk_forward(self):
+        wf = self.config.get("walk_forward")
+        if wf is None or not wf.get("enabled", True):
+            return None
+        return wf
+
+    @property
+    def preload(self):
+        return self.config["training"].get("preload", False)
+
     def run(self, output_directory):
         if self.update_to_latest:
             self._update_to_latest()
+        if self.price_cache and self.update_price_cache:
+            self._update_price_cache()
+        if self.walk_forward is not None:
+            return self._run_walk_forward(output_directory)
 
         self._tf_board_writer = self._make_tf_board_writer(output_directory)
-        with tf.Session() as sess:
+        with tf.Session(config=self._make_session_config()) as sess:
             agent = self._make_agent(sess)
             if self.restore and tf.train.checkpoint_exists(os.path.join(output_directory, agent.model_file_name)):
                 agent.restore(output_directory)
 
             sess.run(tf.global_variables_initializer())
             r = self._run_training(agent, output_directory)
+            if self.export_inference:
+                agent.export(output_directory)
             if self.config.get("testing") is None:
                 return r
-            return self._run_testing(agent)
+            return self._run_testing(agent, output_directory)
+
+    def run_fold(self, fold, output_directory):
+        """
+        Trains a fresh agent on the training part of a walk-forward fold and tests it on the following periods.
+
+        :param fold: Tuple of training start, training end (= testing start) and testing end as period indices into
+                     the training range
+        :param output_directory: Directory for the model and logs of the fold
+        :return: Testing reward of the fold
+        """
+        train_start, train_end, test_end = fold
+        history = self._load_time_series(self.config["training"])
+        self._tf_board_writer = self._make_tf_board_writer(output_directory)
+        with tf.Session(config=self._make_session_config()) as sess:
+            agent = self._make_agent(sess)
+            sess.run(tf.global_variables_initializer())
+            self._train_on(agent, history.slice(train_start, train_end), output_directory)
+            return self._test_on(agent, history.slice(train_end, test_end), output_directory)
+
+    def _run_walk_forward(self, output_directory):
+        history = self._load_time_series(self.config["training"])
+        folds = make_folds(len(history), self.walk_forward["train"], self.walk_forward["test"],
+                           self.walk_forward.get("step"))
+        self.logger.info("Walk-forward over {} periods in {} folds".format(len(history), len(folds)))
+        if self.walk_forward.get("warm_start", True):
+            rewards = self._run_warm_folds(history, folds, output_directory)
+        else:
+            rewards = self._run_cold_folds(folds, output_directory)
+
+        self._write_fold_table(folds, rewards, output_directory)
+        cash = self.config["trading"]["cash_amount"]
+        total = cash * np.prod([r / cash for r in rewards])
+        self.logger.info("Finished walk-forward with compounded reward of {}".format(total))
+        return total
+
+    def _run_warm_folds(self, history, folds, output_directory):
+        rewards = []
+        self._tf_board_writer = self._make_tf_board_writer(output_directory)
+        with tf.Session(config=self._make_session_config()) as sess:
+            agent = self._make_agent(sess)
+            sess.run(tf.global_variables_initializer())
+            for i, (first_new, train_end, test_end) in enumerate(warm_folds(folds)):
+                fold_directory = self._make_fold_directory(output_directory, i)
+                if first_new < train_end:
+                    self._train_on(agent, history.slice(first_new, train_end), output_directory, fold_directory)
+                rewards.append(self._test_on(agent, history.slice(train_end, test_end), fold_directory))
+                agent.save(output_directory)
+                self.logger.info("Fold {} tested periods {}-{} with reward {}".format(i, train_end, test_end,
+                                                                                     rewards[-1]))
+        return rewards
+
+    def _run_cold_folds(self, folds, output_directory):
+        workers = self.walk_forward.get("workers", os.cpu_count())
+        with ProcessPoolExecutor(workers) as executor:
+            futures = [executor.submit(_run_cold_fold, self._cold_fold_config(), self.data_directory,
+                                       self._make_fold_directory(output_directory, i), fold)
+                       for i, fold in enumerate(folds)]
+            return [f.result() for f in futures]
+
+    def _cold_fold_config(self):
+        config = dict(self.config)
+        setup = self.config["setup"]
+        config["setup"] = dict(setup, update_to_latest=False, fixed_seed=self.seed,
+                               intra_op_threads=setup.get("intra_op_threads", 1),
+                               inter_op_threads=setup.get("inter_op_threads", 1))
+        return config
+
+    @staticmethod
+    def _make_fold_directory(output_directory, index):
+        path = os.path.join(output_directory, "fold_{}".format(index))
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @staticmethod
+    def _write_fold_table(folds, rewards, output_directory):
+        with open(os.path.join(output_directory, "walk_forward.csv"), "w") as f:
+            f.write("fold,train_start,train_end,test_end,reward\n")
+            for i, ((train_start, train_end, test_end), r) in enumerate(zip(folds, rewards)):
+                f.write("{},{},{},{},{}\n".format(i, train_start, train_end, test_end, r))
 
     def _get_memory(self):
         return FPMMemory(self.config)
 
+    def _make_session_config(self):
+        setup = self.config["setup"]
+        return tf.ConfigProto(intra_op_parallelism_threads=setup.get("intra_op_threads", 0),
+                              inter_op_parallelism_threads=setup.get("inter_op_threads", 0))
+
     @staticmethod
     def _make_tf_board_writer(out_dir):
         return tf.summary.FileWriter(os.path.join(out_dir, "log"))
@@ -80,8 +202,23 @@ class FpmBackTest(FpmRunner):
         h = PoloniexHistory(self.config, self.data_directory)
         h.update()
 
+    def _make_price_cache(self):
+        return PriceCache(self.data_directory, self.cash, self.coins)
+
+    def _update_price_cache(self):
+        converted = self._make_price_cache().update()
+        if len(converted) > 0:
+            self.logger.info("Converted recordings into price cache: {}".format(", ".join(converted)))
+
     def _run_training(self, agent, output_directory):
-        fpm_sess = self._make_session(self.config["training"], agent)
+        return self._train_on(agent, self._load_time_series(self.config["training"]), output_directory)
+
+    def _train_on(self, agent, series, output_directory, metrics_directory=None):
+        if self.preload:
+            return self._run_preloaded_training(agent, series, output_directory)
+
+        recorder = self._make_recorder(metrics_directory or output_directory, "training")
+        fpm_sess = self._make_session_for_agent(agent, series, recorder)
         reward = 0
         for i in range(self.episodes):
             reward = fpm_sess.run()
@@ -89,18 +226,38 @@ class FpmBackTest(FpmRunner):
             self.logger.info("Last reward of episode {}: {:.4f}".format(i, reward))
             self._log_reward(reward)
             self._tf_board_writer.flush()
-            if self.config["setup"]["record_assets"]:
-                np.save(os.path.join(output_directory, "assets.gz"))
+            if recorder is not None:
+                recorder.flush()
 
         self.logger.info("Finished training with final reward of {}".format(reward))
         return reward
 
-    def _make_session(self, series_cfg, agent):
-        series = self._load_time_series(series_cfg)
-        fpm_sess = self._make_session_for_agent(agent, series)
-        return fpm_sess
+    def _run_preloaded_training(self, agent, series, output_directory):
+        if self.config["setup"]["record_assets"]:
+            self.logger.info("Recording assets is not supported for preloaded training and is skipped")
+        prices = series.prices
+        self.logger.info("Preloading {} training periods into agent memory".format(len(prices)))
+        agent.preload(prices)
+        steps = self.config["training"].get("preload_steps", len(prices))
+        for i in range(self.episodes):
+            agent.pretrain(steps)
+            agent.save(output_directory)
+            self.logger.info("Finished offline training episode {} with {} steps".format(i, steps))
+            self._tf_board_writer.flush()
+
+        reward = self._make_session_for_agent(agent, series).run()
+        self._log_reward(reward)
+        self._tf_board_writer.flush()
+        self.logger.info("Finished offline training with an evaluation reward of {}".format(reward))
+        return reward
 
     def _load_time_series(self, config):
+        if self.price_cache:
+            _, prices = self._make_price_cache().select(config["start"], config.get("end", None))
+            return FpmHistoricalSeries.from_prices(prices)
+        return FpmHistoricalSeries(*self._load_data_frames(config))
+
+    def _load_data_frames(self, config):
         data_frames = []
         for coin in self.coins:
             with open(os.path.join(self.data_directory, "{}_{}.csv".format(self.cash, coin))) as r:
@@ -108,18 +265,28 @@ class FpmBackTest(FpmRunner):
                 df.index = pd.to_datetime(df.index, unit='s')
                 data_frames.append(df[config["start"]:config.get("end", None)])
 
-        return FpmHistoricalSeries(*data_frames)
+        return data_frames
+
+    def _make_recorder(self, output_directory, name):
+        if not self.config["setup"]["record_assets"]:
+            return None
+        return MetricsRecorder(os.path.join(output_directory, "metrics", name))
 
-    def _make_session_for_agent(self, agent, series):
+    def _make_session_for_agent(self, agent, series, recorder=None):
         env = FpmEnvironment(series, self.config)
-        recorder = self._record_assets if self.config["setup"]["record_assets"] else None
         s = FpmSession(env, agent, self._log_reward, recorder)
         s.log_interval = 1000
         return s
 
-    def _run_testing(self, agent):
-        fpm_sess = self._make_session(self.config["testing"], agent)
+    def _run_testing(self, agent, output_directory):
+        return self._test_on(agent, self._load_time_series(self.config["testing"]), output_directory)
+
+    def _test_on(self, agent, series, output_directory):
+        recorder = self._make_recorder(output_directory, "testing")
+        fpm_sess = self._make_session_for_agent(agent, series, recorder)
         reward = fpm_sess.run()
+        if recorder is not None:
+            recorder.flush()
         self._log_reward(reward)
         self._tf_board_writer.flush()
         self.logger.info("Finished testing with final reward of {}".format(reward))
@@ -139,11 +306,9 @@ class FpmBackTest(FpmRunner):
             self.logger.info("Intermediate calculations took {:.4f}".format(delta))
         self._last_intermediate = now
 
-    def _record_assets(self, env):
-        self._assets_log.append(np.array(env.assets))
-
 
 if __name__ == '__main__':
+    multiprocessing.set_start_method("spawn")
     with open(os.path.join(os.path.dirname(os.path.realpath(__file__)), "fpm_default.json"), "r") as f:
         cfg = json.load(f)
 
@@ -0,0 +1,178 @@
+import argparse
+import copy
+import json
+import multiprocessing
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+
+import numpy as np
+
+from pythia.core.streams.price_cache import PriceCache
+from pythia.logger import Logger
+
+THREAD_VARIABLES = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"]
+
+
+def run_backtest(config, data_directory, output_directory):
+    from trainer.fpm_backtest import FpmBackTest
+    with Logger(os.path.join(output_directory, "backtest.log")) as logger:
+        return FpmBackTest(config, data_directory, logger).run(output_directory)
+
+
+@contextmanager
+def _limited_threads(threads):
+    previous = {v: os.environ.get(v) for v in THREAD_VARIABLES}
+    os.environ.update({v: str(threads) for v in THREAD_VARIABLES})
+    try:
+        yield
+    finally:
+        for v, value in previous.items():
+            if value is None:
+                os.environ.pop(v, None)
+            else:
+                os.environ[v] = value
+
+
+class SeedSearch:
+    """
+    Runs one back test per seed in parallel worker processes and keeps only the model with the best reward.
+    All workers map the same price cache, so the recordings are parsed once for the whole search.
+
+    :param config: Back test configuration
+    :param data_directory: Directory of the Poloniex recordings
+    :param backup_directory: Directory the best model is moved to as {reward}_{seed}
+    :param seed_file: Table of seed,reward lines shared with previous searches
+    :param logger: Logger of the search
+    :param workers: Number of worker processes, defaults to one per core
+    :param threads_per_worker: Thread limit of TensorFlow and the BLAS libraries inside every worker
+    :param run_fn: Function running a single back test, has to be picklable
+    """
+    WORK_DIRECTORY = ".search"
+
+    def __init__(self, config, data_directory, backup_directory, seed_file, logger, workers=None,
+                 threads_per_worker=1, run_fn=run_backtest):
+        self.config = config
+        self.data_directory = data_directory
+        self.backup_directory = backup_directory
+        self.seed_file = seed_file
+        self.logger = logger
+        self.workers = workers or os.cpu_count()
+        self.threads_per_worker = threads_per_worker
+        self.run_fn = run_fn
+        self._kept = None
+
+    @property
+    def work_directory(self):
+        return os.path.join(self.backup_directory, self.WORK_DIRECTORY)
+
+    @staticmethod
+    def draw_seeds(count):
+        return [int(s) for s in np.random.randint(2 ** 32 - 1, size=count, dtype=np.int64)]
+
+    def run(self, seeds):
+        self._prepare_price_cache()
+        os.makedirs(self.work_directory, exist_ok=True)
+        best = self._read_best_reward()
+        results = []
+        with _limited_threads(self.threads_per_worker), ProcessPoolExecutor(self.workers) as executor:
+            futures = {executor.submit(self.run_fn, self._config_for(s), self.data_directory,
+                                       self._make_run_directory(s)): s for s in seeds}
+            for f in as_completed(futures):
+                seed = futures[f]
+                try:
+                    reward = f.result()
+                except Exception as e:
+                    self.logger.error("Back test with seed {} failed: {}".format(seed, e))
+                    self._discard(seed)
+                    continue
+
+                self.logger.info("Seed {} finished with reward {}".format(seed, reward))
+                results.append((seed, reward))
+                self._record(seed, reward)
+                if reward is not None and reward > best:
+                    best = reward
+                    self._keep(seed, reward)
+                else:
+                    self._discard(seed)
+
+        return results
+
+    def _prepare_price_cache(self):
+        trading = self.config["trading"]
+        converted = PriceCache(self.data_directory, trading["cash"], trading["coins"]).update()
+        if len(converted) > 0:
+            self.logger.info("Converted recordings into price cache: {}".format(", ".join(converted)))
+
+    def _config_for(self, seed):
+        config = copy.deepcopy(self.config)
+        setup = config["setup"]
+        setup["fixed_seed"] = seed
+        setup["update_to_latest"] = False
+        setup["price_cache"] = True
+        setup["update_price_cache"] = False
+        setup["intra_op_threads"] = self.threads_per_worker
+        setup["inter_op_threads"] = 1
+        return config
+
+    def _run_directory(self, seed):
+        return os.path.join(self.work_directory, str(seed))
+
+    def _make_run_directory(self, seed):
+        path = self._run_directory(seed)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _read_best_reward(self):
+        best = float("-inf")
+        if not os.path.exists(self.seed_file):
+            return best
+        with open(self.seed_file, 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                seed, reward = line.strip().split(',')
+                if reward != "None":
+                    best = max(best, float(reward))
+        return best
+
+    def _record(self, seed, reward):
+        with open(self.seed_file, 'a+') as f:
+            f.write("{},{}\n".format(seed, reward))
+
+    def _keep(self, seed, reward):
+        target = os.path.join(self.backup_directory, "{:.4f}_{}".format(reward, seed))
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        os.rename(self._run_directory(seed), target)
+        self.logger.info("Backed up new best model {}".format(target))
+        if self._kept is not None:
+            shutil.rmtree(self._kept, ignore_errors=True)
+        self._kept = target
+
+    def _discard(self, seed):
+        shutil.rmtree(self._run_directory(seed), ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Searches seeds for the FPM back test in parallel processes and "
+                                                 "backs up the model with the highest reward")
+    parser.add_argument("--runs", type=int, default=32, help="Number of seeds to try")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--threads", type=int, default=1, help="Threads per worker process")
+    parser.add_argument("--config", default=os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                                         "fpm_default.json"), help="Back test configuration")
+    parser.add_argument("--data", default="data/recordings/poloniex/processed", help="Directory of the recordings")
+    parser.add_argument("--backup", default="data/models/bkk", help="Directory to backup the best model to")
+    parser.add_argument("--seeds", default="data/seed.txt", help="File with all seeds and rewards")
+    args = parser.parse_args()
+    multiprocessing.set_start_method("spawn")
+
+    with open(args.config, "r") as f:
+        cfg = json.load(f)
+
+    with Logger() as log:
+        search = SeedSearch(cfg, args.data, args.backup, args.seeds, log, args.workers, args.threads)
+        for s, r in search.run(search.draw_seeds(args.runs)):
+            log.info("[RESULT] {},{}".format(s, r))
@@ -0,0 +1,40 @@
+class WalkForwardError(ValueError):
+    pass
+
+
+def make_folds(periods, train, test, step=None):
+    """
+    Slides a window of train + test periods over the training range.
+
+    :param periods: Number of periods in the training range
+    :param train: Training periods of every fold
+    :param test: Testing periods of every fold
+    :param step: Periods between the start of two folds, defaults to the testing periods
+    :return: List of training start, training end (= testing start) and testing end of every fold
+    """
+    step = step or test
+    folds = [(s, s + train, s + train + test) for s in range(0, periods - train - test + 1, step)]
+    if len(folds) == 0:
+        raise WalkForwardError("Training range of {} periods is too short for a fold of {} training and {} testing "
+                               "periods".format(periods, train, test))
+    return folds
+
+
+def warm_folds(folds):
+    """
+    Restricts the training of every fold to the periods a continuously trained agent has not seen yet. The tested
+    periods of a fold already are in the agent's memory, so they are not trained on again in the following folds.
+
+    :param folds: Folds as returned by make_folds
+    :return: List of first unseen training period, training end and testing end of every fold. Folds without unseen
+             training periods start at their training end.
+    """
+    recorded = 0
+    schedule = []
+    for train_start, train_end, test_end in folds:
+        if train_end < recorded:
+            raise WalkForwardError("Testing periods {}-{} overlap with the previous fold, a warm start needs a step of "
+                                   "at least the testing periods".format(train_end, recorded))
+        schedule.append((max(recorded, train_start), train_end, test_end))
+        recorded = test_end
+    return schedule